@@ -0,0 +1,304 @@
+import collections
+import concurrent.futures
+import os
+import threading
+import time
+
+import main as chatbot
+import threaded_responder
+from tracing import TRACER
+
+# Requests per second each session may send, and how many it may send at once after being idle
+DEFAULT_SESSION_RATE = 5.0
+DEFAULT_SESSION_BURST = 10
+
+# Requests waiting for a worker; further ones are degraded instead of queued
+DEFAULT_MAX_QUEUE = 64
+
+# Seconds a request may take before it gets the canned reply instead
+DEFAULT_DEADLINE = 1.0
+
+# Sessions whose token buckets are kept; dropping the least recently seen one only forgives it
+MAX_BUCKETS = 100000
+
+# Weight of the newest sample in the moving average of service time
+SERVICE_TIME_WEIGHT = 0.1
+
+
+class RequestRejected(ValueError):
+    """A session sent requests faster than its rate limit allows"""
+
+
+class TokenBucket:
+    """Holds up to burst tokens, refilled at rate tokens per second; each request takes one"""
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst, now):
+        """
+        :param rate: Tokens added per second
+        :param burst: Most tokens held, the bucket starts full
+        :param now: Current time of the clock passed to take()
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+
+    def take(self, now):
+        """
+        :param now: Current time
+        :return: Whether a token was available
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class AdmissionController:
+    """
+    Admission control and load shedding in front of main.stream_response
+
+    Requests are answered by a bounded pool of workers. Under overload, work
+    is shed rather than queued: a request that matches no intent gets the
+    canned auto_unknown reply instead of the fallback, so knowledge answers,
+    FAQ retrieval, complexity analysis and coaching are skipped (see
+    main.ResponseStream.shed_fallback). That happens in three cases:
+
+    - the queue is full;
+    - the expected wait (requests ahead of it times the average service time)
+      would overrun its deadline;
+    - its deadline has passed by the time a worker picks it up.
+
+    Intent replies are cheap and are always answered in full. A request that
+    is already running isn't interrupted.
+
+    Requests from a session that exceeds its token bucket are rejected with
+    RequestRejected before any work is done. Requests without a session
+    aren't rate limited.
+
+    Every request ends up in exactly one of the admitted, degraded and
+    rejected counters. Replies follow main.get_response, seeds included, and
+    the serving tenant (see tenant_context) is kept on the worker threads.
+    """
+
+    def __init__(self, workers=None, max_queue=DEFAULT_MAX_QUEUE, deadline=DEFAULT_DEADLINE,
+                 session_rate=DEFAULT_SESSION_RATE, session_burst=DEFAULT_SESSION_BURST, clock=time.monotonic,
+                 warmup=True):
+        """
+        :param workers: Threads answering requests, os.cpu_count() by default
+        :param max_queue: Requests that may wait for a worker
+        :param deadline: Default seconds a request may take, see submit()
+        :param session_rate: Requests per second per session, None to disable rate limiting
+        :param session_burst: Requests a session may send at once after being idle
+        :param clock: Monotonic time source
+        :param warmup: Whether to run threaded_responder.warm_up() first, so the first requests don't pay for
+            building indexes and their service time doesn't skew the deadline estimate
+        :raises ValueError: If a limit is not positive
+        """
+        if max_queue < 0 or deadline <= 0:
+            raise ValueError("max_queue must not be negative and deadline must be positive")
+        if session_rate is not None and (session_rate <= 0 or session_burst < 1):
+            raise ValueError("session_rate must be positive and session_burst at least 1")
+
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self.session_rate = session_rate
+        self.session_burst = session_burst
+        self.clock = clock
+        if warmup:
+            threaded_responder.warm_up()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+        self._buckets = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # Requests queued or running
+        self.pending = 0
+        # Moving average of service time in seconds, None until the first request finishes
+        self.service_time = None
+        self.admitted = 0
+        self.degraded = 0
+        self.rejected = 0
+        self.shed = collections.Counter()
+
+    def _take_token(self, session_id, now):
+        with self._lock:
+            bucket = self._buckets.get(session_id)
+            if bucket is None:
+                bucket = self._buckets[session_id] = TokenBucket(self.session_rate, self.session_burst, now)
+                if len(self._buckets) > MAX_BUCKETS:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(session_id)
+            return bucket.take(now)
+
+    def check_rate(self, session_id):
+        """
+        Take a token from the session's bucket
+
+        :param session_id: Session sending a request, None isn't rate limited
+        :raises RequestRejected: If the session is over its rate limit
+        """
+        if session_id is None or self.session_rate is None or self._take_token(session_id, self.clock()):
+            return
+        with self._lock:
+            self.rejected += 1
+        TRACER.count('rejected')
+        raise RequestRejected(f"Session {session_id!r} is over its rate limit")
+
+    def _reserve(self, now, deadline):
+        with self._lock:
+            if self.pending >= self.workers + self.max_queue:
+                return 'queue_full'
+            if self.service_time is not None and now + self.service_time * (self.pending // self.workers + 1) > deadline:
+                return 'deadline'
+            self.pending += 1
+            return None
+
+    def submit(self, user_input, session_id=None, seed=None, deadline=None):
+        """
+        :param user_input: Raw user input
+        :param session_id: Optional session whose context in main.SESSIONS is updated and whose rate is limited
+        :param seed: Optional replay seed, see main.stream_response
+        :param deadline: Seconds the request may take, the controller's deadline if None
+        :return: concurrent.futures.Future of the response text
+        :raises RequestRejected: If the session is over its rate limit
+        """
+        self.check_rate(session_id)
+        now = self.clock()
+        deadline = now + (self.deadline if deadline is None else deadline)
+        # Created here so it serves the caller's tenant on the worker thread
+        stream = chatbot.stream_response(user_input, session_id, seed)
+        reason = self._reserve(now, deadline)
+        if reason is None:
+            return self.executor.submit(lambda: ''.join(self._run(stream, deadline)))
+        future = concurrent.futures.Future()
+        future.set_result(''.join(self._degrade(reason, stream)))
+        return future
+
+    def admit(self, stream, deadline=None):
+        """
+        Decide how a stream is answered; the rate limit is checked separately, see check_rate()
+
+        Intent replies are answered right away. A fallback either gets a
+        worker or is shed to the canned reply.
+
+        :param stream: main.ResponseStream whose first chunk hasn't been read
+        :param deadline: Seconds the request may take, the controller's deadline if None
+        :return: Tuple of an iterator of the response chunks and whether it must be consumed on self.executor
+        """
+        now = self.clock()
+        stream.match()
+        if not stream.fallback:
+            with self._lock:
+                self.admitted += 1
+            return stream, False
+        deadline = now + (self.deadline if deadline is None else deadline)
+        reason = self._reserve(now, deadline)
+        if reason is not None:
+            return self._degrade(reason, stream), False
+        return self._run(stream, deadline), True
+
+    def _run(self, stream, deadline):
+        return _Admitted(self, stream, deadline)
+
+    def _degrade(self, reason, stream):
+        stream.shed_fallback()
+        stream.match()
+        with self._lock:
+            if stream.fallback:
+                self.degraded += 1
+                self.shed[reason] += 1
+            else:
+                self.admitted += 1
+        if stream.fallback:
+            TRACER.count('degraded')
+        return stream
+
+    def get_response(self, user_input, session_id=None, seed=None, deadline=None):
+        """
+        :param user_input: Raw user input
+        :param session_id: Optional session whose context in main.SESSIONS is updated and whose rate is limited
+        :param seed: Optional replay seed, see main.stream_response
+        :param deadline: Seconds the request may take, the controller's deadline if None
+        :return: Response text
+        :raises RequestRejected: If the session is over its rate limit
+        """
+        return self.submit(user_input, session_id, seed, deadline).result()
+
+    def stats(self):
+        """
+        :return: Dict of admitted, degraded and rejected counts, shedding reasons and queue state
+        """
+        with self._lock:
+            return {
+                'admitted': self.admitted,
+                'degraded': self.degraded,
+                'rejected': self.rejected,
+                'shed': dict(self.shed),
+                'pending': self.pending,
+                'workers': self.workers,
+                'max_queue': self.max_queue,
+                'deadline_ms': self.deadline * 1000,
+                'service_time_ms': self.service_time * 1000 if self.service_time is not None else None,
+                'rate_limited_sessions': len(self._buckets)
+            }
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+class _Admitted:
+    """Chunks of a stream that holds a worker slot, released when the stream is exhausted or closed"""
+
+    def __init__(self, controller, stream, deadline):
+        self.controller = controller
+        self.stream = stream
+        self.deadline = deadline
+        self._start = None
+        self._released = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        controller = self.controller
+        if self._start is None:
+            self._start = controller.clock()
+            if self._start > self.deadline:
+                self.stream = controller._degrade('expired', self.stream)
+            else:
+                with controller._lock:
+                    controller.admitted += 1
+        try:
+            return next(self.stream)
+        except StopIteration:
+            if not self.stream.shed:
+                elapsed = controller.clock() - self._start
+                with controller._lock:
+                    if controller.service_time is None:
+                        controller.service_time = elapsed
+                    else:
+                        controller.service_time += SERVICE_TIME_WEIGHT * (elapsed - controller.service_time)
+            self.close()
+            raise
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        self.stream.close()
+        with self.controller._lock:
+            self.controller.pending -= 1
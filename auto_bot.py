@@ -1,9 +1,16 @@
-import re
-import random
+import sys
+
+import request_rng
+from keyword_automaton import KeywordAutomaton
+from tokenizer import WORD_PATTERN
 
 class AutoDealershipBot:
-    def __init__(self):
-        self.knowledge_base = {
+    def __init__(self, knowledge_base=None, response_templates=None):
+        """
+        :param knowledge_base: Replacement for the built-in knowledge base, e.g. from a knowledge file
+        :param response_templates: Replacement for the built-in greeting/farewell templates
+        """
+        self.knowledge_base = knowledge_base or {
             'vehicle_types': {
                 'sedan': ['comfortable', 'fuel-efficient', 'family-friendly'],
                 'suv': ['spacious', 'versatile', 'good for families'],
@@ -25,7 +32,7 @@ class AutoDealershipBot:
             ]
         }
         
-        self.response_templates = {
+        self.response_templates = response_templates or {
             'greeting': [
                 "Welcome to our Auto Dealership Assistant! How can I help you find your perfect vehicle?",
                 "Hello! Ready to explore our vehicle lineup? What are you looking for?"
@@ -35,11 +42,39 @@ class AutoDealershipBot:
                 "Thank you for choosing our dealership. Your dream car awaits!"
             ]
         }
+        
+        self.topic_keywords = {
+            'greeting': ['hello', 'hi', 'hey'],
+            'farewell': ['bye', 'goodbye', 'later'],
+            'buying_process': ['buy', 'purchase', 'process'],
+            'negotiation': ['negotiate', 'price', 'deal']
+        }
+        
+        # Topics in the order generate_response checks them, detected in one pass
+        topics = [(topic, self.topic_keywords[topic]) for topic in ('greeting', 'farewell')]
+        topics.extend((vehicle, [vehicle]) for vehicle in self.knowledge_base['vehicle_types'])
+        topics.extend((topic, self.topic_keywords[topic]) for topic in ('buying_process', 'negotiation'))
+        self.topics = KeywordAutomaton(topics)
+        
+        # Replies that only depend on the knowledge base, rendered once; vehicle types are checked first
+        self.static_replies = {
+            'buying_process': sys.intern("Buying Process Steps:\n" + "\n".join(
+                f"{i+1}. {step}" for i, step in enumerate(self.knowledge_base['buying_process'])
+            )),
+            'negotiation': sys.intern("Negotiation Tips:\n" + "\n".join(
+                f"- {tip}" for tip in self.knowledge_base['negotiation_tips']
+            ))
+        }
+        self.static_replies.update(
+            (topic, sys.intern(f"Looking for a {topic}? They are known for being {', '.join(attributes)}."))
+            for topic, attributes in self.knowledge_base['vehicle_types'].items()
+        )
 
     def calculate_text_complexity(self, text):
         """Simple text complexity calculation"""
-        word_count = len(re.findall(r'\w+', text.lower()))
-        unique_words = len(set(re.findall(r'\w+', text.lower())))
+        words = WORD_PATTERN.findall(text.lower())
+        word_count = len(words)
+        unique_words = len(set(words))
         
         complexity = (
             0.5 * (word_count / 20) +  # Word count impact
@@ -52,26 +87,19 @@ class AutoDealershipBot:
         """Generate contextual responses based on query"""
         query = query.lower()
         
+        topic = self.topics.best_topic(query)
+        
         # Greeting
-        if any(word in query for word in ['hello', 'hi', 'hey']):
-            return random.choice(self.response_templates['greeting'])
+        if topic == 'greeting':
+            return request_rng.choice(self.response_templates['greeting'])
         
         # Farewell
-        if any(word in query for word in ['bye', 'goodbye', 'later']):
-            return random.choice(self.response_templates['farewell'])
-        
-        # Vehicle Type Queries
-        for vehicle, attributes in self.knowledge_base['vehicle_types'].items():
-            if vehicle in query:
-                return f"Looking for a {vehicle}? They are known for being {', '.join(attributes)}."
-        
-        # Buying Process
-        if any(word in query for word in ['buy', 'purchase', 'process']):
-            return "Buying Process Steps:\n" + "\n".join(f"{i+1}. {step}" for i, step in enumerate(self.knowledge_base['buying_process']))
+        if topic == 'farewell':
+            return request_rng.choice(self.response_templates['farewell'])
         
-        # Negotiation Tips
-        if any(word in query for word in ['negotiate', 'price', 'deal']):
-            return "Negotiation Tips:\n" + "\n".join(f"- {tip}" for tip in self.knowledge_base['negotiation_tips'])
+        # Vehicle type queries, buying process steps and negotiation tips
+        if topic in self.static_replies:
+            return self.static_replies[topic]
         
         # Complexity-based response for complex queries
         complexity = self.calculate_text_complexity(query)
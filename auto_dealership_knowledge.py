@@ -1,3 +1,22 @@
+import collections
+import re
+import sys
+
+import quote_engine
+import tenant_context
+from keyword_automaton import KeywordAutomaton
+
+# Replies that depend only on a knowledge class's constants, rendered once per class
+KnowledgeBlocks = collections.namedtuple('KnowledgeBlocks', [
+    'vehicle_replies',
+    'buying_process_chunks',
+    'buying_process_guide',
+    'financing_chunks',
+    'financing_options',
+    'maintenance',
+    'negotiation'
+])
+
 class AutoDealershipKnowledge:
     VEHICLE_TYPES = {
         'sedan': ['comfortable', 'fuel-efficient', 'family-friendly'],
@@ -49,13 +68,49 @@ class AutoDealershipKnowledge:
         ]
     }
 
+    # Keyword lists per topic, in the order generate_auto_response checks them
+    TOPIC_KEYWORDS = {
+        'process': ['buy', 'purchase', 'process'],
+        'financing': ['finance', 'loan', 'payment'],
+        'maintenance': ['maintain', 'service', 'repair'],
+        'negotiation': ['negotiate', 'price', 'deal']
+    }
+
+    # Financing terms explain_financing quotes; see quote_engine for their shape
+    RATE_TIERS = quote_engine.RATE_TIERS
+    LOAN_TERMS = quote_engine.LOAN_TERMS
+    LEASE_RESIDUALS = quote_engine.LEASE_RESIDUALS
+    DOWN_PAYMENTS = quote_engine.DOWN_PAYMENTS
+
+    # Budgets up to this many dollars are monthly payments, larger ones vehicle prices
+    MONTHLY_BUDGET_LIMIT = 2500
+
+    # Credit tier of the in-stock examples when the customer's is unknown
+    DEFAULT_CREDIT_TIER = 'good'
+
+    # vehicle_inventory.VehicleInventory that get_vehicle_recommendations searches, if any
+    INVENTORY = None
+
+    # Preference keys passed straight through to VehicleInventory.query
+    INVENTORY_FILTERS = ('makes', 'min_price', 'max_price', 'min_year', 'max_year', 'max_mileage', 'min_mpg',
+                         'order_by', 'limit')
+    
+    # KnowledgeBlocks of the class named by _rendered_owner, see rendered_blocks
+    _rendered_blocks = None
+    _rendered_owner = None
+
     @classmethod
     def get_vehicle_recommendations(cls, preferences):
         """
         Provide vehicle recommendations based on user preferences
         
+        Without an INVENTORY this names the vehicle types that suit the
+        preference flags. With one, those types (plus any listed under
+        'vehicle_types') and the INVENTORY_FILTERS keys select concrete
+        vehicles; 'budget' stands in for 'max_price'.
+        
         :param preferences: Dict of user preferences
-        :return: List of recommended vehicle types
+        :return: List of recommended vehicle types, or of vehicle_inventory.Vehicle best match first
         """
         recommendations = []
         
@@ -68,25 +123,123 @@ class AutoDealershipKnowledge:
         if preferences.get('eco_conscious'):
             recommendations.extend(['electric', 'hybrid'])
         
-        return list(set(recommendations))
+        if cls.INVENTORY is None:
+            return list(set(recommendations))
+        
+        recommendations.extend(preferences.get('vehicle_types', ()))
+        filters = {name: preferences[name] for name in cls.INVENTORY_FILTERS if preferences.get(name) is not None}
+        if 'max_price' not in filters and preferences.get('budget') is not None:
+            filters['max_price'] = preferences['budget']
+        return cls.INVENTORY.query(vehicle_types=recommendations or None, **filters)
 
     @classmethod
-    def explain_financing(cls, budget=None):
+    def financing_engine(cls, credit_tier=None):
         """
-        Provide financing explanation
+        Quote engine for these financing terms, shared by every call with the same terms
+        
+        :param credit_tier: Only quote this tier's APR, every tier if None
+        :return: quote_engine.QuoteEngine
+        """
+        tiers = tuple(tuple(pair) for pair in cls.RATE_TIERS if credit_tier is None or pair[0] == credit_tier)
+        if not tiers:
+            raise ValueError(f"Unknown credit tier '{credit_tier}'")
+        residuals = tuple(tuple(pair) for pair in cls.LEASE_RESIDUALS)
+        return quote_engine.engine_for(tiers, tuple(cls.LOAN_TERMS), residuals, tuple(cls.DOWN_PAYMENTS))
+
+    @classmethod
+    def stream_financing(cls, budget=None, credit_tier=None):
+        """
+        Produce the financing explanation line by line
+        
+        A budget up to MONTHLY_BUDGET_LIMIT is read as a monthly payment and
+        answered with the most vehicle it covers per credit tier, plus the
+        best in-stock matches when an INVENTORY is installed. A larger budget
+        is read as a vehicle price and answered with its monthly payments
+        across terms.
         
         :param budget: Optional budget to tailor advice
-        :return: Financing explanation
+        :param credit_tier: Customer's credit tier, one of RATE_TIERS; every tier is quoted if None
+        :return: Generator of explanation chunks
         """
-        explanation = "Financing Options:\n"
-        for option in cls.FINANCING_OPTIONS:
-            explanation += f"- {option}\n"
+        yield from cls.rendered_blocks().financing_chunks
         
         if budget:
-            explanation += f"\nConsidering your budget of ${budget}, here are some tailored suggestions:\n"
-            # Add budget-specific advice
+            yield f"\nConsidering your budget of ${budget}, here are some tailored suggestions:\n"
+            if budget <= cls.MONTHLY_BUDGET_LIMIT:
+                yield from cls._stream_monthly_quotes(budget, credit_tier)
+            else:
+                yield from cls._stream_price_quotes(budget, credit_tier)
+
+    @classmethod
+    def _stream_monthly_quotes(cls, budget, credit_tier):
+        for tier, apr in cls.RATE_TIERS:
+            if credit_tier is not None and tier != credit_tier:
+                continue
+            engine = cls.financing_engine(tier)
+            best = {}
+            for scenario, price in zip(engine.scenarios, engine.max_prices(budget)):
+                if price > best.get(scenario.kind, (0, None))[0]:
+                    best[scenario.kind] = (price, scenario)
+            line = f"- {tier.capitalize()} credit ({apr}% APR):"
+            if 'loan' in best:
+                price, scenario = best['loan']
+                line += (f" vehicles up to ${price:,.0f} financed over {scenario.months} months"
+                         f" with ${scenario.down_payment:,} down")
+            if 'lease' in best:
+                price, scenario = best['lease']
+                line += f"{', or' if 'loan' in best else ''} up to ${price:,.0f} leased for {scenario.months} months"
+            yield line + "\n"
+        
+        if cls.INVENTORY is not None and len(cls.INVENTORY):
+            engine = cls.financing_engine(credit_tier or cls.DEFAULT_CREDIT_TIER)
+            quotes = engine.best_quotes(cls.INVENTORY.columns['price'], budget, limit=3,
+                                        order=cls.INVENTORY.sorted_rows('price'))
+            if quotes:
+                yield f"In stock within ${budget}/month:\n"
+            for quote in quotes:
+                vehicle = cls.INVENTORY.vehicle(quote.row)
+                scenario = quote.scenario
+                yield (f"- {vehicle.year} {vehicle.make.title()} {vehicle.model.title()} at ${vehicle.price:,}: "
+                       f"${quote.monthly_payment:,.0f}/month ({scenario.months}-month {scenario.kind} "
+                       f"at {scenario.apr}% APR, ${scenario.down_payment:,} down)\n")
+
+    @classmethod
+    def _stream_price_quotes(cls, budget, credit_tier):
+        engine = cls.financing_engine(credit_tier)
+        down_payment = min(cls.DOWN_PAYMENTS)
+        by_tier = {}
+        for number, scenario in enumerate(engine.scenarios):
+            if scenario.down_payment == down_payment:
+                by_tier.setdefault((scenario.tier, scenario.apr), []).append(engine.quote(budget, number))
+        for (tier, apr), quotes in by_tier.items():
+            terms = ', '.join(
+                f"${quote.monthly_payment:,.0f} for {quote.scenario.months} months"
+                + (" leased" if quote.scenario.kind == 'lease' else "")
+                for quote in quotes
+            )
+            yield f"- {tier.capitalize()} credit ({apr}% APR), ${down_payment:,} down: {terms}\n"
+
+    @classmethod
+    def explain_financing(cls, budget=None, credit_tier=None):
+        """
+        Provide financing explanation
+        
+        :param budget: Optional budget to tailor advice
+        :param credit_tier: Customer's credit tier, every tier is quoted if None
+        :return: Financing explanation
+        """
+        if not budget:
+            return cls.rendered_blocks().financing_options
+        return ''.join(cls.stream_financing(budget, credit_tier))
+
+    @classmethod
+    def stream_buying_process_guide(cls):
+        """
+        Produce the buying process guide one step at a time
         
-        return explanation
+        :return: Generator of guide chunks
+        """
+        yield from cls.rendered_blocks().buying_process_chunks
 
     @classmethod
     def buying_process_guide(cls):
@@ -95,40 +248,163 @@ class AutoDealershipKnowledge:
         
         :return: Step-by-step buying process
         """
-        guide = "Auto Buying Process:\n"
-        for i, step in enumerate(cls.BUYING_PROCESS_STEPS, 1):
-            guide += f"{i}. {step}\n"
+        return cls.rendered_blocks().buying_process_guide
+    
+    @classmethod
+    def rendered_blocks(cls):
+        """
+        Static replies built from this class's constants
         
-        return guide
+        They are rendered and interned the first time the class answers (or
+        when install_knowledge loads it) and shared by every later request,
+        so the constants are expected not to change once a class is in use;
+        derive_knowledge creates a new class instead.
+        
+        :return: KnowledgeBlocks
+        """
+        # A derived class inherits both attributes, so the owner tells whose replies they are
+        if cls._rendered_owner is not cls:
+            cls._rendered_blocks = cls._render_blocks()
+            cls._rendered_owner = cls
+        return cls._rendered_blocks
+    
+    @classmethod
+    def _render_blocks(cls):
+        buying_process_chunks = ("Auto Buying Process:\n",) + tuple(
+            f"{i}. {step}\n" for i, step in enumerate(cls.BUYING_PROCESS_STEPS, 1)
+        )
+        financing_chunks = ("Financing Options:\n",) + tuple(f"- {option}\n" for option in cls.FINANCING_OPTIONS)
+        return KnowledgeBlocks(
+            vehicle_replies={
+                vehicle_type: sys.intern(
+                    f"Looking for a {vehicle_type}? They are known for being {', '.join(attributes)}."
+                )
+                for vehicle_type, attributes in cls.VEHICLE_TYPES.items()
+            },
+            buying_process_chunks=buying_process_chunks,
+            buying_process_guide=sys.intern(''.join(buying_process_chunks)),
+            financing_chunks=financing_chunks,
+            financing_options=sys.intern(''.join(financing_chunks)),
+            maintenance=sys.intern(f"Key Maintenance Tips:\n{chr(10).join(cls.MAINTENANCE_ADVICE['frequency'])}"),
+            negotiation=sys.intern(f"Negotiation Tips:\n{chr(10).join(cls.NEGOTIATION_TIPS)}")
+        )
 
-def generate_auto_response(query):
+# Returned by generate_auto_response when no auto topic is recognised
+DEFAULT_AUTO_RESPONSE = "I can help you with vehicle types, buying process, financing, maintenance, and negotiation. What specific auto-related question do you have?"
+
+def build_topic_automaton(knowledge=AutoDealershipKnowledge):
     """
-    Generate intelligent responses for auto-related queries
+    Compile the topic keywords into one automaton, vehicle types first
+    
+    :param knowledge: Knowledge class providing VEHICLE_TYPES and TOPIC_KEYWORDS
+    :return: KeywordAutomaton
+    """
+    topics = [(vehicle_type, [vehicle_type]) for vehicle_type in knowledge.VEHICLE_TYPES]
+    topics.extend(knowledge.TOPIC_KEYWORDS.items())
+    return KeywordAutomaton(topics)
+
+TOPIC_AUTOMATON = build_topic_automaton()
+
+# Knowledge class, its automaton and its static replies, swapped together by install_knowledge;
+# a tenant engine (see tenants.py) carries its own triple of the same shape
+_ACTIVE = (AutoDealershipKnowledge, TOPIC_AUTOMATON, AutoDealershipKnowledge.rendered_blocks())
+
+def derive_knowledge(overrides, base=AutoDealershipKnowledge):
+    """
+    Create a knowledge class that overrides some constants of a base class
+    
+    :param overrides: Dict of class constant name (e.g. 'VEHICLE_TYPES') to value
+    :param base: Knowledge class to inherit everything else from
+    :return: New knowledge class
+    """
+    unknown = [name for name in overrides if not hasattr(base, name)]
+    if unknown:
+        raise ValueError(f"Unknown knowledge constants: {', '.join(sorted(unknown))}")
+    return type(base.__name__, (base,), dict(overrides))
+
+def install_knowledge(knowledge):
+    """
+    Make a knowledge class the one generate_auto_response answers from
+    
+    The class and its compiled automaton are swapped with a single assignment,
+    so concurrent requests see either the old or the new knowledge. Its
+    static replies are rendered beforehand, so the first request after the
+    swap doesn't pay for them.
+    
+    :param knowledge: Knowledge class, e.g. from derive_knowledge
+    """
+    global _ACTIVE
+    _ACTIVE = (knowledge, build_topic_automaton(knowledge), knowledge.rendered_blocks())
+
+def _active():
+    engine = tenant_context.current()
+    return _ACTIVE if engine is None else engine.auto_knowledge
+
+def active_knowledge():
+    """
+    :return: Knowledge class currently used by generate_auto_response, the serving tenant's if any
+    """
+    return _active()[0]
+
+# Dollar amounts such as '$25,000', '$30k' or '25k'
+_BUDGET_PATTERN = re.compile(r'\$\s*(\d[\d,]*(?:\.\d+)?)(\s*k\b)?|\b(\d+(?:\.\d+)?)(k)\b', re.IGNORECASE)
+
+def extract_budget(text):
+    """
+    Find the budget a message mentions
+    
+    :param text: Message text
+    :return: Last dollar amount in the text, or None
+    """
+    budget = None
+    for match in _BUDGET_PATTERN.finditer(text):
+        amount = float((match.group(1) or match.group(3)).replace(',', ''))
+        if match.group(2) or match.group(4):
+            amount *= 1000
+        budget = int(amount)
+    return budget
+
+def stream_auto_response(query):
+    """
+    Produce the response to an auto-related query in chunks
+    
+    Nothing is produced when no auto topic is recognised, so callers can tell
+    that case apart without comparing against DEFAULT_AUTO_RESPONSE.
     
     :param query: User's query
-    :return: Contextual response
+    :return: Generator of response chunks
     """
+    knowledge, automaton, blocks = _active()
     query = query.lower()
     
+    # One pass finds the highest-priority topic mentioned as a whole word
+    topic = automaton.best_topic(query)
+    
     # Vehicle type queries
-    for vehicle_type, attributes in AutoDealershipKnowledge.VEHICLE_TYPES.items():
-        if vehicle_type in query:
-            return f"Looking for a {vehicle_type}? They are known for being {', '.join(attributes)}."
+    if topic in knowledge.VEHICLE_TYPES:
+        yield blocks.vehicle_replies[topic]
     
     # Process-related queries
-    if any(word in query for word in ['buy', 'purchase', 'process']):
-        return AutoDealershipKnowledge.buying_process_guide()
+    elif topic == 'process':
+        yield from blocks.buying_process_chunks
     
-    # Financing queries
-    if any(word in query for word in ['finance', 'loan', 'payment']):
-        return AutoDealershipKnowledge.explain_financing()
+    # Financing queries, with quotes when the query names a budget
+    elif topic == 'financing':
+        yield from knowledge.stream_financing(extract_budget(query))
     
     # Maintenance queries
-    if any(word in query for word in ['maintain', 'service', 'repair']):
-        return f"Key Maintenance Tips:\n{chr(10).join(AutoDealershipKnowledge.MAINTENANCE_ADVICE['frequency'])}"
+    elif topic == 'maintenance':
+        yield blocks.maintenance
     
     # Negotiation queries
-    if any(word in query for word in ['negotiate', 'price', 'deal']):
-        return f"Negotiation Tips:\n{chr(10).join(AutoDealershipKnowledge.NEGOTIATION_TIPS)}"
+    elif topic == 'negotiation':
+        yield blocks.negotiation
+
+def generate_auto_response(query):
+    """
+    Generate intelligent responses for auto-related queries
     
-    return "I can help you with vehicle types, buying process, financing, maintenance, and negotiation. What specific auto-related question do you have?"
+    :param query: User's query
+    :return: Contextual response
+    """
+    return ''.join(stream_auto_response(query)) or DEFAULT_AUTO_RESPONSE
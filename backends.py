@@ -0,0 +1,32 @@
+try:
+    import numpy
+except ImportError:  # NumPy is optional, the pure-Python backend covers everything
+    numpy = None
+
+# Array backends of the batch scorer, corpus analytics and quote engine, fastest first
+BACKENDS = ('numpy', 'python')
+
+
+def select_backend(backend=None):
+    """
+    Resolve the backend a computation runs on
+
+    :param backend: 'numpy' or 'python'; NumPy is used when installed if omitted
+    :return: Backend name
+    :raises ValueError: If the backend is unknown
+    :raises ImportError: If the 'numpy' backend is requested but NumPy isn't installed
+    """
+    if backend is None:
+        return 'numpy' if numpy is not None else 'python'
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+    if backend == 'numpy' and numpy is None:
+        raise ImportError("The 'numpy' backend requires NumPy to be installed")
+    return backend
+
+
+def available_backends():
+    """
+    :return: Tuple of the backends usable here, fastest first
+    """
+    return tuple(backend for backend in BACKENDS if backend != 'numpy' or numpy is not None)
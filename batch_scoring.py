@@ -0,0 +1,196 @@
+from backends import numpy, select_backend
+
+
+class _BatchMatrix:
+    """
+    Sparse message x token matrix plus the token x intent match tables for one batch
+
+    Every distinct token in the batch is looked up in the fuzzy matcher once,
+    no matter how many messages contain it.
+    """
+
+    def __init__(self, messages, registry):
+        self.intents = list(registry)
+        matcher = registry.matcher
+
+        recognised_index = {}
+        required_ids = {}
+        self.required_by_intent = []
+        for position, intent in enumerate(self.intents):
+            for word in set(intent.recognised_words):
+                recognised_index.setdefault(word, []).append(position)
+            self.required_by_intent.append(
+                [required_ids.setdefault(word, len(required_ids)) for word in intent.required_words]
+            )
+        self.required_count = len(required_ids)
+
+        # COO layout, rows in message order: (message row, token column, occurrences)
+        self.rows = []
+        self.columns = []
+        self.counts = []
+        token_ids = {}
+        for row, message in enumerate(messages):
+            counts = {}
+            for token in message:
+                column = token_ids.setdefault(token, len(token_ids))
+                counts[column] = counts.get(column, 0) + 1
+            for column, count in counts.items():
+                self.rows.append(row)
+                self.columns.append(column)
+                self.counts.append(count)
+
+        # Per token: intents with a matching recognised word, required words it satisfies
+        self.token_intents = []
+        self.token_required = []
+        for token in token_ids:
+            match = matcher.lookup(token)
+            intents = set(recognised_index.get(token, ()))
+            for word in match.forward:
+                intents.update(recognised_index.get(word, ()))
+            self.token_intents.append(sorted(intents))
+            self.token_required.append(sorted(required_ids[word] for word in match.reverse if word in required_ids))
+
+        self.message_count = len(messages)
+        self.recognised_lengths = [len(intent.recognised_words) for intent in self.intents]
+        self.single_response = [intent.single_response for intent in self.intents]
+
+
+def _best_python(batch, threshold):
+    results = []
+    entry = 0
+    entries = len(batch.rows)
+    for row in range(batch.message_count):
+        hits = {}
+        present = set()
+        while entry < entries and batch.rows[entry] == row:
+            column = batch.columns[entry]
+            for position in batch.token_intents[column]:
+                hits[position] = hits.get(position, 0) + batch.counts[entry]
+            present.update(batch.token_required[column])
+            entry += 1
+
+        best_position = None
+        best_score = 0
+        for position in sorted(hits):
+            length = batch.recognised_lengths[position]
+            score = int(float(hits[position]) / float(length) * 100) if length else 0
+            if not batch.single_response[position] and not present.issuperset(batch.required_by_intent[position]):
+                score = 0
+            if best_position is None or score > best_score:
+                best_position, best_score = position, score
+
+        if best_position is None or best_score < threshold:
+            results.append((None, best_score))
+        else:
+            results.append((batch.intents[best_position], best_score))
+    return results
+
+
+def _csr(lists):
+    # Row pointers and concatenated column indices of a list of index lists
+    lengths = numpy.fromiter(map(len, lists), dtype=numpy.int64, count=len(lists))
+    pointers = numpy.zeros(len(lists) + 1, dtype=numpy.int64)
+    numpy.cumsum(lengths, out=pointers[1:])
+    indices = numpy.fromiter((index for items in lists for index in items), dtype=numpy.int64,
+                             count=int(pointers[-1]))
+    return pointers, indices
+
+
+def _expand(rows, columns, pointers, indices):
+    # Sparse product of a COO matrix with a CSR 0/1 matrix, one output entry per (nonzero, CSR entry) pair
+    lengths = pointers[columns + 1] - pointers[columns]
+    total = int(lengths.sum())
+    offsets = numpy.arange(total, dtype=numpy.int64) - numpy.repeat(numpy.cumsum(lengths) - lengths, lengths)
+    return numpy.repeat(numpy.arange(len(rows)), lengths), indices[numpy.repeat(pointers[columns], lengths) + offsets]
+
+
+def _group(keys):
+    # Sorted distinct keys, plus the order and group starts to sum values per key with reduceat
+    order = numpy.argsort(keys, kind='stable')
+    keys = keys[order]
+    starts = numpy.flatnonzero(numpy.r_[True, keys[1:] != keys[:-1]]) if len(keys) else keys
+    return keys[starts], order, starts
+
+
+def _best_numpy(batch, threshold):
+    intent_count = len(batch.intents)
+    rows = numpy.asarray(batch.rows, dtype=numpy.int64)
+    columns = numpy.asarray(batch.columns, dtype=numpy.int64)
+    counts = numpy.asarray(batch.counts, dtype=numpy.int64)
+
+    # Hits: only the (message, intent) pairs some token of the message points at, summed per pair; never a
+    # dense message x intent array
+    entries, intents = _expand(rows, columns, *_csr(batch.token_intents))
+    keys, order, starts = _group(rows[entries] * intent_count + intents)
+    if not len(keys):
+        return [(None, 0)] * batch.message_count
+    hits = numpy.add.reduceat(counts[entries][order], starts)
+    pair_rows, pair_intents = numpy.divmod(keys, intent_count)
+
+    lengths = numpy.asarray(batch.recognised_lengths, dtype=numpy.float64)[pair_intents]
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        scores = numpy.where(lengths > 0, hits / lengths * 100, 0).astype(numpy.int64)
+
+    # Required words: distinct (message, required word) pairs present, credited to every intent requiring the word
+    required = [sorted(set(required)) for required in batch.required_by_intent]
+    needed = numpy.fromiter(map(len, required), dtype=numpy.int64, count=intent_count)
+    if batch.required_count and needed.any():
+        entries, words = _expand(rows, columns, *_csr(batch.token_required))
+        present, _, _ = _group(rows[entries] * batch.required_count + words)
+        present_rows, present_words = numpy.divmod(present, batch.required_count)
+        requiring = [[] for _ in range(batch.required_count)]
+        for position, words in enumerate(required):
+            for word in words:
+                requiring[word].append(position)
+        entries, intents = _expand(present_rows, present_words, *_csr(requiring))
+        satisfied_keys = present_rows[entries] * intent_count + intents
+        # Pairs without hits have no score to keep, so only pairs among keys are counted
+        found = numpy.searchsorted(keys, satisfied_keys)
+        found = found[(found < len(keys)) & (keys[numpy.minimum(found, len(keys) - 1)] == satisfied_keys)]
+        satisfied = numpy.bincount(found, minlength=len(keys))
+    else:
+        satisfied = numpy.zeros(len(keys), dtype=numpy.int64)
+    allowed = (satisfied == needed[pair_intents]) | numpy.asarray(batch.single_response, dtype=bool)[pair_intents]
+    scores = numpy.where(allowed, scores, 0)
+
+    # Per message, the highest score and among equal scores the first intent, like _best_python; pairs are
+    # sorted by message, then intent
+    results = [(None, 0)] * batch.message_count
+    starts = numpy.flatnonzero(numpy.r_[True, pair_rows[1:] != pair_rows[:-1]])
+    best = numpy.maximum.reduceat(scores, starts)
+    sizes = numpy.diff(numpy.r_[starts, len(keys)])
+    candidates = numpy.where(scores == numpy.repeat(best, sizes), numpy.arange(len(keys)), len(keys))
+    first = numpy.minimum.reduceat(candidates, starts)
+    for row, position, score in zip(pair_rows[first].tolist(), pair_intents[first].tolist(), scores[first].tolist()):
+        if score >= threshold:
+            results[row] = (batch.intents[position], score)
+        else:
+            results[row] = (None, score)
+    return results
+
+
+def match_batch(messages, registry, threshold, backend=None):
+    """
+    Score every intent against a batch of preprocessed messages
+
+    Equivalent to calling main.match_intent on each message, but each
+    distinct token is matched once and scores are computed from the
+    sparse message x token matrix in a single pass.
+
+    :param messages: List of preprocessed word lists
+    :param registry: IntentRegistry to score against
+    :param threshold: Minimum score for an intent to be returned
+    :param backend: 'numpy' or 'python'; NumPy is used when installed if omitted
+    :return: List of (Intent or None, score) tuples, one per message
+    """
+    backend = select_backend(backend)
+
+    if not messages:
+        return []
+
+    batch = _BatchMatrix(messages, registry)
+    if not batch.intents:
+        return [(None, 0)] * len(messages)
+    if backend == 'numpy':
+        return _best_numpy(batch, threshold)
+    return _best_python(batch, threshold)
@@ -0,0 +1,336 @@
+import argparse
+import contextlib
+import functools
+import itertools
+import json
+import platform
+import random
+import sys
+import tempfile
+import time
+import timeit
+
+import main
+import auto_bot
+import auto_dealership_knowledge
+import faq_index
+import template_engine
+import text_complexity
+from intent_registry import Intent, IntentRegistry
+from quote_engine import LOAN_TERMS, QuoteEngine, build_scenarios
+from session_store import SessionStore
+from vehicle_inventory import synthetic_inventory
+
+# Representative inputs per size class; adversarial inputs target the fuzzy matcher and the regexes
+INPUTS = {
+    'short': "hi",
+    'typical': "what financing options do you have for a new sedan?",
+    'long': (
+        "I want to discuss the intricate details of artificial intelligence, machine learning, neural networks, "
+        "deep learning, and how these technologies are transforming our world in ways we could never have "
+        "imagined just a decade ago, with potential implications for every single industry from healthcare to "
+        "transportation to education and beyond."
+    ),
+    'adversarial': (
+        " ".join("sedna trukc finanse negotaite maintian purchse vehicel dealrship" for _ in range(25))
+        + " " + "?!." * 200 + " " + "x" * 2000
+    )
+}
+
+INTENT_TABLE_SIZES = (10, 100, 1000)
+
+# Sessions held by the store in the session lookup benchmarks
+SESSION_COUNT = 100000
+
+# Vehicles in the inventory query benchmarks
+INVENTORY_SIZE = 100000
+
+# Passages in the FAQ retrieval benchmarks, and in the index build benchmark
+FAQ_PASSAGES = 20000
+FAQ_BUILD_PASSAGES = 2000
+
+
+def synthetic_intents(count, seed=0):
+    """
+    Build a deterministic intent table of a given size
+
+    The dealership intents come first, padded with random intents drawn
+    from a synthetic vocabulary so matching cost can be measured as the
+    table grows.
+
+    :param count: Total number of intents
+    :param seed: Random seed for the synthetic vocabulary
+    :return: List of Intent definitions
+    """
+    rng = random.Random(seed)
+    alphabet = 'abcdefghijklmnopqrstuvwxyz'
+    vocabulary = [''.join(rng.choice(alphabet) for _ in range(rng.randint(4, 10))) for _ in range(count * 2)]
+
+    intents = list(main.DEALERSHIP_INTENTS[:count])
+    for number in range(len(intents), count):
+        words = rng.sample(vocabulary, 3)
+        intents.append(Intent(f'synthetic_{number}', words, response=f'Synthetic response {number}',
+                              required_words=words[:1]))
+    return intents
+
+
+@contextlib.contextmanager
+def intent_registry(registry):
+    """Temporarily replace main.INTENT_REGISTRY"""
+    original = main.INTENT_REGISTRY
+    main.INTENT_REGISTRY = registry
+    try:
+        yield registry
+    finally:
+        main.INTENT_REGISTRY = original
+
+
+def feed_incrementally(chunks):
+    """Feed chunks to a fresh IncrementalComplexityAnalyzer, reading the score after each one"""
+    analyzer = text_complexity.IncrementalComplexityAnalyzer()
+    return [analyzer.feed(chunk).complexity for chunk in chunks]
+
+
+def build_faq_index(passages):
+    """Build an FAQ index over the given passages in a throwaway directory"""
+    with tempfile.TemporaryDirectory() as work:
+        return faq_index.build_index(passages, f'{work}/faq.index')
+
+
+def collect_benchmarks(resources, name_filter=None):
+    """
+    Build the benchmarks, only those whose name contains name_filter if given
+
+    Costly fixtures (the intent tables, session store, inventory and FAQ
+    index) are built only when a selected benchmark uses them, so a filtered
+    run doesn't pay for the others.
+
+    :param resources: contextlib.ExitStack owning files the benchmarks read; close it once they have run
+    :param name_filter: Only build benchmarks whose name contains this substring
+    :return: Dict of benchmark name to zero-argument callable
+    """
+    def wanted(*names):
+        return any(not name_filter or name_filter in name for name in names)
+
+    bot = auto_bot.AutoDealershipBot()
+    greeting = main.INTENT_REGISTRY.get('greeting')
+    matcher = main.INTENT_REGISTRY.matcher
+    inventory = functools.lru_cache(maxsize=None)(lambda: synthetic_inventory(INVENTORY_SIZE))
+    benchmarks = {}
+
+    for size, text in INPUTS.items():
+        tokens = main.preprocess_input(text)
+        benchmarks[f'preprocess_input[{size}]'] = lambda text=text: main.preprocess_input(text)
+        benchmarks[f'message_probability[{size}]'] = lambda tokens=tokens: main.message_probability(
+            tokens, greeting.recognised_words, greeting.single_response, greeting.required_words, matcher
+        )
+        # Pairwise difflib comparisons, the behaviour without a FuzzyMatcher
+        benchmarks[f'message_probability_pairwise[{size}]'] = lambda tokens=tokens: main.message_probability(
+            tokens, greeting.recognised_words, greeting.single_response, greeting.required_words
+        )
+        benchmarks[f'check_all_messages[{size}]'] = lambda tokens=tokens: main.check_all_messages(tokens)
+        # Explicit registry bypasses INTENT_CACHE, measuring the full scoring path
+        benchmarks[f'match_intent_uncached[{size}]'] = (
+            lambda tokens=tokens: main.match_intent(tokens, main.INTENT_REGISTRY)
+        )
+        benchmarks[f'get_response[{size}]'] = lambda text=text: main.get_response(text)
+        benchmarks[f'AutoDealershipBot.generate_response[{size}]'] = lambda text=text: bot.generate_response(text)
+        benchmarks[f'generate_auto_response[{size}]'] = (
+            lambda text=text: auto_dealership_knowledge.generate_auto_response(text)
+        )
+        benchmarks[f'calculate_complexity[{size}]'] = (
+            lambda text=text: text_complexity.TextComplexityAnalyzer.calculate_complexity(text)
+        )
+        # Text arriving in 16-character pieces, scored after each piece incrementally and by rescanning
+        chunks = [text[start:start + 16] for start in range(0, len(text), 16)]
+        benchmarks[f'IncrementalComplexityAnalyzer[{size}]'] = lambda chunks=chunks: feed_incrementally(chunks)
+        benchmarks[f'calculate_complexity_rescan[{size}]'] = lambda text=text: [
+            text_complexity.TextComplexityAnalyzer.calculate_complexity(text[:end])
+            for end in range(16, len(text) + 16, 16)
+        ]
+
+    for count in INTENT_TABLE_SIZES:
+        name = f'check_all_messages[intents={count}]'
+        if not wanted(name):
+            continue
+        registry = IntentRegistry(synthetic_intents(count))
+        tokens = main.preprocess_input(INPUTS['typical'])
+
+        def run(registry=registry, tokens=tokens):
+            with intent_registry(registry):
+                return main.check_all_messages(tokens)
+
+        benchmarks[name] = run
+
+    get_name = f'SessionStore.get[sessions={SESSION_COUNT}]'
+    update_name = f'SessionStore.update[sessions={SESSION_COUNT}]'
+    if wanted(get_name, update_name):
+        store = SessionStore(max_sessions=SESSION_COUNT)
+        session_ids = [f'session-{number}' for number in range(SESSION_COUNT)]
+        for session_id in session_ids:
+            store.update(session_id, 'greeting', 'sedan', 25000)
+        lookups = itertools.cycle(session_ids)
+        benchmarks[get_name] = lambda: store.get(next(lookups))
+        benchmarks[update_name] = lambda: store.update(next(lookups), 'financing', budget=30000)
+
+    broad_name = f'VehicleInventory.query_broad[vehicles={INVENTORY_SIZE}]'
+    narrow_name = f'VehicleInventory.query_narrow[vehicles={INVENTORY_SIZE}]'
+    if wanted(broad_name, narrow_name):
+        vehicles = inventory()
+        # Broad filters end early walking the price order; narrow ones rank the bitmap candidates
+        benchmarks[broad_name] = lambda: vehicles.query(
+            vehicle_types=['sedan', 'suv'], max_price=30000, order_by='-year'
+        )
+        benchmarks[narrow_name] = lambda: vehicles.query(
+            vehicle_types=['truck'], min_year=2020, max_mileage=40000
+        )
+
+    knowledge = auto_dealership_knowledge.AutoDealershipKnowledge
+    field_template = template_engine.compile_template("Looking for a {topic}? They are known for being {attributes}.")
+    field_values = {'topic': 'sedan', 'attributes': 'comfortable, fuel-efficient, family-friendly'}
+    benchmarks['Template.render[fields]'] = lambda: field_template.render(field_values)
+    benchmarks['buying_process_guide'] = knowledge.buying_process_guide
+    benchmarks['explain_financing[no_budget]'] = knowledge.explain_financing
+    benchmarks['generate_auto_response[maintenance]'] = (
+        lambda: auto_dealership_knowledge.generate_auto_response("how often should I service my car")
+    )
+    benchmarks['AutoDealershipBot.generate_response[buying_process]'] = (
+        lambda: bot.generate_response("how do I buy a car")
+    )
+
+    build_name = f'faq_index.build_index[passages={FAQ_BUILD_PASSAGES}]'
+    if wanted(build_name):
+        passages = list(faq_index.synthetic_passages(FAQ_BUILD_PASSAGES))
+        benchmarks[build_name] = lambda: build_faq_index(passages)
+
+    # 20 scenarios: every loan term at every rate tier, no money down
+    engine = QuoteEngine(build_scenarios(loan_terms=LOAN_TERMS, lease_residuals=(), down_payments=(0,)))
+    grid_name = f'QuoteEngine.grid[vehicles={INVENTORY_SIZE},scenarios={len(engine)}]'
+    best_name = f'QuoteEngine.best_quotes[vehicles={INVENTORY_SIZE},scenarios={len(engine)}]'
+    if wanted(grid_name, best_name):
+        prices = inventory().columns['price']
+        price_order = inventory().sorted_rows('price')
+        benchmarks[grid_name] = lambda: engine.grid(prices)
+        benchmarks[best_name] = lambda: engine.best_quotes(prices, 450, limit=10, order=price_order)
+
+    rare_name = f'FaqIndex.search_rare[passages={FAQ_PASSAGES}]'
+    common_name = f'FaqIndex.search_common[passages={FAQ_PASSAGES}]'
+    answer_name = f'FaqIndex.answer[passages={FAQ_PASSAGES}]'
+    if wanted(rare_name, common_name, answer_name):
+        # Closed before its directory is removed, which Windows requires of a mapped file
+        work = resources.enter_context(tempfile.TemporaryDirectory())
+        path = f'{work}/faq.index'
+        faq_index.build_index(faq_index.synthetic_passages(FAQ_PASSAGES), path)
+        index = faq_index.FaqIndex(path)
+        resources.callback(index.close)
+        rare_question = ' '.join(index.document(0).split()[-3:])
+        common_question = ' '.join(index.document(1).split()[:8])
+        benchmarks[rare_name] = lambda: index.search(rare_question)
+        benchmarks[common_name] = lambda: index.search(common_question)
+        benchmarks[answer_name] = lambda: index.answer(common_question)
+
+    return {name: function for name, function in benchmarks.items() if wanted(name)}
+
+
+def time_callable(function, repeat=5, min_time=0.2):
+    """
+    Best per-call time of a callable
+
+    :param function: Zero-argument callable
+    :param repeat: Number of timing rounds
+    :param min_time: Minimum duration of each round in seconds
+    :return: Seconds per call, the minimum over all rounds
+    """
+    timer = timeit.Timer(function)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number = max(number * 2, int(number * min_time / elapsed) if elapsed > 0 else number * 10)
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def run_benchmarks(name_filter=None, repeat=5, min_time=0.2, seed=0):
+    """
+    :param name_filter: Only run benchmarks whose name contains this substring
+    :param repeat: Timing rounds per benchmark
+    :param min_time: Minimum seconds per round
+    :param seed: Seed for the global random module, which picks response templates
+    :return: Dict of benchmark name to microseconds per call
+    """
+    results = {}
+    with contextlib.ExitStack() as resources:
+        for name, function in collect_benchmarks(resources, name_filter).items():
+            random.seed(seed)
+            function()  # Warm memoized lookups so rounds measure steady state
+            results[name] = time_callable(function, repeat=repeat, min_time=min_time) * 1e6
+    return results
+
+
+def compare(results, baseline, max_regression):
+    """
+    Compare results against a stored baseline
+
+    :param results: Dict of benchmark name to microseconds per call
+    :param baseline: Dict in the same shape
+    :param max_regression: Allowed slowdown in percent
+    :return: List of (name, baseline us, current us, change percent) that regressed
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        change = (current - previous) / previous * 100
+        if change > max_regression:
+            regressions.append((name, previous, current, change))
+    return regressions
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Time the bot's hot functions and check for regressions")
+    parser.add_argument('--save', metavar='FILE', help="Store the results as a JSON baseline")
+    parser.add_argument('--compare', metavar='FILE', help="Compare against a JSON baseline")
+    parser.add_argument('--max-regression', type=float, default=20.0,
+                        help="Fail when a benchmark is this many percent slower than the baseline")
+    parser.add_argument('--filter', help="Only run benchmarks whose name contains this substring")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2, help="Minimum seconds per timing round")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    results = run_benchmarks(args.filter, repeat=args.repeat, min_time=args.min_time)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)['results']
+
+    width = max(len(name) for name in results) if results else 0
+    for name, per_call in results.items():
+        line = f"{name:<{width}}  {per_call:12.2f} us"
+        if name in baseline:
+            line += f"  ({(per_call - baseline[name]) / baseline[name] * 100:+.1f}%)"
+        print(line)
+    print(f"\n{len(results)} benchmarks in {time.perf_counter() - started:.1f}s")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as baseline_file:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'results': results
+            }, baseline_file, indent=2, sort_keys=True)
+
+    if args.compare:
+        regressions = compare(results, baseline, args.max_regression)
+        for name, previous, current, change in regressions:
+            print(f"REGRESSION {name}: {previous:.2f} us -> {current:.2f} us ({change:+.1f}%)")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,186 @@
+import argparse
+import asyncio
+import itertools
+import json
+import time
+
+from chat_server import DEFAULT_HOST, DEFAULT_PORT, MAX_LINE_BYTES
+from latency_stats import LatencyRecorder
+
+SAMPLE_MESSAGES = [
+    "hello",
+    "I want to buy a sedan",
+    "what financing options do you have?",
+    "tell me about truck maintenance",
+    "how do I negotiate a good price?",
+    "asdfghjkl",
+    "bye"
+]
+
+
+class ChatClient:
+    """Minimal client for ChatServer, one request in flight per connection"""
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, session=None):
+        self.host = host
+        self.port = port
+        self.session = session
+        self._reader = None
+        self._writer = None
+        self._ids = itertools.count()
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port, limit=MAX_LINE_BYTES)
+        return self
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            await self._writer.wait_closed()
+            self._writer = None
+
+    async def _write(self, payload):
+        self._writer.write(json.dumps(payload).encode('utf-8') + b'\n')
+        await self._writer.drain()
+
+    async def _read(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Server closed the connection")
+        return json.loads(line)
+
+    async def request(self, payload):
+        """
+        Send one request object and wait for its reply
+
+        :param payload: JSON-serializable request dict
+        :return: Decoded reply dict
+        """
+        await self._write(payload)
+        return await self._read()
+
+    async def send(self, message):
+        """
+        :param message: User message
+        :return: Reply dict with response, intent, score and fallback flag
+        """
+        return await self.request({'id': next(self._ids), 'session': self.session, 'message': message})
+
+    async def stream(self, message):
+        """
+        Send a message and yield reply objects as the server produces them
+
+        :param message: User message
+        :return: Async iterator of ``{"chunk": ...}`` dicts followed by the final reply dict
+        """
+        await self._write({'id': next(self._ids), 'session': self.session, 'message': message, 'stream': True})
+        while True:
+            reply = await self._read()
+            yield reply
+            if 'chunk' not in reply:
+                return
+
+    async def stats(self):
+        return (await self.request({'command': 'stats'}))['stats']
+
+
+async def run_benchmark(host, port, requests, concurrency, messages=SAMPLE_MESSAGES, stream=False):
+    """
+    Drive the server with concurrent sessions and measure client-side latency
+
+    :param host: Server host
+    :param port: Server port
+    :param requests: Total number of requests to send
+    :param concurrency: Number of concurrent sessions (one connection each)
+    :param messages: Messages cycled through by every session
+    :param stream: Request streamed replies and also measure time to the first chunk
+    :return: Dict with client-side throughput and latency plus server stats
+    """
+    latency = LatencyRecorder()
+    first_chunk_latency = LatencyRecorder()
+    counter = itertools.count()
+
+    async def session(number):
+        client = await ChatClient(host, port, session=f'bench-{number}').connect()
+        try:
+            while next(counter) < requests:
+                message = messages[number % len(messages)]
+                number += 1
+                start = time.perf_counter()
+                if stream:
+                    first_chunk = None
+                    async for reply in client.stream(message):
+                        if first_chunk is None:
+                            first_chunk = time.perf_counter() - start
+                    first_chunk_latency.record(first_chunk)
+                else:
+                    await client.send(message)
+                latency.record(time.perf_counter() - start)
+        finally:
+            await client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session(number) for number in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    client = await ChatClient(host, port).connect()
+    try:
+        server_stats = await client.stats()
+    finally:
+        await client.close()
+
+    report = {
+        'requests': latency.count,
+        'concurrency': concurrency,
+        'elapsed_s': elapsed,
+        'throughput_rps': latency.count / elapsed if elapsed > 0 else 0.0,
+        'latency': latency.summary()
+    }
+    if stream:
+        report['first_chunk_latency'] = first_chunk_latency.summary()
+    report['server'] = server_stats
+    return report
+
+
+async def interactive(host, port, stream=False):
+    client = await ChatClient(host, port, session='interactive').connect()
+    print("Chat Bot: Type 'quit' to exit")
+    try:
+        while True:
+            user_input = await asyncio.to_thread(input, 'You: ')
+            if user_input.lower() == 'quit':
+                print("Chat Bot: Goodbye!")
+                break
+            if stream:
+                print('Bot:', end=' ', flush=True)
+                async for reply in client.stream(user_input):
+                    if 'chunk' in reply:
+                        print(reply['chunk'], end='', flush=True)
+                    elif 'error' in reply:
+                        print(reply['error'], end='')
+                print()
+            else:
+                reply = await client.send(user_input)
+                print('Bot:', reply.get('response', reply.get('error')))
+    finally:
+        await client.close()
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Talk to or benchmark a running chat server")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--bench', type=int, metavar='REQUESTS', help="Send REQUESTS messages and report latency")
+    parser.add_argument('--concurrency', type=int, default=100, help="Concurrent sessions for --bench")
+    parser.add_argument('--stream', action='store_true', help="Request streamed replies and show chunks as they arrive")
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        report = asyncio.run(run_benchmark(args.host, args.port, args.bench, args.concurrency, stream=args.stream))
+        print(json.dumps(report, indent=2))
+    else:
+        asyncio.run(interactive(args.host, args.port, stream=args.stream))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,444 @@
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import logging
+import time
+
+import admission
+import faq_index
+import main as chatbot
+from latency_stats import LatencyRecorder
+from knowledge_snapshot import KnowledgeStore
+from tenants import DEFAULT_MAX_BYTES, TenantRegistry, load_overlays
+from tracing import TRACER, JsonLinesSink, PrometheusTextSink
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Longest accepted request line; longer lines get an error and the connection is closed
+MAX_LINE_BYTES = 64 * 1024
+
+# Marks the end of a response produced in the executor
+_END_OF_STREAM = object()
+
+
+class ChatServer:
+    """
+    Asyncio front-end for main.get_response speaking line-delimited JSON over TCP
+
+    Each request is one JSON object per line, ``{"session": ..., "message": ...}``,
+    and gets one JSON object back with the response, the matched intent and
+    whether the fallback path ran; with ``"stream": true`` the response chunks
+    are sent as they are produced before that final object. ``{"command": "stats"}``
+    returns server statistics, including time-to-first-chunk next to total
+    latency. Intent matching runs on the event loop; the fallback analysis
+    runs in an executor so slow messages don't stall other sessions. A
+    request that fails gets ``{"error": ...}`` back and the connection stays
+    open for the next one.
+
+    A request's ``"seed"`` (or the server's default seed) makes its reply
+    reproducible: the same seed, session and message always get the same
+    response, see main.stream_response.
+
+    With a TenantRegistry, a request's ``"tenant"`` picks the dealership
+    whose knowledge answers it; requests without one get the installed
+    knowledge.
+
+    With an admission.AdmissionController, sessions over their rate limit get
+    an error reply, and under overload messages no intent matches get the
+    canned reply instead of the fallback analysis, flagged ``"degraded"``.
+    """
+
+    def __init__(self, executor=None, knowledge_store=None, seed=None, tenants=None, admission=None):
+        """
+        :param executor: concurrent.futures executor for fallback analysis, the admission controller's workers or
+            a thread pool by default
+        :param knowledge_store: KnowledgeStore that the 'reload' command hot-swaps from
+        :param seed: Replay seed for requests that don't carry one, None for unseeded replies
+        :param tenants: TenantRegistry routing requests with a 'tenant' field
+        :param admission: AdmissionController limiting session rates and shedding fallback analysis under overload;
+            its workers run the fallback analysis
+        """
+        if admission is not None and isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+            raise ValueError("Admission control needs a thread executor")
+        if executor is None:
+            executor = admission.executor if admission is not None else concurrent.futures.ThreadPoolExecutor()
+        self.executor = executor
+        self.knowledge_store = knowledge_store
+        self.seed = seed
+        self.tenants = tenants
+        self.admission = admission
+        self.latency = LatencyRecorder()
+        self.first_chunk_latency = LatencyRecorder()
+        self.started_at = time.perf_counter()
+        self.connections = 0
+        self.fallbacks = 0
+        self.errors = 0
+        self._server = None
+
+    async def stream_message(self, message, reply, session=None, seed=None, engine=None):
+        """
+        Produce the reply for one user message chunk by chunk
+
+        The reply comes from main.stream_response. Preprocessing, intent
+        scoring and rendering an intent reply run on the event loop; fallback
+        chunks are produced in the executor and handed over as soon as each
+        one is ready, so the opening line can reach the client while the
+        analysis is still running. With admission control, the fallback may
+        be shed to the canned reply, which sets the reply's degraded flag.
+
+        :param message: Raw user input
+        :param reply: Dict that receives the intent, score, fallback and degraded flags
+        :param session: Session ID whose context in main.SESSIONS is updated
+        :param seed: Replay seed, None for unseeded replies
+        :param engine: tenants.TenantEngine answering the message, None for the installed knowledge
+        :return: Async iterator of response chunks
+        """
+        stream = chatbot.stream_response(message, session, seed, engine)
+        if self.admission is not None:
+            chunks, on_worker = self.admission.admit(stream)
+        else:
+            stream.match()
+            chunks, on_worker = stream, stream.fallback
+        intent, score = stream.intent, stream.score
+        reply.update(intent=intent.intent_id if intent is not None else None, score=score, fallback=intent is None)
+        if intent is None:
+            self.fallbacks += 1
+
+        if not on_worker:
+            try:
+                for chunk in chunks:
+                    yield chunk
+            finally:
+                chunks.close()
+        elif isinstance(self.executor, concurrent.futures.ProcessPoolExecutor):
+            # Generators can't cross the process boundary, the reply comes back whole; main_cli doesn't
+            # combine process pools with tenants, whose engines live in this process
+            try:
+                TRACER.count('fallback')
+                with TRACER.span('fallback'):
+                    loop = asyncio.get_running_loop()
+                    yield await loop.run_in_executor(
+                        self.executor, chatbot.fallback_response, message, seed, session
+                    )
+            finally:
+                stream.close()
+        else:
+            async for chunk in self._stream_in_executor(chunks):
+                yield chunk
+        if stream.shed and stream.fallback:
+            reply['degraded'] = True
+
+    async def _stream_in_executor(self, chunks):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        def produce():
+            # The whole stream runs in one executor call, chunks cross over through the queue; each step runs in
+            # the request's own context, so it doesn't matter which thread advances it
+            try:
+                for chunk in chunks:
+                    loop.call_soon_threadsafe(queue.put_nowait, (chunk, None))
+            except Exception as error:
+                loop.call_soon_threadsafe(queue.put_nowait, (_END_OF_STREAM, error))
+            else:
+                loop.call_soon_threadsafe(queue.put_nowait, (_END_OF_STREAM, None))
+
+        producer = loop.run_in_executor(self.executor, produce)
+        while True:
+            chunk, error = await queue.get()
+            if chunk is _END_OF_STREAM:
+                break
+            yield chunk
+        await producer
+        if error is not None:
+            raise error
+
+    async def handle_message(self, message, seed=None):
+        """
+        Produce the whole reply for one user message
+
+        :param message: Raw user input
+        :param seed: Replay seed, the server's default seed if None
+        :return: Dict with response, intent, score and fallback flag
+        """
+        reply = {}
+        seed = self.seed if seed is None else seed
+        chunks = [chunk async for chunk in self.stream_message(message, reply, seed=seed)]
+        return {'response': ''.join(chunks), **reply}
+
+    async def handle_request(self, request, send=None):
+        """
+        Dispatch one decoded request object
+
+        Requests with ``"stream": true`` get one ``{"chunk": ...}`` object per
+        response chunk through ``send`` before the final reply.
+
+        :param request: Decoded JSON request
+        :param send: Coroutine function writing one reply object to the client
+        :return: Dict to send back to the client
+        """
+        if request.get('command') == 'stats':
+            return {'stats': self.stats()}
+        if request.get('command') == 'reload':
+            return await self.reload()
+
+        message = request.get('message')
+        if not isinstance(message, str):
+            raise ValueError("Request needs a string 'message' field")
+        session = request.get('session')
+        if session is not None and not isinstance(session, (str, int)):
+            raise ValueError("'session' must be a string or an integer")
+        seed = request.get('seed', self.seed)
+        if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool)):
+            raise ValueError("'seed' must be an integer")
+        engine = None
+        tenant = request.get('tenant')
+        if tenant is not None:
+            if self.tenants is None:
+                raise ValueError("Server was started without --tenants")
+            if not isinstance(tenant, str):
+                raise ValueError("'tenant' must be a string")
+            try:
+                engine = self.tenants.engine(tenant)
+            except KeyError:
+                raise ValueError(f"Unknown tenant {tenant!r}") from None
+            if session is not None:
+                # Dealerships may use the same session IDs
+                session = (tenant, session)
+        if self.admission is not None:
+            # Raises admission.RequestRejected, a ValueError, before any work is done
+            self.admission.check_rate(session)
+        stream = bool(request.get('stream')) and send is not None
+
+        start = time.perf_counter()
+        first_chunk_at = None
+        reply = {}
+        chunks = []
+        # main.stream_response records the request span and the time to its first chunk
+        async for chunk in self.stream_message(message, reply, session, seed, engine):
+            if first_chunk_at is None:
+                first_chunk_at = time.perf_counter()
+            chunks.append(chunk)
+            if stream:
+                await send(self._tag({'chunk': chunk}, request))
+        elapsed = time.perf_counter() - start
+        self.latency.record(elapsed)
+        first_chunk = (first_chunk_at or start + elapsed) - start
+        self.first_chunk_latency.record(first_chunk)
+
+        reply = {'response': ''.join(chunks), **reply}
+        self._tag(reply, request)
+        if stream:
+            reply['done'] = True
+        reply['first_chunk_ms'] = first_chunk * 1000
+        reply['latency_ms'] = elapsed * 1000
+        return reply
+
+    @staticmethod
+    def _tag(reply, request):
+        # Echo the session and request ID so clients can match replies to requests
+        if request.get('session') is not None:
+            reply['session'] = request['session']
+        if 'id' in request:
+            reply['id'] = request['id']
+        return reply
+
+    async def reload(self):
+        """
+        Hot-swap to the current knowledge file without restarting
+
+        Loading runs in a worker thread; the swap itself is a reference
+        assignment, so requests in flight finish on the old knowledge.
+
+        :return: Dict describing the installed knowledge
+        """
+        if self.knowledge_store is None:
+            raise ValueError("Server was started without --knowledge")
+        loop = asyncio.get_running_loop()
+        knowledge = await loop.run_in_executor(None, self.knowledge_store.reload)
+        return {'reloaded': True, 'intents': len(knowledge.registry), 'snapshot': knowledge.snapshot.path}
+
+    async def _handle_connection(self, reader, writer):
+        self.connections += 1
+
+        async def send(reply):
+            writer.write(json.dumps(reply).encode('utf-8') + b'\n')
+            await writer.drain()
+
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Line exceeded the stream limit, the framing can't be recovered
+                    self.errors += 1
+                    writer.write(b'{"error": "request line too long"}\n')
+                    await writer.drain()
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("Request must be a JSON object")
+                    reply = await self.handle_request(request, send)
+                except ValueError as error:
+                    self.errors += 1
+                    reply = {'error': str(error)}
+                except ConnectionError:
+                    raise
+                except Exception:
+                    # A bug answering one request shouldn't drop the session's connection
+                    self.errors += 1
+                    logger.exception("Failed to handle request %r", line[:200])
+                    reply = {'error': "internal error"}
+
+                await send(reply)
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT, sock=None):
+        """
+        Start listening
+
+        :param host: Interface to bind
+        :param port: TCP port, 0 picks a free one
+        :param sock: Already bound listening socket to use instead of host and port
+        :return: asyncio.Server
+        """
+        self.started_at = time.perf_counter()
+        if sock is not None:
+            self._server = await asyncio.start_server(self._handle_connection, sock=sock, limit=MAX_LINE_BYTES)
+        else:
+            self._server = await asyncio.start_server(self._handle_connection, host, port, limit=MAX_LINE_BYTES)
+        return self._server
+
+    async def serve_forever(self, host=DEFAULT_HOST, port=DEFAULT_PORT, sock=None):
+        server = await self.start(host, port, sock=sock)
+        async with server:
+            await server.serve_forever()
+
+    def stats(self):
+        """
+        Throughput and latency sustained since the server started
+
+        :return: Dict of server statistics
+        """
+        uptime = time.perf_counter() - self.started_at
+        latency = self.latency.summary()
+        stats = {
+            'uptime_s': uptime,
+            'requests': latency['count'],
+            'throughput_rps': latency['count'] / uptime if uptime > 0 else 0.0,
+            'fallbacks': self.fallbacks,
+            'errors': self.errors,
+            'open_connections': self.connections,
+            'sessions': chatbot.SESSIONS.stats(),
+            'latency': latency,
+            'first_chunk_latency': self.first_chunk_latency.summary()
+        }
+        if chatbot.INTENT_CACHE is not None:
+            stats['intent_cache'] = chatbot.INTENT_CACHE.stats()
+        if self.tenants is not None:
+            stats['tenants'] = self.tenants.stats()
+        if self.admission is not None:
+            stats['admission'] = self.admission.stats()
+        if TRACER.enabled:
+            stats['stages'] = TRACER.summary()['stages']
+        return stats
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the chat bot over line-delimited JSON/TCP")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=None, help="Executor workers for fallback analysis")
+    parser.add_argument('--processes', action='store_true',
+                        help="Run fallback analysis in a process pool instead of threads")
+    parser.add_argument('--knowledge', metavar='FILE',
+                        help="Load intents and knowledge from a JSON/TOML file; the 'reload' command re-reads it "
+                             "(process-pool fallback workers keep the knowledge they started with)")
+    parser.add_argument('--faq', metavar='INDEX',
+                        help="Answer questions no intent matches from a FAQ/manual index built by faq_index.py")
+    parser.add_argument('--tenants', metavar='FILE',
+                        help="Serve the dealerships of a JSON/TOML tenant file, picked by each request's 'tenant' field")
+    parser.add_argument('--tenant-memory', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024), metavar='MB',
+                        help="Memory budget for compiled tenant engines; the least recently used are evicted")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="Make replies reproducible: the same seed, session and message give the same response "
+                             "(requests may override it with a 'seed' field)")
+    parser.add_argument('--admission', action='store_true',
+                        help="Rate limit sessions and, under overload, answer messages no intent matches with the "
+                             "canned reply instead of queueing the fallback analysis")
+    parser.add_argument('--max-queue', type=int, default=admission.DEFAULT_MAX_QUEUE,
+                        help="Fallback analyses that may wait for a worker under --admission")
+    parser.add_argument('--deadline-ms', type=float, default=admission.DEFAULT_DEADLINE * 1000,
+                        help="Deadline per fallback analysis under --admission")
+    parser.add_argument('--session-rate', type=float, default=admission.DEFAULT_SESSION_RATE,
+                        help="Requests per second per session under --admission, 0 for no limit")
+    parser.add_argument('--session-burst', type=int, default=admission.DEFAULT_SESSION_BURST)
+    parser.add_argument('--trace-jsonl', metavar='FILE', help="Record per-stage spans to a JSON lines file")
+    parser.add_argument('--trace-prometheus', metavar='FILE',
+                        help="Write per-stage latency summaries in Prometheus text format on shutdown")
+    args = parser.parse_args(argv)
+    if args.tenants and args.processes:
+        parser.error("--tenants can't be combined with --processes")
+    if args.admission and args.processes:
+        parser.error("--admission can't be combined with --processes")
+
+    sinks = []
+    if args.trace_jsonl:
+        sinks.append(JsonLinesSink(args.trace_jsonl))
+    if args.trace_prometheus:
+        sinks.append(PrometheusTextSink(args.trace_prometheus))
+    if sinks:
+        TRACER.enable(*sinks)
+
+    controller = None
+    if args.admission:
+        controller = admission.AdmissionController(
+            workers=args.workers, max_queue=args.max_queue, deadline=args.deadline_ms / 1000,
+            session_rate=args.session_rate or None, session_burst=args.session_burst
+        )
+        executor = controller.executor
+    elif args.processes:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=args.workers)
+    else:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=args.workers)
+
+    knowledge_store = None
+    if args.knowledge:
+        knowledge_store = KnowledgeStore(args.knowledge)
+        knowledge_store.reload()
+
+    if args.faq:
+        faq_index.install_index(faq_index.FaqIndex(args.faq))
+
+    tenants = None
+    if args.tenants:
+        tenants = TenantRegistry(load_overlays(args.tenants), max_bytes=args.tenant_memory * 1024 * 1024)
+
+    server = ChatServer(executor=executor, knowledge_store=knowledge_store, seed=args.seed, tenants=tenants,
+                        admission=controller)
+    print(f"Chat server listening on {args.host}:{args.port}")
+    try:
+        asyncio.run(server.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        print(json.dumps(server.stats(), indent=2))
+    finally:
+        TRACER.flush()
+        executor.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    main_cli()
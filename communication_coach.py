@@ -1,29 +1,39 @@
-import re
 import math
-import random
+import request_rng
 import text_complexity
 
 class CommunicationCoach:
+    # Feedback wording from the lowest to the highest band; corpus_analytics reports the band index
+    SENTENCE_LENGTH_FEEDBACK = (
+        "Your sentences are concise.",
+        "Your sentence length is balanced.",
+        "Try breaking down long sentences."
+    )
+    VOCABULARY_FEEDBACK = (
+        "Consider using more varied language.",
+        "Your vocabulary is reasonably diverse.",
+        "Great vocabulary diversity!"
+    )
+    
     @staticmethod
     def analyze_communication_style(text):
         """
         Analyze the communication style and provide constructive feedback
         
-        :param text: Input text to analyze
+        :param text: Input text to analyze, its MessageAnalysis or an IncrementalComplexityAnalyzer
         :return: Dictionary with communication insights
         """
+        analysis = text_complexity.TextComplexityAnalyzer.analyze(text)
+        
         # Complexity analysis
-        complexity = text_complexity.TextComplexityAnalyzer.calculate_complexity(text)
-        category = text_complexity.TextComplexityAnalyzer.get_complexity_category(complexity)
+        complexity = analysis.complexity
+        category = analysis.category
         
         # Sentence structure analysis
-        sentences = re.split(r'[.!?]+', text)
-        avg_sentence_length = sum(len(re.findall(r'\w+', sentence)) for sentence in sentences) / len(sentences)
+        avg_sentence_length = analysis.avg_sentence_length
         
         # Vocabulary analysis
-        words = re.findall(r'\w+', text.lower())
-        unique_words = len(set(words))
-        word_diversity_ratio = unique_words / len(words) if words else 0
+        word_diversity_ratio = analysis.unique_word_ratio
         
         # Communication style insights
         insights = {
@@ -33,19 +43,15 @@ class CommunicationCoach:
             },
             'sentence_structure': {
                 'avg_length': avg_sentence_length,
-                'length_feedback': (
-                    "Your sentences are concise." if avg_sentence_length < 10 else
-                    "Try breaking down long sentences." if avg_sentence_length > 20 else
-                    "Your sentence length is balanced."
-                )
+                'length_feedback': CommunicationCoach.SENTENCE_LENGTH_FEEDBACK[
+                    0 if avg_sentence_length < 10 else 2 if avg_sentence_length > 20 else 1
+                ]
             },
             'vocabulary': {
                 'diversity_ratio': word_diversity_ratio,
-                'vocabulary_feedback': (
-                    "Great vocabulary diversity!" if word_diversity_ratio > 0.5 else
-                    "Consider using more varied language." if word_diversity_ratio < 0.3 else
-                    "Your vocabulary is reasonably diverse."
-                )
+                'vocabulary_feedback': CommunicationCoach.VOCABULARY_FEEDBACK[
+                    2 if word_diversity_ratio > 0.5 else 0 if word_diversity_ratio < 0.3 else 1
+                ]
             }
         }
         
@@ -56,7 +62,7 @@ class CommunicationCoach:
         """
         Generate specific guidance to improve communication
         
-        :param text: Input text to analyze
+        :param text: Input text to analyze, its MessageAnalysis or an IncrementalComplexityAnalyzer
         :return: Constructive communication advice
         """
         insights = CommunicationCoach.analyze_communication_style(text)
@@ -104,7 +110,7 @@ class CommunicationCoach:
         # Select first matching guidance
         for guidance in guidance_templates:
             if guidance['condition']:
-                return random.choice(guidance['advice'])
+                return request_rng.choice(guidance['advice'])
         
         # Default guidance
         return "Your message is clear. What specific aspect would you like to discuss?"
@@ -114,7 +120,7 @@ class CommunicationCoach:
         """
         Suggest a communication framework for organizing thoughts
         
-        :param text: Input text to analyze
+        :param text: Input text to analyze, its MessageAnalysis or an IncrementalComplexityAnalyzer
         :return: Structured communication suggestion
         """
         frameworks = [
@@ -127,6 +133,6 @@ class CommunicationCoach:
         complexity = text_complexity.TextComplexityAnalyzer.calculate_complexity(text)
         
         if complexity > 75:
-            return f"Your message is quite complex. {random.choice(frameworks)}"
+            return f"Your message is quite complex. {request_rng.choice(frameworks)}"
         
         return None
@@ -0,0 +1,273 @@
+import argparse
+import array
+import collections
+import concurrent.futures
+import itertools
+import json
+import sys
+
+from backends import BACKENDS, numpy, select_backend
+from communication_coach import CommunicationCoach
+from replay import read_messages
+from text_complexity import CATEGORY_THRESHOLDS, COMPLEXITY_CATEGORIES, TextComplexityAnalyzer
+from tokenizer import SENTENCE_END_PATTERN, WORD_PATTERN
+
+# Raw counts count_message() produces per message, the first columns of a CorpusAnalysis
+_COUNT_COLUMNS = 5
+
+# One array per metric, one entry per message
+CorpusAnalysis = collections.namedtuple('CorpusAnalysis', [
+    'word_count',
+    'unique_word_count',
+    'total_word_length',
+    'sentence_count',
+    'sentence_word_count',
+    'unique_word_ratio',
+    'avg_sentence_length',
+    'avg_word_length',
+    'complexity',
+    'category',
+    'length_feedback',
+    'vocabulary_feedback'
+])
+CorpusAnalysis.__doc__ = """
+Columnar complexity and communication-style metrics for a corpus
+
+category indexes text_complexity.COMPLEXITY_CATEGORIES; length_feedback and
+vocabulary_feedback index CommunicationCoach.SENTENCE_LENGTH_FEEDBACK and
+VOCABULARY_FEEDBACK. sentence_word_count counts the words as written, which
+sentence lengths are measured in; it only differs from word_count, which
+counts the words of the lowercased text, when lowercasing splits a word
+('İ'). Columns are NumPy arrays or array.array, depending on the backend.
+"""
+
+
+def count_message(text):
+    """
+    Raw counts for one message, as TextComplexityAnalyzer.analyze tokenizes it
+
+    :param text: Message text
+    :return: (word count, unique word count, total word length, sentence count, sentence word count)
+    """
+    # Archive words are not interned: a corpus has far more distinct words than the chat
+    # vocabulary is sized for, and each worker only needs per-message counts
+    lowered = text.lower()
+    words = WORD_PATTERN.findall(lowered)
+    # Only the average sentence length is needed, so the words as written and the sentence count suffice;
+    # they are the lowercase words unless lowercasing split one ('İ')
+    sentence_words = len(words) if len(lowered) == len(text) else len(WORD_PATTERN.findall(text))
+    return (len(words), len(set(words)), sum(map(len, words)), len(SENTENCE_END_PATTERN.findall(text)) + 1,
+            sentence_words)
+
+
+def _count_corpus(texts):
+    columns = [array.array('i') for _ in range(_COUNT_COLUMNS)]
+    appends = [column.append for column in columns]
+    for text in texts:
+        for append, count in zip(appends, count_message(text)):
+            append(count)
+    return columns
+
+
+def _count_chunk(texts):
+    # Raw bytes pickle far smaller than lists of ints
+    return [column.tobytes() for column in _count_corpus(texts)]
+
+
+def _count_corpus_parallel(texts, workers, chunk_size):
+    columns = [array.array('i') for _ in range(_COUNT_COLUMNS)]
+    iterator = iter(texts)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        # A bounded window of chunks in flight keeps streamed input from piling up in memory
+        pending = collections.deque()
+        while True:
+            chunk = list(itertools.islice(iterator, chunk_size))
+            if chunk:
+                pending.append(executor.submit(_count_chunk, chunk))
+            if pending and (not chunk or len(pending) >= workers * 4):
+                for column, data in zip(columns, pending.popleft().result()):
+                    column.frombytes(data)
+            if not chunk and not pending:
+                return columns
+
+
+def _derive_numpy(word_count, unique_word_count, total_word_length, sentence_count, sentence_word_count):
+    word_count = numpy.frombuffer(word_count, dtype=numpy.intc)
+    unique_word_count = numpy.frombuffer(unique_word_count, dtype=numpy.intc)
+    total_word_length = numpy.frombuffer(total_word_length, dtype=numpy.intc)
+    sentence_count = numpy.frombuffer(sentence_count, dtype=numpy.intc)
+    sentence_word_count = numpy.frombuffer(sentence_word_count, dtype=numpy.intc)
+
+    has_words = word_count > 0
+    unique_word_ratio = numpy.divide(unique_word_count, word_count, out=numpy.zeros(len(word_count)),
+                                     where=has_words)
+    avg_sentence_length = sentence_word_count / sentence_count
+    avg_word_length = numpy.divide(total_word_length, word_count, out=numpy.zeros(len(word_count)),
+                                   where=has_words)
+
+    # Same operations in the same order as TextComplexityAnalyzer.complexity_score
+    complexity = (
+        0.3 * numpy.minimum(word_count / 50, 1) +
+        0.2 * unique_word_ratio +
+        0.3 * (avg_sentence_length / 20) +
+        0.2 * (avg_word_length / 6)
+    ) * 100
+    complexity = numpy.minimum(numpy.maximum(complexity, 0), 100)
+
+    category = numpy.searchsorted(CATEGORY_THRESHOLDS, complexity, side='right').astype(numpy.int8)
+    length_feedback = numpy.where(avg_sentence_length < 10, 0, numpy.where(avg_sentence_length > 20, 2, 1))
+    vocabulary_feedback = numpy.where(unique_word_ratio > 0.5, 2, numpy.where(unique_word_ratio < 0.3, 0, 1))
+
+    return CorpusAnalysis(
+        word_count, unique_word_count, total_word_length, sentence_count, sentence_word_count,
+        unique_word_ratio, avg_sentence_length, avg_word_length, complexity,
+        category, length_feedback.astype(numpy.int8), vocabulary_feedback.astype(numpy.int8)
+    )
+
+
+def _derive_python(word_count, unique_word_count, total_word_length, sentence_count, sentence_word_count):
+    unique_word_ratio = array.array('d')
+    avg_sentence_length = array.array('d')
+    avg_word_length = array.array('d')
+    complexity = array.array('d')
+    category = array.array('b')
+    length_feedback = array.array('b')
+    vocabulary_feedback = array.array('b')
+    category_index = {name: index for index, name in enumerate(COMPLEXITY_CATEGORIES)}
+
+    for words, unique, length, sentences, sentence_words in zip(word_count, unique_word_count, total_word_length,
+                                                                sentence_count, sentence_word_count):
+        ratio = unique / words if words > 0 else 0
+        sentence_length = sentence_words / sentences
+        word_length = length / words if words > 0 else 0
+        score = TextComplexityAnalyzer.complexity_score(words, ratio, sentence_length, word_length)
+
+        unique_word_ratio.append(ratio)
+        avg_sentence_length.append(sentence_length)
+        avg_word_length.append(word_length)
+        complexity.append(score)
+        category.append(category_index[TextComplexityAnalyzer.get_complexity_category(score)])
+        length_feedback.append(0 if sentence_length < 10 else 2 if sentence_length > 20 else 1)
+        vocabulary_feedback.append(2 if ratio > 0.5 else 0 if ratio < 0.3 else 1)
+
+    return CorpusAnalysis(
+        word_count, unique_word_count, total_word_length, sentence_count, sentence_word_count,
+        unique_word_ratio, avg_sentence_length, avg_word_length, complexity,
+        category, length_feedback, vocabulary_feedback
+    )
+
+
+def analyze_corpus(texts, backend=None, workers=None, chunk_size=10000):
+    """
+    Complexity and communication-style metrics for many messages at once
+
+    Each message is tokenized once into five integer counts stored in compact
+    arrays; every other metric is derived from those columns in one pass,
+    vectorized with NumPy when available. Scores and categories are identical
+    to running TextComplexityAnalyzer and CommunicationCoach per message.
+    Tokenizing dominates the cost, so it can be spread over worker processes.
+
+    :param texts: Iterable of message texts, e.g. a generator over an archive
+    :param backend: 'numpy' or 'python'; NumPy is used when installed if omitted
+    :param workers: Worker processes for tokenizing, in-process if None or 1
+    :param chunk_size: Messages per worker task
+    :return: CorpusAnalysis
+    """
+    backend = select_backend(backend)
+
+    if workers and workers > 1:
+        columns = _count_corpus_parallel(texts, workers, chunk_size)
+    else:
+        columns = _count_corpus(texts)
+    if backend == 'numpy':
+        return _derive_numpy(*columns)
+    return _derive_python(*columns)
+
+
+def message_insights(analysis, index):
+    """
+    Rebuild CommunicationCoach.analyze_communication_style's dict for one message
+
+    :param analysis: CorpusAnalysis
+    :param index: Message position in the corpus
+    :return: Dict with complexity, sentence_structure and vocabulary insights
+    """
+    return {
+        'complexity': {
+            'score': float(analysis.complexity[index]),
+            'category': COMPLEXITY_CATEGORIES[analysis.category[index]]
+        },
+        'sentence_structure': {
+            'avg_length': float(analysis.avg_sentence_length[index]),
+            'length_feedback': CommunicationCoach.SENTENCE_LENGTH_FEEDBACK[analysis.length_feedback[index]]
+        },
+        'vocabulary': {
+            'diversity_ratio': float(analysis.unique_word_ratio[index]),
+            'vocabulary_feedback': CommunicationCoach.VOCABULARY_FEEDBACK[analysis.vocabulary_feedback[index]]
+        }
+    }
+
+
+def _band_counts(codes, labels):
+    if numpy is not None and isinstance(codes, numpy.ndarray):
+        tally = numpy.bincount(codes, minlength=len(labels))
+    else:
+        tally = collections.Counter(codes)
+    return {label: int(tally[index]) for index, label in enumerate(labels)}
+
+
+def _mean(column):
+    if not len(column):
+        return 0.0
+    if numpy is not None and isinstance(column, numpy.ndarray):
+        return float(column.mean())
+    return sum(column) / len(column)
+
+
+def summarize(analysis):
+    """
+    Corpus-level totals of a CorpusAnalysis
+
+    :param analysis: CorpusAnalysis
+    :return: Dict with message count, mean metrics and how many messages fall in each category and feedback band
+    """
+    return {
+        'messages': len(analysis.complexity),
+        'mean_complexity': _mean(analysis.complexity),
+        'mean_word_count': _mean(analysis.word_count),
+        'mean_unique_word_ratio': _mean(analysis.unique_word_ratio),
+        'mean_avg_sentence_length': _mean(analysis.avg_sentence_length),
+        'categories': _band_counts(analysis.category, COMPLEXITY_CATEGORIES),
+        'length_feedback': _band_counts(analysis.length_feedback, CommunicationCoach.SENTENCE_LENGTH_FEEDBACK),
+        'vocabulary_feedback': _band_counts(analysis.vocabulary_feedback, CommunicationCoach.VOCABULARY_FEEDBACK)
+    }
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Complexity and communication-style analytics for a message archive")
+    parser.add_argument('archive', nargs='?', help="JSONL file of messages, stdin if omitted")
+    parser.add_argument('--field', default='message', help="JSON field holding the message text")
+    parser.add_argument('--backend', choices=BACKENDS, default=None)
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes for tokenizing")
+    parser.add_argument('--columns', metavar='FILE', help="Also write the per-message metrics as CSV")
+    args = parser.parse_args(argv)
+
+    source = open(args.archive, encoding='utf-8') if args.archive else sys.stdin
+    try:
+        analysis = analyze_corpus((message for _, message in read_messages(source, args.field)),
+                                  args.backend, args.workers)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+    if args.columns:
+        with open(args.columns, 'w', encoding='utf-8') as output:
+            output.write(','.join(CorpusAnalysis._fields) + '\n')
+            for row in zip(*analysis):
+                output.write(','.join(str(value) for value in row) + '\n')
+
+    print(json.dumps(summarize(analysis), indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,615 @@
+import argparse
+import array
+import bisect
+import collections
+import heapq
+import itertools
+import json
+import math
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
+import tokenizer
+from backends import numpy, select_backend
+from replay import read_messages
+
+MAGIC = b'CBFI'
+FORMAT_VERSION = 1
+
+# magic, format version, section count, document count, term count, k1, b, average document length
+_HEADER = struct.Struct('<4sIIQQddd')
+# section name, offset, length
+_SECTION = struct.Struct('<4sQQ')
+# term length, posting count; followed by the term, document numbers and term frequencies
+_RUN_RECORD = struct.Struct('<II')
+
+DEFAULT_K1 = 1.2
+DEFAULT_B = 0.75
+
+# Postings held in memory while building before they are flushed to a sorted run file
+DEFAULT_BLOCK_POSTINGS = 2000000
+
+# Best passages scoring below this don't answer a question, the canned replies do
+DEFAULT_MIN_SCORE = 4.0
+
+# Postings answer() reads best first before settling for the best passage found so far
+DEFAULT_ANSWER_BUDGET = 1000
+
+# Term lookups remembered before the cache starts over
+_TERM_CACHE_SIZE = 100000
+
+_ACTIVE = [None]
+
+
+def tokenize(text, words=None):
+    """
+    Index terms of a text, tokenized exactly like user input
+
+    :param text: Passage or query text
+    :param words: tokenizer.Tokenizer to intern the terms in, the shared serving one if None
+    :return: List of terms
+    """
+    if words is None:
+        return tokenizer.preprocess_input(text)
+    return words.preprocess(text)
+
+
+def read_passages(path, field='text'):
+    """
+    Passages of a FAQ or manual source file
+
+    JSON lines files hold one passage per line under ``field`` (or as a bare
+    JSON string); any other file is read as text with passages separated by
+    blank lines.
+
+    :param path: Source file
+    :param field: JSON field holding the passage text
+    :return: Generator of passage texts
+    """
+    with open(path, encoding='utf-8') as source:
+        if path.endswith('.jsonl'):
+            for _, passage in read_messages(source, field):
+                yield passage
+            return
+
+        lines = []
+        for line in source:
+            if line.strip():
+                lines.append(line.strip())
+            elif lines:
+                yield ' '.join(lines)
+                lines = []
+        if lines:
+            yield ' '.join(lines)
+
+
+def _little_endian(values):
+    if sys.byteorder != 'little':
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _write_run(block, path):
+    with open(path, 'wb') as run_file:
+        for term in sorted(block):
+            documents, frequencies = block[term]
+            run_file.write(_RUN_RECORD.pack(len(term), len(documents)))
+            run_file.write(term)
+            run_file.write(_little_endian(documents))
+            run_file.write(_little_endian(frequencies))
+
+
+def _read_run(path, number):
+    with open(path, 'rb') as run_file:
+        while True:
+            record = run_file.read(_RUN_RECORD.size)
+            if not record:
+                return
+            term_length, count = _RUN_RECORD.unpack(record)
+            term = run_file.read(term_length)
+            documents = array.array('I', run_file.read(count * 4))
+            frequencies = array.array('I', run_file.read(count * 4))
+            if sys.byteorder != 'little':
+                documents.byteswap()
+                frequencies.byteswap()
+            # The run number keeps each term's postings in document order across runs
+            yield term, number, documents, frequencies
+
+
+def _score_postings(documents, frequencies, lengths, document_count, average_length, k1, b, backend):
+    # Okapi BM25 weight of every posting; the IDF and length normalization are folded in at build time
+    document_frequency = len(documents)
+    idf = math.log(1 + (document_count - document_frequency + 0.5) / (document_frequency + 0.5))
+    if backend == 'numpy':
+        tf = numpy.frombuffer(frequencies, dtype=numpy.uint32).astype(numpy.float64)
+        length = numpy.frombuffer(lengths, dtype=numpy.uint32)[numpy.frombuffer(documents, dtype=numpy.uint32)]
+        scores = idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / average_length))
+        return array.array('f', scores.astype(numpy.float32).tobytes())
+    return array.array('f', (
+        idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths[document] / average_length))
+        for document, tf in zip(documents, frequencies)
+    ))
+
+
+def _impact_order(documents, scores, backend):
+    # Postings by descending weight, ties in document order
+    if backend == 'numpy':
+        weights = numpy.frombuffer(scores, dtype=numpy.float32)
+        order = numpy.argsort(-weights, kind='stable')
+        return (array.array('I', numpy.frombuffer(documents, dtype=numpy.uint32)[order].tobytes()),
+                array.array('f', weights[order].tobytes()))
+    order = sorted(range(len(documents)), key=lambda position: -scores[position])
+    return array.array('I', (documents[i] for i in order)), array.array('f', (scores[i] for i in order))
+
+
+def build_index(passages, path, k1=DEFAULT_K1, b=DEFAULT_B, block_postings=DEFAULT_BLOCK_POSTINGS, backend=None):
+    """
+    Build an on-disk BM25 index over FAQ and manual passages
+
+    Passages are streamed: postings collect in memory until ``block_postings``
+    of them are buffered, then go to a sorted run file. The runs are merged
+    term by term into the final file. Memory holds the block, the vocabulary,
+    four bytes per passage and, while merging, the postings of one term. That
+    last part is not bounded by the block size: a term found in every passage
+    takes a few dozen bytes per passage with NumPy, and several times that
+    without it, since its impact order is then sorted as a Python list. Every
+    posting stores its final BM25 weight. The file is written next to its
+    destination and renamed into place.
+
+    :param passages: Iterable of passage texts
+    :param path: Index file to write
+    :param k1: BM25 term frequency saturation
+    :param b: BM25 length normalization
+    :param block_postings: Postings buffered in memory per run
+    :param backend: 'numpy' or 'python' for scoring postings, see backends.select_backend; both write the same file
+    :return: Number of passages indexed
+    """
+    backend = select_backend(backend)
+    work = tempfile.mkdtemp(prefix='faq-index-', dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        lengths = array.array('I')
+        text_offsets = array.array('Q', [0])
+        runs = []
+        block = {}
+        buffered = 0
+        # Passage terms would crowd user words out of the serving vocabulary and its cache
+        words = tokenizer.Tokenizer()
+
+        with open(os.path.join(work, 'texts'), 'wb') as texts:
+            for document, passage in enumerate(passages):
+                counts = collections.Counter(tokenize(passage, words))
+                lengths.append(sum(counts.values()))
+                data = passage.encode('utf-8')
+                texts.write(data)
+                text_offsets.append(text_offsets[-1] + len(data))
+
+                for term, frequency in counts.items():
+                    postings = block.get(term)
+                    if postings is None:
+                        postings = block[term] = (array.array('I'), array.array('I'))
+                    postings[0].append(document)
+                    postings[1].append(frequency)
+                buffered += len(counts)
+                if buffered >= block_postings:
+                    runs.append(os.path.join(work, f'run{len(runs)}'))
+                    _write_run({term.encode('utf-8'): postings for term, postings in block.items()}, runs[-1])
+                    block = {}
+                    buffered = 0
+        if block:
+            runs.append(os.path.join(work, f'run{len(runs)}'))
+            _write_run({term.encode('utf-8'): postings for term, postings in block.items()}, runs[-1])
+            block = None
+
+        document_count = len(lengths)
+        average_length = sum(lengths) / document_count if document_count else 0.0
+        term_offsets = array.array('Q', [0])
+        term_blob = bytearray()
+        posting_offsets = array.array('Q', [0])
+
+        # Every term's postings are written twice: in document order for lookups by document,
+        # and by descending weight (ties in document order) for reading the best postings first
+        outputs = {name: open(os.path.join(work, name), 'wb') for name in ('PDOC', 'PSCR', 'IDOC', 'ISCR')}
+        try:
+            merged = heapq.merge(*(_read_run(run, number) for number, run in enumerate(runs)))
+            for term, group in itertools.groupby(merged, key=lambda record: record[0]):
+                documents = array.array('I')
+                frequencies = array.array('I')
+                for _, _, run_documents, run_frequencies in group:
+                    documents.extend(run_documents)
+                    frequencies.extend(run_frequencies)
+                scores = _score_postings(documents, frequencies, lengths, document_count, average_length, k1, b,
+                                         backend)
+                outputs['PDOC'].write(_little_endian(documents))
+                outputs['PSCR'].write(_little_endian(scores))
+                impact_documents, impact_scores = _impact_order(documents, scores, backend)
+                outputs['IDOC'].write(_little_endian(impact_documents))
+                outputs['ISCR'].write(_little_endian(impact_scores))
+                term_blob += term
+                term_offsets.append(len(term_blob))
+                posting_offsets.append(posting_offsets[-1] + len(documents))
+        finally:
+            for output in outputs.values():
+                output.close()
+
+        sections = [
+            (b'TRMO', _little_endian(term_offsets)),
+            (b'TRMB', bytes(term_blob)),
+            (b'POSO', _little_endian(posting_offsets)),
+            (b'DOCO', _little_endian(text_offsets)),
+            *((name.encode('ascii'), os.path.join(work, name)) for name in ('PDOC', 'PSCR', 'IDOC', 'ISCR')),
+            (b'TEXT', os.path.join(work, 'texts'))
+        ]
+        _write_sections(path, sections, _HEADER.pack(
+            MAGIC, FORMAT_VERSION, len(sections), document_count, len(term_offsets) - 1, k1, b, average_length
+        ))
+        return document_count
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def _write_sections(path, sections, header):
+    # Sections are bytes or the path of a file to copy in; each one starts 8-byte aligned
+    sizes = [len(data) if isinstance(data, bytes) else os.path.getsize(data) for _, data in sections]
+    offset = len(header) + _SECTION.size * len(sections)
+    table = []
+    for (name, _), size in zip(sections, sizes):
+        offset += -offset % 8
+        table.append((name, offset, size))
+        offset += size
+
+    temporary = f'{path}.tmp{os.getpid()}'
+    with open(temporary, 'wb') as index_file:
+        index_file.write(header)
+        for entry in table:
+            index_file.write(_SECTION.pack(*entry))
+        for (_, section_offset, _), (_, data) in zip(table, sections):
+            index_file.write(b'\0' * (section_offset - index_file.tell()))
+            if isinstance(data, bytes):
+                index_file.write(data)
+            else:
+                with open(data, 'rb') as section_file:
+                    shutil.copyfileobj(section_file, index_file, 1 << 20)
+    os.replace(temporary, path)
+
+
+class FaqIndex:
+    """
+    Read-only, memory-mapped BM25 index over FAQ and manual passages
+
+    Terms are found by binary search in the sorted term table, and their
+    postings (document numbers and precomputed BM25 weights) are read
+    straight from the map, so only the pages a query touches are loaded and
+    the index can be far larger than RAM.
+
+    search() stops early with the threshold algorithm: every term's postings
+    are also stored by descending weight, read best first, and each passage
+    met is scored fully by binary search in the other terms' postings. Once
+    the k-th best score reaches the sum of the weights still unread at each
+    term's cursor, no unseen passage can do better. A common word therefore
+    costs a few reads instead of a scan of its long postings list.
+    """
+
+    def __init__(self, path, min_score=DEFAULT_MIN_SCORE, answer_budget=DEFAULT_ANSWER_BUDGET):
+        """
+        :param path: Index file written by build_index
+        :param min_score: Lowest top score answer() accepts
+        :param answer_budget: Postings budget of the search behind answer(), see search()
+        :raises ValueError: If the file is not an index of the supported version
+        """
+        self.path = path
+        self.min_score = min_score
+        self.answer_budget = answer_budget
+        with open(path, 'rb') as index_file:
+            self._mmap = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+
+        (magic, version, section_count, self.document_count, self.term_count,
+         self.k1, self.b, self.average_length) = _HEADER.unpack_from(view, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} FAQ index")
+
+        self._sections = {}
+        for number in range(section_count):
+            name, offset, length = _SECTION.unpack_from(view, _HEADER.size + number * _SECTION.size)
+            self._sections[name] = view[offset:offset + length]
+
+        self._term_offsets = self._array(b'TRMO', 'Q')
+        self._term_blob = self._sections[b'TRMB']
+        self._posting_offsets = self._array(b'POSO', 'Q')
+        self._text_offsets = self._array(b'DOCO', 'Q')
+        self._documents = self._array(b'PDOC', 'I')
+        self._scores = self._array(b'PSCR', 'f')
+        self._impact_documents = self._array(b'IDOC', 'I')
+        self._impact_scores = self._array(b'ISCR', 'f')
+        self._texts = self._sections[b'TEXT']
+        self._term_cache = {}
+
+    def _array(self, name, typecode):
+        data = self._sections[name]
+        if sys.byteorder != 'little':
+            values = array.array(typecode, data.tobytes())
+            values.byteswap()
+            return values
+        return data.cast(typecode)
+
+    def close(self):
+        self._sections = {}
+        self._term_offsets = self._posting_offsets = self._text_offsets = self._term_blob = self._texts = None
+        self._documents = self._scores = self._impact_documents = self._impact_scores = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Views handed out by this index are still alive; the map closes when they are released
+            pass
+
+    def __len__(self):
+        return self.document_count
+
+    def _term_bytes(self, number):
+        return bytes(self._term_blob[self._term_offsets[number]:self._term_offsets[number + 1]])
+
+    def term_number(self, term):
+        """
+        :param term: Index term
+        :return: Position of the term in the term table, None if no passage contains it
+        """
+        number = self._term_cache.get(term, -1)
+        if number != -1:
+            return number
+
+        key = term.encode('utf-8')
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._term_bytes(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        number = low if low < self.term_count and self._term_bytes(low) == key else None
+
+        if len(self._term_cache) >= _TERM_CACHE_SIZE:
+            self._term_cache.clear()
+        self._term_cache[term] = number
+        return number
+
+    def postings(self, term):
+        """
+        :param term: Index term
+        :return: (document numbers, BM25 weights), memoryviews into the index in document order
+        """
+        number = self.term_number(term)
+        if number is None:
+            return self._documents[0:0], self._scores[0:0]
+        start, end = self._posting_offsets[number], self._posting_offsets[number + 1]
+        return self._documents[start:end], self._scores[start:end]
+
+    def document(self, number):
+        """
+        :param number: Document number
+        :return: Passage text
+        """
+        start, end = self._text_offsets[number], self._text_offsets[number + 1]
+        return bytes(self._texts[start:end]).decode('utf-8')
+
+    def search(self, query, k=3, budget=None):
+        """
+        Passages ranked by BM25 against a query
+
+        Queries made of many frequent words can need deep reads before the
+        top k are certain; a budget caps the postings read and returns the
+        best passages found by then, which bounds latency at the cost of
+        occasionally missing a passage that only scores well on weak terms.
+
+        :param query: Query text, tokenized like user input
+        :param k: Number of passages to return
+        :param budget: Most postings to read best first, exact ranking if None
+        :return: List of (score, document number), best first. Equal scores rank the lower document number
+            first, though a passage tied with the k-th score can lose its place to one found earlier
+        """
+        terms = []
+        for term, count in collections.Counter(tokenize(query)).items():
+            number = self.term_number(term)
+            if number is not None:
+                start, end = self._posting_offsets[number], self._posting_offsets[number + 1]
+                terms.append((count, self._documents[start:end], self._scores[start:end],
+                              self._impact_documents[start:end], self._impact_scores[start:end]))
+        if not terms or k <= 0:
+            return []
+
+        # Weight of the next unread posting per term, and a heap picking the heaviest of them
+        frontier = [impact_scores[0] * count for count, _, _, _, impact_scores in terms]
+        heads = [(-weight, position) for position, weight in enumerate(frontier)]
+        heapq.heapify(heads)
+        cursors = [0] * len(terms)
+        seen = set()
+        top = []
+        reads = 0
+
+        while heads:
+            if len(top) == k and top[0][0] >= sum(frontier):
+                break
+            if budget is not None and reads >= budget:
+                break
+            reads += 1
+            _, position = heapq.heappop(heads)
+            count, _, _, impact_documents, impact_scores = terms[position]
+            cursor = cursors[position]
+            document = impact_documents[cursor]
+            score = impact_scores[cursor] * count
+            cursors[position] = cursor = cursor + 1
+            if cursor < len(impact_documents):
+                frontier[position] = impact_scores[cursor] * count
+                heapq.heappush(heads, (-frontier[position], position))
+            else:
+                frontier[position] = 0.0
+
+            if document in seen:
+                continue
+            seen.add(document)
+            # An unseen passage weighs at most the frontier in every other term
+            remaining = sum(frontier) - frontier[position]
+            threshold = top[0][0] if len(top) == k else -1.0
+            if score + remaining <= threshold:
+                continue
+            for other, (count, documents, scores, _, _) in enumerate(terms):
+                if other == position:
+                    continue
+                remaining -= frontier[other]
+                found = bisect.bisect_left(documents, document)
+                if found < len(documents) and documents[found] == document:
+                    score += scores[found] * count
+                if score + remaining <= threshold:
+                    break
+            else:
+                if len(top) < k:
+                    heapq.heappush(top, (score, -document))
+                elif (score, -document) > top[0]:
+                    heapq.heapreplace(top, (score, -document))
+
+        return [(score, -negated) for score, negated in sorted(top, reverse=True)]
+
+    def answer(self, question):
+        """
+        Best passage for a question, if it scores well enough to be an answer
+
+        :param question: User input
+        :return: Passage text, or None
+        """
+        results = self.search(question, k=1, budget=self.answer_budget)
+        if not results or results[0][0] < self.min_score:
+            return None
+        return self.document(results[0][1])
+
+
+def install_index(index):
+    """
+    Make an index the one long_responses answers unknown questions from
+
+    :param index: FaqIndex, or None to answer with the canned replies only
+    :return: The previously active index
+    """
+    previous = _ACTIVE[0]
+    _ACTIVE[0] = index
+    return previous
+
+
+def active_index():
+    """
+    :return: FaqIndex currently answering unknown questions, None if there is none
+    """
+    return _ACTIVE[0]
+
+
+def synthetic_passages(count, seed=0, vocabulary_size=50000):
+    """
+    Deterministic random passages with a Zipf-like word distribution, for benchmarks
+
+    :param count: Number of passages
+    :param seed: Random seed
+    :param vocabulary_size: Distinct words drawn from
+    :return: Generator of passage texts
+    """
+    import random
+
+    rng = random.Random(seed)
+    alphabet = 'abcdefghijklmnopqrstuvwxyz'
+    vocabulary = [''.join(rng.choice(alphabet) for _ in range(rng.randint(3, 10))) for _ in range(vocabulary_size)]
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, vocabulary_size + 1)))
+    for _ in range(count):
+        words = rng.choices(vocabulary, cum_weights=weights, k=rng.randint(20, 120))
+        yield ' '.join(words).capitalize() + '.'
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Build, query and benchmark FAQ/manual BM25 indexes")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help="Index FAQ and manual files")
+    build.add_argument('index')
+    build.add_argument('sources', nargs='+', help="JSONL files (one passage per line) or text files "
+                                                  "(passages separated by blank lines)")
+    build.add_argument('--field', default='text', help="JSON field holding the passage text")
+    build.add_argument('--k1', type=float, default=DEFAULT_K1)
+    build.add_argument('--b', type=float, default=DEFAULT_B)
+
+    query = commands.add_parser('query', help="Show the best passages for a question")
+    query.add_argument('index')
+    query.add_argument('question')
+    query.add_argument('-k', type=int, default=3)
+
+    bench = commands.add_parser('bench', help="Time building and querying a synthetic index")
+    bench.add_argument('--passages', type=int, default=200000)
+    bench.add_argument('--queries', type=int, default=500)
+    bench.add_argument('--index', help="Where to write the index, a temporary file by default")
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        count = build_index(
+            itertools.chain.from_iterable(read_passages(source, args.field) for source in args.sources),
+            args.index, k1=args.k1, b=args.b
+        )
+        print(f"Indexed {count} passages into {args.index} ({os.path.getsize(args.index)} bytes) "
+              f"in {time.perf_counter() - start:.1f} s")
+    elif args.command == 'query':
+        index = FaqIndex(args.index)
+        for score, number in index.search(args.question, args.k):
+            print(json.dumps({'score': round(score, 3), 'document': number, 'text': index.document(number)}))
+    else:
+        work = None
+        path = args.index
+        if path is None:
+            work = tempfile.mkdtemp(prefix='faq-bench-')
+            path = os.path.join(work, 'bench.index')
+        try:
+            start = time.perf_counter()
+            build_index(synthetic_passages(args.passages), path)
+            built = time.perf_counter() - start
+            index = FaqIndex(path)
+
+            # Questions mix a few words of a real passage with frequent filler words
+            import random
+            rng = random.Random(1)
+            questions = []
+            for _ in range(args.queries):
+                words = index.document(rng.randrange(len(index))).rstrip('.').lower().split()
+                questions.append(' '.join(rng.sample(words, min(len(words), rng.randint(2, 8)))))
+            query_ms = {}
+            for k, budget in ((1, None), (10, None), (1, index.answer_budget)):
+                timings = []
+                for question in questions:
+                    start = time.perf_counter()
+                    index.search(question, k, budget)
+                    timings.append(time.perf_counter() - start)
+                query_ms[f'k={k}' + (f', budget={budget}' if budget else '')] = {
+                    'p50': round(_percentile(timings, 0.5) * 1000, 3),
+                    'p99': round(_percentile(timings, 0.99) * 1000, 3),
+                    'max': round(max(timings) * 1000, 3)
+                }
+            print(json.dumps({
+                'passages': len(index),
+                'terms': index.term_count,
+                'index_bytes': os.path.getsize(path),
+                'build_s': round(built, 2),
+                'query_ms': query_ms
+            }, indent=2))
+            index.close()
+        finally:
+            if work is not None:
+                shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main_cli()
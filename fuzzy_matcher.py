@@ -0,0 +1,197 @@
+import collections
+import functools
+from lazy_imports import lazy_import
+
+# Loaded on the first lookup that needs a ratio, not at import time
+difflib = lazy_import('difflib')
+
+# Both directions are kept because SequenceMatcher.ratio() is not strictly symmetric:
+# message_probability compares (user word, recognised word) but (required word, user word)
+FuzzyMatch = collections.namedtuple('FuzzyMatch', ['forward', 'reverse'])
+
+MATCHING_MODES = ('indexed', 'compat')
+
+
+def lcs_length(word1, word2):
+    """
+    Length of the longest common subsequence, using a bit-parallel scan
+
+    :param word1: First word
+    :param word2: Second word
+    :return: LCS length
+    """
+    if not word1 or not word2:
+        return 0
+
+    masks = {}
+    for position, char in enumerate(word2):
+        masks[char] = masks.get(char, 0) | (1 << position)
+
+    full = (1 << len(word2)) - 1
+    row = full
+    for char in word1:
+        matched = row & masks.get(char, 0)
+        row = ((row + matched) | (row - matched)) & full
+
+    return len(word2) - bin(row).count('1')
+
+
+def indel_distance(word1, word2):
+    """
+    Insert/delete edit distance, a metric bounding difflib's ratio from below
+
+    :param word1: First word
+    :param word2: Second word
+    :return: Number of insertions and deletions turning word1 into word2
+    """
+    return len(word1) + len(word2) - 2 * lcs_length(word1, word2)
+
+
+class _BKTree:
+    """BK-tree over indel distance for words of a single length"""
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, word):
+        if self.root is None:
+            self.root = (word, {})
+            return
+
+        node = self.root
+        while True:
+            distance = indel_distance(word, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (word, {})
+                return
+            node = child
+
+    def search(self, word, radius):
+        if self.root is None:
+            return []
+
+        found = []
+        stack = [self.root]
+        while stack:
+            node_word, children = stack.pop()
+            distance = indel_distance(word, node_word)
+            if distance <= radius:
+                found.append(node_word)
+            for child_distance, child in children.items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        return found
+
+
+class FuzzyMatcher:
+    """
+    Fuzzy lookup of vocabulary words within a difflib similarity threshold
+
+    In ``indexed`` mode candidates come from per-length BK-trees and are then
+    confirmed with difflib, so results are identical to the ``compat`` mode,
+    which compares the token against every vocabulary word as before.
+    Lookups are memoized per user token.
+    """
+
+    def __init__(self, vocabulary, threshold=0.6, mode='indexed', cache_size=4096):
+        """
+        :param vocabulary: Iterable of words to match against
+        :param threshold: Minimum SequenceMatcher ratio (0-1)
+        :param mode: 'indexed' or 'compat'
+        :param cache_size: Number of user tokens to memoize (0 disables memoization)
+        """
+        if mode not in MATCHING_MODES:
+            raise ValueError(f"Unknown matching mode '{mode}', expected one of {MATCHING_MODES}")
+
+        self.threshold = threshold
+        self.mode = mode
+        self.vocabulary = frozenset(vocabulary)
+
+        # Comparisons run on lowercase forms, as in advanced_word_similarity
+        self._originals = {}
+        for word in self.vocabulary:
+            self._originals.setdefault(word.lower(), []).append(word)
+
+        self._trees = {}
+        if mode == 'indexed':
+            for lowered in self._originals:
+                self._trees.setdefault(len(lowered), _BKTree()).add(lowered)
+
+        if cache_size:
+            self.lookup = functools.lru_cache(maxsize=cache_size)(self._lookup)
+        else:
+            self.lookup = self._lookup
+
+    def _candidates(self, lowered):
+        if self.mode == 'compat':
+            return self._originals.keys()
+
+        # ratio = 2M / (a + b) with M <= LCS, so a match needs indel distance <= (1 - t)(a + b)
+        found = []
+        size = len(lowered)
+        for length, tree in self._trees.items():
+            if 2 * min(size, length) < self.threshold * (size + length):
+                continue
+            radius = int((1 - self.threshold) * (size + length) + 1e-9)
+            found.extend(tree.search(lowered, radius))
+        return found
+
+    def _lookup(self, token):
+        lowered = token.lower()
+        forward = set()
+        reverse = set()
+        for candidate in self._candidates(lowered):
+            forward_match = difflib.SequenceMatcher(None, lowered, candidate).ratio() >= self.threshold
+            reverse_match = difflib.SequenceMatcher(None, candidate, lowered).ratio() >= self.threshold
+            for word in self._originals[candidate]:
+                if forward_match or token == word:
+                    forward.add(word)
+                if reverse_match:
+                    reverse.add(word)
+        return FuzzyMatch(frozenset(forward), frozenset(reverse))
+
+    def similar(self, user_word, word):
+        """
+        Equivalent of advanced_word_similarity(user_word, word) for vocabulary words
+
+        :param user_word: Word from the user message
+        :param word: Word to compare against
+        :return: Whether the words are similar enough
+        """
+        if word in self.vocabulary:
+            return word in self.lookup(user_word).forward
+        return difflib.SequenceMatcher(None, user_word.lower(), word.lower()).ratio() >= self.threshold
+
+    def similar_reverse(self, word, user_word):
+        """
+        Equivalent of advanced_word_similarity(word, user_word) for vocabulary words
+
+        :param word: Word to compare against
+        :param user_word: Word from the user message
+        :return: Whether the words are similar enough
+        """
+        if word in self.vocabulary:
+            return word in self.lookup(user_word).reverse
+        return difflib.SequenceMatcher(None, word.lower(), user_word.lower()).ratio() >= self.threshold
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    words = ['hello', 'hi', 'hey', 'dealership', 'vehicle', 'sedan', 'suv', 'truck', 'finance', 'loan',
+             'payment', 'maintain', 'service', 'repair', 'negotiate', 'price', 'deal', 'purchase', 'process']
+    rng = random.Random(0)
+    alphabet = 'abcdefghijklmnopqrstuvwxyz'
+    vocabulary = words + [''.join(rng.choice(alphabet) for _ in range(rng.randint(3, 12))) for _ in range(2000)]
+    tokens = [''.join(rng.choice(alphabet) for _ in range(rng.randint(2, 10))) for _ in range(300)]
+
+    for mode in MATCHING_MODES:
+        matcher = FuzzyMatcher(vocabulary, mode=mode, cache_size=0)
+        start = time.perf_counter()
+        results = [matcher.lookup(token) for token in tokens]
+        elapsed = time.perf_counter() - start
+        print(f"{mode:>8}: {len(tokens) / elapsed:,.0f} lookups/s over {len(vocabulary)} words")
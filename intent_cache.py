@@ -0,0 +1,142 @@
+import collections
+import sys
+import threading
+import time
+
+# Rough per-entry overhead of the OrderedDict node, the value tuple and the expiry float
+_ENTRY_OVERHEAD = 200
+
+
+class IntentCache:
+    """
+    Bounded LRU/TTL cache of intent matching results
+
+    Keys are normalized token tuples and values are the best intent ID and
+    score before the match threshold is applied, so rendering (and its random
+    template choice) still happens per request. Entries are dropped when the
+    registry they were computed against changes.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=4 * 1024 * 1024, ttl=None, clock=time.monotonic):
+        """
+        :param max_entries: Maximum number of cached messages
+        :param max_bytes: Approximate memory budget for keys and values
+        :param ttl: Seconds an entry stays valid, None to keep entries until evicted
+        :param clock: Monotonic time source
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._registry = None
+        self._version = None
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def normalize(message):
+        """
+        Cache key for a preprocessed message
+
+        Intent scores don't depend on word order, so the sorted tokens are used.
+
+        :param message: List of preprocessed words
+        :return: Tuple key
+        """
+        return tuple(sorted(message))
+
+    @staticmethod
+    def _entry_size(key):
+        return sys.getsizeof(key) + sum(sys.getsizeof(token) for token in key) + _ENTRY_OVERHEAD
+
+    def _check_registry(self, registry):
+        if registry is not self._registry or registry.version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.bytes = 0
+            self._registry = registry
+            self._version = registry.version
+
+    def get(self, key, registry):
+        """
+        :param key: Key from normalize()
+        :param registry: IntentRegistry the result must belong to
+        :return: (intent ID or None, score), or None on a miss
+        """
+        with self._lock:
+            self._check_registry(registry)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            result, expires_at, size = entry
+            if expires_at is not None and self._clock() >= expires_at:
+                del self._entries[key]
+                self.bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key, registry, intent_id, score):
+        """
+        :param key: Key from normalize()
+        :param registry: IntentRegistry the result was computed against
+        :param intent_id: Best intent ID, or None if no intent scored
+        :param score: Best score
+        """
+        size = self._entry_size(key)
+        if size > self.max_bytes:
+            return
+
+        expires_at = self._clock() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._check_registry(registry)
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[2]
+
+            self._entries[key] = ((intent_id, score), expires_at, size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self):
+        """Drop every entry, e.g. after intents were edited in place"""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+            self.invalidations += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        :return: Dict of hit/miss and eviction counters
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
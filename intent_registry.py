@@ -0,0 +1,184 @@
+import collections
+import threading
+from fuzzy_matcher import FuzzyMatcher
+
+_IntentFields = collections.namedtuple(
+    '_IntentFields',
+    ['intent_id', 'recognised_words', 'response', 'response_type', 'single_response', 'required_words'],
+    defaults=[None, None, False, ()]
+)
+
+
+class Intent(_IntentFields):
+    """
+    Immutable intent definition with a stable ID
+
+    An intent answers either with a fixed ``response`` string or with a
+    ``response_type`` key into ``long_responses.RESPONSE_TEMPLATES``, which is
+    rendered only once the intent has actually been selected.
+    """
+    __slots__ = ()
+
+    def __new__(cls, intent_id, recognised_words, response=None, response_type=None,
+                single_response=False, required_words=()):
+        if response is None and response_type is None:
+            raise ValueError(f"Intent '{intent_id}' needs a response or a response_type")
+        return super().__new__(
+            cls, intent_id, tuple(recognised_words), response, response_type,
+            bool(single_response), tuple(required_words)
+        )
+
+    @classmethod
+    def from_dict(cls, record):
+        """
+        Build an intent from a plain dict, e.g. one entry of a JSON intents file
+
+        :param record: Dict with intent_id, recognised_words and response or response_type
+        :return: Intent
+        :raises ValueError: If the record has unknown or missing fields
+        """
+        unknown = set(record) - set(cls._fields)
+        if unknown:
+            raise ValueError(f"Unknown intent fields: {', '.join(sorted(unknown))}")
+        if 'intent_id' not in record or 'recognised_words' not in record:
+            raise ValueError("Intent records need 'intent_id' and 'recognised_words'")
+        return cls(**record)
+
+    def to_dict(self):
+        """
+        :return: Plain dict that Intent.from_dict accepts
+        """
+        record = self._asdict()
+        record['recognised_words'] = list(self.recognised_words)
+        record['required_words'] = list(self.required_words)
+        return record
+
+
+class IntentRegistry:
+    """
+    Compiled intent table with an inverted index from vocabulary words to intents
+
+    Intents keep their registration order, which is also the tie-breaking
+    order when two intents reach the same score. Once every intent is added
+    the registry is read-only and safe to share between threads; to change
+    intents, build a new registry and swap it in (main.install_registry).
+    """
+
+    def __init__(self, intents=(), similarity_threshold=0.6, matching_mode='indexed', cache_size=4096,
+                 response_templates=None):
+        """
+        :param intents: Iterable of Intent definitions
+        :param similarity_threshold: Fuzzy match ratio used for word matching
+        :param matching_mode: FuzzyMatcher mode, 'indexed' or 'compat'
+        :param cache_size: Number of user tokens whose vocabulary matches are memoized
+        :param response_templates: Templates for response_type intents, long_responses.RESPONSE_TEMPLATES if None
+        """
+        self.response_templates = response_templates
+        self.similarity_threshold = similarity_threshold
+        self.matching_mode = matching_mode
+        self.cache_size = cache_size
+        self._intents = []
+        self._positions = {}
+        self._index = {}
+        self._matcher = None
+        self._matcher_lock = threading.Lock()
+        # Bumped on every change so caches of matching results can tell they are stale
+        self.version = 0
+        for intent in intents:
+            self.add(intent)
+
+    @classmethod
+    def from_compiled(cls, intents, index, **kwargs):
+        """
+        Build a registry around an index that was compiled ahead of time
+
+        :param intents: List of Intent definitions in registration order
+        :param index: Dict of word to list of intent positions, as built by add()
+        :param kwargs: Other IntentRegistry arguments
+        :return: IntentRegistry
+        :raises ValueError: If intent IDs are not unique
+        """
+        registry = cls(**kwargs)
+        registry._intents = list(intents)
+        registry._positions = {intent.intent_id: position for position, intent in enumerate(registry._intents)}
+        if len(registry._positions) != len(registry._intents):
+            raise ValueError("Duplicate intent IDs in compiled registry")
+        registry._index = index
+        registry.version += 1
+        return registry
+
+    def add(self, intent):
+        """
+        Register an intent and index its recognised and required words
+
+        :param intent: Intent definition
+        :raises ValueError: If the intent ID is already registered
+        """
+        if intent.intent_id in self._positions:
+            raise ValueError(f"Duplicate intent ID '{intent.intent_id}'")
+
+        position = len(self._intents)
+        self._intents.append(intent)
+        self._positions[intent.intent_id] = position
+        for word in set(intent.recognised_words) | set(intent.required_words):
+            self._index.setdefault(word, []).append(position)
+
+        # The vocabulary changed, so the fuzzy index and its memoized lookups are stale
+        self._matcher = None
+        self.version += 1
+
+    def get(self, intent_id):
+        """
+        Look up an intent by its ID
+
+        :param intent_id: Stable intent ID
+        :return: Intent definition
+        :raises KeyError: If no intent has that ID
+        """
+        return self._intents[self._positions[intent_id]]
+
+    @property
+    def vocabulary(self):
+        """All recognised and required words across the registered intents"""
+        return self._index.keys()
+
+    @property
+    def matcher(self):
+        """FuzzyMatcher over the current vocabulary, rebuilt after intents are added"""
+        matcher = self._matcher
+        if matcher is None:
+            # Threads asking at once share one build
+            with self._matcher_lock:
+                matcher = self._matcher
+                if matcher is None:
+                    matcher = self._matcher = FuzzyMatcher(
+                        self._index, threshold=self.similarity_threshold,
+                        mode=self.matching_mode, cache_size=self.cache_size
+                    )
+        return matcher
+
+    def __len__(self):
+        return len(self._intents)
+
+    def __iter__(self):
+        return iter(self._intents)
+
+    def __contains__(self, intent_id):
+        return intent_id in self._positions
+
+    def candidates(self, message):
+        """
+        Find the intents that share at least one (fuzzy) token with a message
+
+        Intents outside this set cannot score above zero, so they are never
+        evaluated.
+
+        :param message: List of preprocessed words
+        :return: Candidate intents in registration order
+        """
+        lookup = self.matcher.lookup
+        positions = set()
+        for token in set(message):
+            for word in lookup(token).forward:
+                positions.update(self._index[word])
+        return [self._intents[position] for position in sorted(positions)]
@@ -0,0 +1,169 @@
+import collections
+
+from tokenizer import WORD_PATTERN
+
+# Inflections accepted after a keyword, so 'sedan' also matches 'sedans' and 'buy' matches 'buying', but
+# 'sedan' doesn't match 'sedanx'
+DEFAULT_SUFFIXES = ('', 's', 'es', 'ing', 'ed')
+
+# Keywords shorter than this only match as written, so 'hi' doesn't match 'his'
+MIN_INFLECTED_LENGTH = 3
+
+_VOWELS = frozenset('aeiou')
+
+
+def inflections(keyword, suffixes=DEFAULT_SUFFIXES):
+    """
+    Word forms a keyword matches: each suffix appended, with a final 'e'
+    dropped before a vowel ('purchase' -> 'purchasing', 'purchased') and a
+    final consonant after a single vowel doubled ('plan' -> 'planned')
+
+    :param keyword: Lowercase keyword
+    :param suffixes: Endings the keyword may carry
+    :return: List of distinct forms, the keyword itself first if '' is a suffix
+    """
+    if len(keyword) < MIN_INFLECTED_LENGTH:
+        return [keyword] if '' in suffixes else []
+    forms = {}
+    for suffix in suffixes:
+        if suffix and suffix[0] in _VOWELS and keyword[-1] == 'e':
+            forms[keyword[:-1] + suffix] = None
+            continue
+        forms[keyword + suffix] = None
+        if not suffix or suffix[0] not in _VOWELS:
+            continue
+        if (keyword[-1] not in _VOWELS and keyword[-1] not in 'wxy' and keyword[-2] in _VOWELS and
+              keyword[-3] not in _VOWELS and suffix != 'es'):
+            forms[keyword + keyword[-1] + suffix] = None
+    return list(forms)
+
+
+def _is_word_char(char):
+    # Same character class as the regex \w
+    return char.isalnum() or char == '_'
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over topic keywords with word-boundary matching
+
+    Topics are given in priority order. A single pass over the text finds
+    every keyword occurrence that starts and ends on a word boundary, so the
+    cost depends on the length of the text, not on the number of keywords.
+    When every keyword is a single word, a whole-word occurrence is exactly
+    one of the text's word tokens, so find_topics() and best_topic() look the
+    tokens up in a table instead of walking the automaton per character.
+    """
+
+    def __init__(self, topics, suffixes=DEFAULT_SUFFIXES):
+        """
+        :param topics: Iterable of (topic, keywords) pairs, highest priority first
+        :param suffixes: Endings a keyword may carry and still match, see inflections()
+        """
+        self.topics = []
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        # Keyword and inflection to the priorities of the topics listing it, while every pattern is one word
+        self._word_priorities = {}
+
+        for priority, (topic, keywords) in enumerate(topics):
+            self.topics.append(topic)
+            for keyword in keywords:
+                keyword = keyword.lower()
+                for form in inflections(keyword, suffixes):
+                    self._add(form, priority, keyword)
+                    if self._word_priorities is not None and WORD_PATTERN.fullmatch(form):
+                        self._word_priorities.setdefault(form, []).append(priority)
+                    else:
+                        self._word_priorities = None
+        self._build_failure_links()
+
+    def _add(self, pattern, priority, keyword):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((len(pattern), priority, keyword))
+
+    def _build_failure_links(self):
+        queue = collections.deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._output[next_state].extend(self._output[self._fail[next_state]])
+
+    def _scan(self, text):
+        goto, fail, output = self._goto, self._fail, self._output
+        length = len(text)
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if not output[state]:
+                continue
+
+            end = position + 1
+            if end < length and _is_word_char(text[end]):
+                continue
+            for pattern_length, priority, keyword in output[state]:
+                start = end - pattern_length
+                if start > 0 and _is_word_char(text[start - 1]):
+                    continue
+                yield start, end, priority, keyword
+
+    def matches(self, text):
+        """
+        Find every whole-word keyword occurrence
+
+        :param text: Lowercase text to scan
+        :return: Generator of (start, end, topic, keyword)
+        """
+        for start, end, priority, keyword in self._scan(text):
+            yield start, end, self.topics[priority], keyword
+
+    def find_topics(self, text):
+        """
+        :param text: Lowercase text to scan
+        :return: Set of topics with at least one keyword in the text
+        """
+        if self._word_priorities is not None:
+            word_priorities = self._word_priorities
+            return {self.topics[priority] for word in WORD_PATTERN.findall(text)
+                    for priority in word_priorities.get(word, ())}
+        return {self.topics[priority] for _, _, priority, _ in self._scan(text)}
+
+    def best_topic(self, text):
+        """
+        Highest-priority topic present in the text
+
+        :param text: Lowercase text to scan
+        :return: Topic, or None if no keyword occurs
+        """
+        best = None
+        if self._word_priorities is not None:
+            word_priorities = self._word_priorities
+            for word in WORD_PATTERN.findall(text):
+                priorities = word_priorities.get(word)
+                if priorities is not None and (best is None or priorities[0] < best):
+                    best = priorities[0]
+            return self.topics[best] if best is not None else None
+
+        for _, _, priority, _ in self._scan(text):
+            if best is None or priority < best:
+                best = priority
+                if best == 0:
+                    break
+        return self.topics[best] if best is not None else None
@@ -0,0 +1,552 @@
+import argparse
+import array
+import collections
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11, TOML knowledge files are unavailable
+    tomllib = None
+
+import main as chatbot
+import long_responses
+import auto_dealership_knowledge
+import auto_bot
+import template_engine
+import tenant_context
+from intent_registry import Intent, IntentRegistry
+
+MAGIC = b'CBKS'
+FORMAT_VERSION = 2
+
+# magic, format version, section count, sha256 of the source file
+_HEADER = struct.Struct('<4sII32s')
+# section name, offset, length
+_SECTION = struct.Struct('<4sQQ')
+
+_NONE = 0xFFFFFFFF
+
+# Generic document nodes: (kind, a, b); integers and floats are indexes into the INTS and FLTS sections,
+# integers beyond 64 bits are stored as decimal strings
+_NULL, _FALSE, _TRUE, _INTEGER, _STRING, _LIST, _DICT, _FLOAT, _BIG_INTEGER = range(9)
+
+# Sections every snapshot of this version has; one missing means the file is damaged and gets recompiled
+REQUIRED_SECTIONS = (b'STRO', b'STRB', b'VOCB', b'INTN', b'IWRD', b'POSO', b'POST', b'NODE', b'CHLD', b'ROOT',
+                     b'INTS', b'FLTS')
+
+# Sections of the source file that map onto AutoDealershipKnowledge constants
+KNOWLEDGE_CONSTANTS = (
+    'VEHICLE_TYPES',
+    'BUYING_PROCESS_STEPS',
+    'FINANCING_OPTIONS',
+    'NEGOTIATION_TIPS',
+    'MAINTENANCE_ADVICE',
+    'TOPIC_KEYWORDS'
+)
+
+Knowledge = collections.namedtuple(
+    'Knowledge', ['snapshot', 'registry', 'intent_cache', 'response_templates', 'knowledge', 'auto_knowledge', 'bot']
+)
+Knowledge.__doc__ = """
+Everything loaded from one snapshot, published as one immutable bundle by
+KnowledgeStore; auto_knowledge is the (knowledge class, topic automaton,
+KnowledgeBlocks) triple auto_dealership_knowledge answers from
+"""
+
+
+def export_source():
+    """
+    Collect the built-in intents, templates and knowledge as a source document
+
+    :return: Dict in the knowledge file format
+    """
+    bot = auto_bot.AutoDealershipBot()
+    return {
+        'intents': [intent.to_dict() for intent in chatbot.DEALERSHIP_INTENTS],
+        'response_templates': long_responses.RESPONSE_TEMPLATES,
+        'knowledge': {
+            name.lower(): getattr(auto_dealership_knowledge.AutoDealershipKnowledge, name)
+            for name in KNOWLEDGE_CONSTANTS
+        },
+        'bot': {'knowledge_base': bot.knowledge_base, 'response_templates': bot.response_templates}
+    }
+
+
+def load_source(path):
+    """
+    Parse a JSON or TOML knowledge file
+
+    :param path: Path ending in .json or .toml
+    :return: Source document dict
+    :raises ValueError: If the format is unsupported or the document is malformed
+    """
+    with open(path, 'rb') as source_file:
+        data = source_file.read()
+
+    if path.endswith('.toml'):
+        if tomllib is None:
+            raise ValueError("TOML knowledge files need Python 3.11+ (tomllib)")
+        source = tomllib.loads(data.decode('utf-8'))
+    else:
+        source = json.loads(data)
+
+    if not isinstance(source, dict) or not isinstance(source.get('intents'), list):
+        raise ValueError(f"{path} needs a top-level 'intents' list")
+    for record in source['intents']:
+        Intent.from_dict(record)
+    return source
+
+
+def source_digest(path):
+    with open(path, 'rb') as source_file:
+        return hashlib.sha256(source_file.read()).digest()
+
+
+class _StringTable:
+    def __init__(self):
+        self.ids = {}
+        self.offsets = array.array('I', [0])
+        self.blob = bytearray()
+
+    def add(self, value):
+        if value is None:
+            return _NONE
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = self.ids[value] = len(self.offsets) - 1
+            self.blob += value.encode('utf-8')
+            self.offsets.append(len(self.blob))
+        return string_id
+
+
+def _encode_document(document, strings):
+    nodes = array.array('I')
+    children = array.array('I')
+    integers = array.array('q')
+    floats = array.array('d')
+
+    def encode(value):
+        # Children are encoded first so their node IDs exist when the parent is written
+        if value is None:
+            kind, a, b = _NULL, 0, 0
+        elif value is True or value is False:
+            kind, a, b = (_TRUE if value else _FALSE), 0, 0
+        elif isinstance(value, float):
+            # Binary, so inf and nan (valid TOML) survive as they are
+            kind, a, b = _FLOAT, len(floats), 0
+            floats.append(value)
+        elif isinstance(value, int):
+            if -2 ** 63 <= value < 2 ** 63:
+                kind, a, b = _INTEGER, len(integers), 0
+                integers.append(value)
+            else:
+                kind, a, b = _BIG_INTEGER, strings.add(str(value)), 0
+        elif isinstance(value, str):
+            kind, a, b = _STRING, strings.add(value), 0
+        elif isinstance(value, (list, tuple)):
+            items = [encode(item) for item in value]
+            kind, a, b = _LIST, len(children), len(items)
+            children.extend(items)
+        elif isinstance(value, dict):
+            pairs = [(strings.add(str(key)), encode(item)) for key, item in value.items()]
+            kind, a, b = _DICT, len(children), len(pairs)
+            for pair in pairs:
+                children.extend(pair)
+        else:
+            raise ValueError(f"Unsupported value in knowledge file: {value!r}")
+        nodes.extend((kind, a, b))
+        return len(nodes) // 3 - 1
+
+    root = encode(document)
+    return root, nodes, children, integers, floats
+
+
+def compile_snapshot(source, digest, path):
+    """
+    Compile a source document into a binary snapshot
+
+    The file is written next to its destination and renamed into place, so
+    readers never see a partial snapshot.
+
+    :param source: Source document from load_source
+    :param digest: sha256 digest of the source file, stored for staleness checks
+    :param path: Destination path
+    """
+    strings = _StringTable()
+    intents = [Intent.from_dict(record) for record in source['intents']]
+
+    vocabulary = sorted({word for intent in intents for word in intent.recognised_words + intent.required_words})
+    vocabulary_ids = {word: number for number, word in enumerate(vocabulary)}
+    vocabulary_strings = array.array('I', (strings.add(word) for word in vocabulary))
+
+    records = array.array('I')
+    words = array.array('I')
+    postings_by_word = [[] for _ in vocabulary]
+    for position, intent in enumerate(intents):
+        recognised_start = len(words)
+        words.extend(vocabulary_ids[word] for word in intent.recognised_words)
+        required_start = len(words)
+        words.extend(vocabulary_ids[word] for word in intent.required_words)
+        records.extend((
+            strings.add(intent.intent_id), strings.add(intent.response), strings.add(intent.response_type),
+            int(intent.single_response),
+            recognised_start, len(intent.recognised_words), required_start, len(intent.required_words)
+        ))
+        for word in set(intent.recognised_words) | set(intent.required_words):
+            postings_by_word[vocabulary_ids[word]].append(position)
+
+    posting_offsets = array.array('I', [0])
+    postings = array.array('I')
+    for positions in postings_by_word:
+        postings.extend(positions)
+        posting_offsets.append(len(postings))
+
+    document = {key: value for key, value in source.items() if key != 'intents'}
+    root, nodes, children, integers, floats = _encode_document(document, strings)
+
+    sections = [
+        (b'STRO', strings.offsets),
+        (b'STRB', bytes(strings.blob)),
+        (b'VOCB', vocabulary_strings),
+        (b'INTN', records),
+        (b'IWRD', words),
+        (b'POSO', posting_offsets),
+        (b'POST', postings),
+        (b'NODE', nodes),
+        (b'CHLD', children),
+        (b'ROOT', array.array('I', [root])),
+        (b'INTS', integers),
+        (b'FLTS', floats)
+    ]
+
+    payloads = []
+    for name, data in sections:
+        if isinstance(data, array.array):
+            if sys.byteorder != 'little':
+                data = array.array(data.typecode, data)
+                data.byteswap()
+            data = data.tobytes()
+        payloads.append((name, data))
+
+    offset = _HEADER.size + _SECTION.size * len(payloads)
+    table = []
+    for name, data in payloads:
+        offset += -offset % 8
+        table.append((name, offset, len(data)))
+        offset += len(data)
+
+    temporary = f'{path}.tmp{os.getpid()}'
+    with open(temporary, 'wb') as snapshot_file:
+        snapshot_file.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(payloads), digest))
+        for entry in table:
+            snapshot_file.write(_SECTION.pack(*entry))
+        for (name, section_offset, _), (_, data) in zip(table, payloads):
+            snapshot_file.write(b'\0' * (section_offset - snapshot_file.tell()))
+            snapshot_file.write(data)
+    os.replace(temporary, path)
+
+
+class KnowledgeSnapshot:
+    """
+    Read-only, memory-mapped view of a compiled knowledge snapshot
+
+    Integer arrays are read in place through memoryviews and strings are
+    decoded on demand, so opening a snapshot costs no parsing. The map itself
+    is shared between processes, but what build_knowledge makes of it is not:
+    each process decodes the intents and the document into Python objects and
+    builds its own fuzzy matcher and topic automaton from them. Forked
+    workers (see prefork.py) share those copy-on-write instead.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Snapshot file
+        :raises ValueError: If the file is not a snapshot of the supported version
+        """
+        self.path = path
+        with open(path, 'rb') as snapshot_file:
+            self._mmap = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+
+        magic, version, section_count, self.source_digest = _HEADER.unpack_from(view, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} knowledge snapshot")
+
+        self._sections = {}
+        for number in range(section_count):
+            name, offset, length = _SECTION.unpack_from(view, _HEADER.size + number * _SECTION.size)
+            if offset + length > len(view):
+                self.close()
+                raise ValueError(f"{path} is truncated")
+            self._sections[name] = view[offset:offset + length]
+        missing = [name.decode('ascii', 'replace') for name in REQUIRED_SECTIONS if name not in self._sections]
+        if missing:
+            self.close()
+            raise ValueError(f"{path} lacks snapshot sections: {', '.join(missing)}")
+
+        self._string_offsets = self._array(b'STRO')
+        self._string_blob = self._sections[b'STRB']
+        self._strings = {}
+
+    def _array(self, name, typecode='I'):
+        data = self._sections[name]
+        if sys.byteorder != 'little':
+            values = array.array(typecode, data.tobytes())
+            values.byteswap()
+            return values
+        return data.cast(typecode)
+
+    def close(self):
+        self._sections = {}
+        self._string_offsets = self._string_blob = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Views handed out by this snapshot are still alive; the map closes when they are released
+            pass
+
+    def string(self, string_id):
+        """
+        :param string_id: Index into the string table
+        :return: Decoded string, None for the missing-value marker
+        """
+        if string_id == _NONE:
+            return None
+        value = self._strings.get(string_id)
+        if value is None:
+            start, end = self._string_offsets[string_id], self._string_offsets[string_id + 1]
+            value = self._strings[string_id] = bytes(self._string_blob[start:end]).decode('utf-8')
+        return value
+
+    @property
+    def vocabulary(self):
+        """Vocabulary words, where a word's position is its vocabulary ID"""
+        return [self.string(string_id) for string_id in self._array(b'VOCB')]
+
+    def intents(self):
+        """
+        :return: List of Intent definitions in registration order
+        """
+        vocabulary = self.vocabulary
+        records = self._array(b'INTN')
+        words = self._array(b'IWRD')
+        intents = []
+        for start in range(0, len(records), 8):
+            (intent_id, response, response_type, single_response,
+             recognised_start, recognised_count, required_start, required_count) = records[start:start + 8]
+            intents.append(Intent(
+                self.string(intent_id),
+                [vocabulary[word] for word in words[recognised_start:recognised_start + recognised_count]],
+                response=self.string(response),
+                response_type=self.string(response_type),
+                single_response=bool(single_response),
+                required_words=[vocabulary[word] for word in words[required_start:required_start + required_count]]
+            ))
+        return intents
+
+    def inverted_index(self):
+        """
+        :return: Dict of vocabulary word to intent positions, read from the precompiled postings
+        """
+        offsets = self._array(b'POSO')
+        postings = self._array(b'POST')
+        return {
+            word: postings[offsets[number]:offsets[number + 1]].tolist()
+            for number, word in enumerate(self.vocabulary)
+        }
+
+    def document(self):
+        """
+        :return: Everything but the intents (templates, knowledge, bot), decoded to Python objects
+        """
+        nodes = self._array(b'NODE')
+        children = self._array(b'CHLD')
+        integers = self._array(b'INTS', 'q')
+        floats = self._array(b'FLTS', 'd')
+
+        def decode(node):
+            kind, a, b = nodes[node * 3:node * 3 + 3]
+            if kind == _NULL:
+                return None
+            if kind in (_TRUE, _FALSE):
+                return kind == _TRUE
+            if kind == _INTEGER:
+                return integers[a]
+            if kind == _FLOAT:
+                return floats[a]
+            if kind == _BIG_INTEGER:
+                return int(self.string(a))
+            if kind == _STRING:
+                return self.string(a)
+            if kind == _LIST:
+                return [decode(child) for child in children[a:a + b]]
+            return {self.string(children[a + 2 * i]): decode(children[a + 2 * i + 1]) for i in range(b)}
+
+        return decode(self._array(b'ROOT')[0])
+
+    def registry(self, **kwargs):
+        """
+        Intent registry built from the precompiled index, without re-indexing
+
+        :param kwargs: Other IntentRegistry arguments
+        :return: IntentRegistry
+        """
+        return IntentRegistry.from_compiled(self.intents(), self.inverted_index(), **kwargs)
+
+
+def load_snapshot(source_path, snapshot_path=None):
+    """
+    Open the snapshot for a knowledge file, recompiling it only when stale
+
+    A snapshot is reused when its stored digest matches the source file, so
+    startup skips parsing the source and building the inverted index.
+
+    :param source_path: JSON or TOML knowledge file
+    :param snapshot_path: Snapshot location, source_path + '.snapshot' by default
+    :return: KnowledgeSnapshot
+    """
+    snapshot_path = snapshot_path or source_path + '.snapshot'
+    digest = source_digest(source_path)
+
+    if os.path.exists(snapshot_path):
+        try:
+            snapshot = KnowledgeSnapshot(snapshot_path)
+        except (ValueError, struct.error):
+            snapshot = None
+        if snapshot is not None:
+            if snapshot.source_digest == digest:
+                return snapshot
+            snapshot.close()
+
+    compile_snapshot(load_source(source_path), digest, snapshot_path)
+    return KnowledgeSnapshot(snapshot_path)
+
+
+def build_knowledge(snapshot):
+    """
+    Turn a snapshot into the objects the bot runs on
+
+    Everything is decoded and built in this process, only the inverted index
+    comes precompiled.
+
+    :param snapshot: KnowledgeSnapshot
+    :return: Knowledge bundle
+    """
+    document = snapshot.document()
+    templates = document.get('response_templates')
+    templates = template_engine.precompile(templates) if templates else long_responses.RESPONSE_TEMPLATES
+    overrides = {
+        name: value for name, value in
+        ((name, document.get('knowledge', {}).get(name.lower())) for name in KNOWLEDGE_CONSTANTS)
+        if value is not None
+    }
+    knowledge = auto_dealership_knowledge.derive_knowledge(overrides)
+    return Knowledge(
+        snapshot=snapshot,
+        registry=snapshot.registry(response_templates=templates),
+        # The shared cache keys its entries on the registry, so another registry never sees them
+        intent_cache=chatbot.INTENT_CACHE,
+        response_templates=templates,
+        knowledge=knowledge,
+        # Compiled and rendered while the bundle is built, before reload() publishes it
+        auto_knowledge=(knowledge, auto_dealership_knowledge.build_topic_automaton(knowledge),
+                        knowledge.rendered_blocks()),
+        bot=document.get('bot', {})
+    )
+
+
+class KnowledgeStore:
+    """
+    Loads knowledge from a file and hot-swaps it into the running bot
+
+    reload() builds the complete new Knowledge bundle first and then publishes
+    it with a single reference assignment (tenant_context.install). Each
+    request pins the bundle it starts with, so requests in flight keep
+    working on it and none sees new templates with the old registry.
+    """
+
+    def __init__(self, source_path, snapshot_path=None):
+        """
+        :param source_path: JSON or TOML knowledge file
+        :param snapshot_path: Snapshot location, source_path + '.snapshot' by default
+        """
+        self.source_path = source_path
+        self.snapshot_path = snapshot_path
+        self.current = None
+        self._lock = threading.Lock()
+
+    def reload(self):
+        """
+        Load the knowledge file (or its valid snapshot) and install it
+
+        :return: The installed Knowledge bundle
+        """
+        with self._lock:
+            knowledge = build_knowledge(load_snapshot(self.source_path, self.snapshot_path))
+            self.install(knowledge)
+            # The old snapshot's arrays may still be referenced by in-flight requests;
+            # its map is released once they drop it
+            self.current = knowledge
+            return knowledge
+
+    @staticmethod
+    def install(knowledge):
+        """
+        :param knowledge: Knowledge bundle to make active
+        """
+        tenant_context.install(knowledge)
+
+    def bot(self):
+        """
+        :return: AutoDealershipBot configured from the current knowledge
+        """
+        bot_config = self.current.bot if self.current is not None else {}
+        return auto_bot.AutoDealershipBot(
+            knowledge_base=bot_config.get('knowledge_base'),
+            response_templates=bot_config.get('response_templates')
+        )
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Export, compile and inspect knowledge snapshots")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export = commands.add_parser('export', help="Write the built-in knowledge as a JSON knowledge file")
+    export.add_argument('path')
+
+    compile_command = commands.add_parser('compile', help="Compile a knowledge file into a snapshot")
+    compile_command.add_argument('source')
+    compile_command.add_argument('--output', help="Snapshot path, SOURCE.snapshot by default")
+
+    info = commands.add_parser('info', help="Describe a snapshot")
+    info.add_argument('snapshot')
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        with open(args.path, 'w', encoding='utf-8') as export_file:
+            json.dump(export_source(), export_file, indent=2)
+            export_file.write('\n')
+    elif args.command == 'compile':
+        output = args.output or args.source + '.snapshot'
+        compile_snapshot(load_source(args.source), source_digest(args.source), output)
+        print(f"Wrote {output} ({os.path.getsize(output)} bytes)")
+    else:
+        snapshot = KnowledgeSnapshot(args.snapshot)
+        print(json.dumps({
+            'format_version': FORMAT_VERSION,
+            'source_sha256': snapshot.source_digest.hex(),
+            'intents': len(snapshot.intents()),
+            'vocabulary': len(snapshot.vocabulary),
+            'sections': {name.decode(): len(data) for name, data in snapshot._sections.items()}
+        }, indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,79 @@
+import collections
+import math
+import threading
+
+
+def percentile(sorted_values, fraction):
+    """
+    Nearest-rank percentile of an already sorted sequence
+
+    :param sorted_values: Values in ascending order
+    :param fraction: Percentile as a fraction (0-1), e.g. 0.99
+    :return: Percentile value, or 0.0 for an empty sequence
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(fraction * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class LatencyRecorder:
+    """
+    Thread-safe latency recorder keeping a bounded window of recent samples
+
+    Counts and totals cover every recorded sample; percentiles are computed
+    over the most recent ``max_samples`` only, so memory stays fixed.
+    """
+
+    PERCENTILES = (('p50', 0.50), ('p95', 0.95), ('p99', 0.99), ('p999', 0.999))
+
+    def __init__(self, max_samples=100000):
+        """
+        :param max_samples: Number of recent samples kept for percentiles
+        """
+        self._samples = collections.deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def record(self, seconds):
+        """
+        Record one latency sample
+
+        :param seconds: Elapsed time in seconds
+        """
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+            if seconds > self.maximum:
+                self.maximum = seconds
+
+    def percentile(self, fraction):
+        """
+        :param fraction: Percentile as a fraction (0-1)
+        :return: Latency in seconds
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        return percentile(samples, fraction)
+
+    def summary(self):
+        """
+        Summarize the recorded latencies in milliseconds
+
+        :return: Dict with count, mean, percentiles and max
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+            count, total, maximum = self.count, self.total, self.maximum
+
+        report = {
+            'count': count,
+            'mean_ms': (total / count) * 1000 if count else 0.0,
+        }
+        for name, fraction in self.PERCENTILES:
+            report[f'{name}_ms'] = percentile(samples, fraction) * 1000
+        report['max_ms'] = maximum * 1000
+        return report
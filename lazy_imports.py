@@ -0,0 +1,65 @@
+import importlib
+import importlib.util
+import sys
+import threading
+
+
+class _LazyModule:
+    """
+    Stands in for a module until one of its attributes is first used
+
+    The import runs through importlib.import_module under a lock, so threads
+    touching the module at the same time all wait for one complete import;
+    importlib.util.LazyLoader isn't safe for that before Python 3.12.3. Every
+    attribute is read from the real module, so names it rebinds later (e.g.
+    auto_dealership_knowledge._ACTIVE) are never stale.
+    """
+    __slots__ = ('_name', '_module', '_lock')
+
+    def __init__(self, name):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_module', None)
+        object.__setattr__(self, '_lock', threading.RLock())
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            with self._lock:
+                module = self._module
+                if module is None:
+                    module = importlib.import_module(self._name)
+                    object.__setattr__(self, '_module', module)
+        return module
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        if self._module is None:
+            return f"<lazy module '{self._name}' (not loaded)>"
+        return repr(self._module)
+
+
+def lazy_import(name):
+    """
+    Import a module on first attribute access instead of right away
+
+    The module isn't imported, nor put in sys.modules, until then; after that
+    it is an ordinary module and other imports of it are unaffected.
+
+    :param name: Absolute module name
+    :return: The module if already imported, otherwise a proxy loading it the first time an attribute is used
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+
+    if importlib.util.find_spec(name) is None:
+        raise ImportError(f"No module named '{name}'", name=name)
+    return _LazyModule(name)
@@ -0,0 +1,447 @@
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import random
+import string
+
+import admission
+import main as chatbot
+import threaded_responder
+from chat_client import ChatClient
+from chat_server import DEFAULT_HOST, DEFAULT_PORT
+from latency_stats import LatencyRecorder, percentile
+
+# Message templates per traffic class; {vehicle} and {amount} are filled in per message
+TRAFFIC_CLASSES = {
+    'greeting': [
+        "hello",
+        "hi there",
+        "hey, anyone around?",
+        "good morning",
+        "thanks, bye",
+        "goodbye and thanks for the help",
+    ],
+    'vehicle': [
+        "do you have any {vehicle} in stock",
+        "I want to buy a {vehicle}",
+        "tell me about your {vehicle} models",
+        "what {vehicle} would you recommend for a family",
+        "how often should I service a {vehicle}",
+        "can we negotiate the price of that {vehicle}",
+    ],
+    'financing': [
+        "what financing options do you have?",
+        "what loan rates do you offer",
+        "I can afford ${amount} a month",
+        "what would a ${amount} car cost per month",
+        "how does leasing work compared to a loan",
+    ],
+    'gibberish': [],
+    'long': [
+        "I have been thinking about what I actually want from my next car for a long time now and I would really "
+        "appreciate it if somebody could walk me through everything I should consider before I make a final "
+        "decision, from fuel economy and insurance to resale value, maintenance schedules and how the warranty "
+        "works when something goes wrong a few years down the road.",
+        "My family is growing and the little hatchback we bought five years ago is no longer practical for school "
+        "runs, weekend trips to the mountains and the occasional move of furniture for relatives, so I am trying "
+        "to understand whether a larger {vehicle} makes more sense than a minivan, how the running costs compare, "
+        "what the trade-in value of our current car might be, and whether it is smarter to finance over a longer "
+        "term with a lower monthly payment or to put more money down now and pay it off quickly.",
+        "Artificial intelligence represents a paradigm shift in computational capabilities, enabling machines to "
+        "learn from data, recognize patterns, and make decisions with increasing sophistication. The evolution of "
+        "neural networks and deep learning algorithms has dramatically expanded the potential applications of AI "
+        "across diverse domains, from predictive analytics in healthcare to autonomous navigation systems in "
+        "transportation, and from personalized education platforms to advanced robotics in manufacturing.",
+    ],
+}
+
+VEHICLES = ['sedan', 'suv', 'truck', 'pickup', 'hatchback', 'minivan', 'coupe']
+
+# Share of requests per traffic class, roughly what the chat widget sees
+DEFAULT_MIX = {'greeting': 20, 'vehicle': 35, 'financing': 25, 'gibberish': 10, 'long': 10}
+
+# Latency of one request is only recorded once, so percentiles stay exact up to this many requests per run
+MAX_SAMPLES = 1000000
+
+
+def parse_mix(text):
+    """
+    Parse a traffic mix given as ``class=weight`` pairs
+
+    :param text: E.g. "greeting=20,financing=50,long=30"
+    :return: Dict of class name to weight
+    :raises ValueError: If a class is unknown or a weight isn't a non-negative number
+    """
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in TRAFFIC_CLASSES:
+            raise ValueError(f"Unknown traffic class '{name}', expected one of {sorted(TRAFFIC_CLASSES)}")
+        mix[name] = float(weight)
+        if mix[name] < 0:
+            raise ValueError(f"Weight of '{name}' must not be negative")
+    if not any(mix.values()):
+        raise ValueError("The mix needs at least one class with a positive weight")
+    return mix
+
+
+def _message(kind, rng):
+    if kind == 'gibberish':
+        return ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 16)))
+    template = rng.choice(TRAFFIC_CLASSES[kind])
+    return template.format(vehicle=rng.choice(VEHICLES), amount=rng.choice([300, 450, 600, 18000, 32000]))
+
+
+def synthetic_traffic(count, mix=None, seed=0, conversations=100, max_turns=8):
+    """
+    Requests from interleaved synthetic conversations
+
+    Every request's class is drawn from the mix, so the traffic follows it.
+    A fixed number of conversations is active at once and every request
+    continues a random one of them, so sessions interleave as they do on a
+    live site; greetings go to conversations that haven't opened yet when
+    there are any, so conversations tend to open with one.
+
+    :param count: Number of requests
+    :param mix: Dict of traffic class to weight, DEFAULT_MIX if None
+    :param seed: Seed for the generated traffic
+    :param conversations: Conversations active at the same time
+    :param max_turns: Longest conversation, in requests
+    :return: Generator of (session ID, traffic class, message)
+    """
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    kinds = [kind for kind, weight in mix.items() if weight > 0]
+    weights = [mix[kind] for kind in kinds]
+    sessions = 0
+    # Each active conversation: [session ID, turns left, whether it has yet to open]
+    active = []
+    for _ in range(count):
+        if len(active) < conversations:
+            sessions += 1
+            active.append([f'load-{sessions}', rng.randint(1, max_turns), True])
+        kind = rng.choices(kinds, weights)[0]
+        unopened = [slot for slot, conversation in enumerate(active) if conversation[2]] if kind == 'greeting' else ()
+        slot = rng.choice(unopened) if unopened else rng.randrange(len(active))
+        conversation = active[slot]
+        session_id, turns_left, _ = conversation
+        yield session_id, kind, _message(kind, rng)
+        if turns_left <= 1:
+            active[slot] = active[-1]
+            active.pop()
+        else:
+            conversation[1:] = [turns_left - 1, False]
+
+
+def arrival_offsets(count, rate, process='poisson', seed=0):
+    """
+    Send times of an open-loop run, in seconds from its start
+
+    :param count: Number of requests
+    :param rate: Target requests per second
+    :param process: 'poisson' for exponential gaps, 'uniform' for evenly spaced requests
+    :param seed: Seed for the Poisson gaps
+    :return: List of offsets
+    """
+    if process == 'uniform':
+        return [index / rate for index in range(count)]
+    if process != 'poisson':
+        raise ValueError(f"Unknown arrival process '{process}', expected 'poisson' or 'uniform'")
+    rng = random.Random(seed)
+    offsets = []
+    offset = 0.0
+    for _ in range(count):
+        offsets.append(offset)
+        offset += rng.expovariate(rate)
+    return offsets
+
+
+class InProcessTarget:
+    """main.get_response called from a pool of threads, or through an admission.AdmissionController"""
+
+    def __init__(self, concurrency, warmup=True, controller=None):
+        """
+        :param concurrency: Threads answering requests
+        :param warmup: Whether to build every lazily built index before the run
+        :param controller: AdmissionController to send requests through; it brings its own workers
+        """
+        if warmup:
+            threaded_responder.warm_up()
+        self.controller = controller
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) if controller is None else None
+        self._fallback = {}
+
+    def prepare(self, messages):
+        # Whether a message takes the fallback path depends only on its text, so distinct messages are
+        # classified once up front instead of timing a second intent match per request
+        distinct = [message for message in set(messages) if message not in self._fallback]
+        for message, (intent, _) in zip(distinct, chatbot.match_intents(distinct)):
+            self._fallback[message] = intent is None
+
+    async def send(self, session_id, message):
+        if self.controller is not None:
+            # Admission is decided on arrival; the controller queues admitted requests itself
+            await asyncio.wrap_future(self.controller.submit(message, session_id))
+        else:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, chatbot.get_response, message, session_id)
+        return self._fallback[message]
+
+    async def close(self):
+        if self.controller is not None:
+            self.controller.close()
+        else:
+            self.executor.shutdown(wait=True)
+
+
+class ServerTarget:
+    """A running chat_server.py, one request in flight per connection"""
+
+    def __init__(self, concurrency, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """
+        :param concurrency: Connections to open
+        :param host: Server host
+        :param port: Server port
+        """
+        self.concurrency = concurrency
+        self.host = host
+        self.port = port
+        self._idle = None
+
+    def prepare(self, messages):
+        pass
+
+    async def _connect(self):
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            clients = await asyncio.gather(*(ChatClient(self.host, self.port).connect()
+                                             for _ in range(self.concurrency)))
+            for client in clients:
+                self._idle.put_nowait(client)
+
+    async def send(self, session_id, message):
+        await self._connect()
+        # Waiting for a free connection counts toward the request's latency, as queueing would on a real client
+        client = await self._idle.get()
+        try:
+            reply = await client.request({'session': session_id, 'message': message})
+        finally:
+            self._idle.put_nowait(client)
+        if 'error' in reply:
+            raise RuntimeError(reply['error'])
+        return reply['fallback']
+
+    async def close(self):
+        if self._idle is not None:
+            while not self._idle.empty():
+                await self._idle.get_nowait().close()
+            self._idle = None
+
+
+class _Window:
+    __slots__ = ('latencies', 'fallbacks', 'errors')
+
+    def __init__(self):
+        self.latencies = []
+        self.fallbacks = 0
+        self.errors = 0
+
+
+async def run_load(target, traffic, rate, process='poisson', interval=1.0, seed=0):
+    """
+    Drive a target with traffic in open loop at a fixed request rate
+
+    Requests are sent on schedule whether or not earlier ones have finished,
+    and each latency is measured from the request's scheduled send time, so
+    queueing behind a saturated target shows up in the percentiles instead of
+    silently lowering the offered load.
+
+    :param target: InProcessTarget or ServerTarget
+    :param traffic: List of (session ID, traffic class, message), e.g. from synthetic_traffic()
+    :param rate: Target requests per second
+    :param process: Arrival process, see arrival_offsets()
+    :param interval: Width of the latency-over-time windows, in seconds
+    :param seed: Seed for the arrival times
+    :return: Dict with throughput, latency percentiles, fallback share, the share of each class sent,
+        per-class and per-window results
+    """
+    target.prepare([message for _, _, message in traffic])
+    offsets = arrival_offsets(len(traffic), rate, process, seed)
+    latency = LatencyRecorder(max_samples=min(len(traffic), MAX_SAMPLES) or 1)
+    by_class = collections.defaultdict(lambda: LatencyRecorder(max_samples=min(len(traffic), MAX_SAMPLES) or 1))
+    windows = collections.defaultdict(_Window)
+    counts = collections.Counter()
+    send_lag = 0.0
+    loop = asyncio.get_running_loop()
+
+    async def request(scheduled, session_id, kind, message):
+        try:
+            fallback = await target.send(session_id, message)
+        except Exception:
+            counts['errors'] += 1
+            windows[int((loop.time() - start) // interval)].errors += 1
+            return
+        finished = loop.time()
+        elapsed = finished - scheduled
+        latency.record(elapsed)
+        by_class[kind].record(elapsed)
+        window = windows[int((finished - start) // interval)]
+        window.latencies.append(elapsed)
+        if fallback:
+            counts['fallbacks'] += 1
+            window.fallbacks += 1
+
+    tasks = []
+    start = loop.time()
+    for offset, (session_id, kind, message) in zip(offsets, traffic):
+        scheduled = start + offset
+        delay = scheduled - loop.time()
+        if delay > 0.001:
+            await asyncio.sleep(delay)
+        else:
+            # Falling behind schedule means the generator itself is saturated, which the report shows
+            send_lag = max(send_lag, -delay)
+        tasks.append(asyncio.ensure_future(request(scheduled, session_id, kind, message)))
+    await asyncio.gather(*tasks)
+    elapsed = loop.time() - start
+
+    timeline = []
+    for index in range(max(windows) + 1 if windows else 0):
+        window = windows.get(index) or _Window()
+        samples = sorted(window.latencies)
+        timeline.append({
+            'start_s': index * interval,
+            'throughput_rps': len(samples) / interval,
+            'p50_ms': percentile(samples, 0.50) * 1000,
+            'p99_ms': percentile(samples, 0.99) * 1000,
+            'fallback_share': window.fallbacks / len(samples) if samples else 0.0,
+            'errors': window.errors
+        })
+
+    return {
+        'target_rps': rate,
+        'requests': len(traffic),
+        'completed': latency.count,
+        'errors': counts['errors'],
+        'elapsed_s': elapsed,
+        'throughput_rps': latency.count / elapsed if elapsed > 0 else 0.0,
+        'max_send_lag_ms': send_lag * 1000,
+        'fallback_share': counts['fallbacks'] / latency.count if latency.count else 0.0,
+        # The mix actually sent, to read the numbers against
+        'class_shares': {kind: sent / len(traffic) for kind, sent in
+                         sorted(collections.Counter(kind for _, kind, _ in traffic).items())},
+        'latency': latency.summary(),
+        'classes': {kind: recorder.summary() for kind, recorder in sorted(by_class.items())},
+        'timeline': timeline
+    }
+
+
+def saturation_point(runs, tolerance=0.95):
+    """
+    Highest target rate the system kept up with
+
+    :param runs: Reports from run_load, in increasing target rate
+    :param tolerance: Fraction of the target rate a run must reach to count as keeping up
+    :return: Target rate in requests per second, or None if even the lowest rate was missed
+    """
+    sustained = None
+    for run in runs:
+        if run['errors'] or run['throughput_rps'] < run['target_rps'] * tolerance:
+            break
+        sustained = run['target_rps']
+    return sustained
+
+
+def _admission_delta(before, after):
+    # Admission counters of one run; the controller's own are cumulative over every rate
+    delta = {name: after[name] - before[name] for name in ('admitted', 'degraded', 'rejected')}
+    delta['shed'] = {reason: count - before['shed'].get(reason, 0) for reason, count in after['shed'].items()}
+    return delta
+
+
+async def _run_cli(args, rates, mix):
+    if args.server:
+        target = ServerTarget(args.concurrency, args.host, args.port)
+    else:
+        controller = None
+        if args.admission:
+            controller = admission.AdmissionController(
+                workers=args.concurrency, max_queue=args.max_queue, deadline=args.deadline_ms / 1000,
+                session_rate=args.session_rate or None, session_burst=args.session_burst, warmup=False
+            )
+        # The target warms up, or doesn't with --no-warmup, for the controller as well
+        target = InProcessTarget(args.concurrency, warmup=not args.no_warmup, controller=controller)
+    runs = []
+    try:
+        for rate in rates:
+            count = args.requests or max(int(rate * args.duration), 1)
+            traffic = list(synthetic_traffic(count, mix, args.seed, args.conversations))
+            controller = getattr(target, 'controller', None)
+            before = controller.stats() if controller is not None else None
+            run = await run_load(target, traffic, rate, args.arrivals, args.interval, args.seed)
+            if controller is not None:
+                # Rejected requests are the errors of an admission-controlled run
+                run['admission'] = _admission_delta(before, controller.stats())
+            if not args.timeline:
+                del run['timeline']
+            runs.append(run)
+    finally:
+        await target.close()
+    return {
+        'target': f'{args.host}:{args.port}' if args.server else 'in-process',
+        'concurrency': args.concurrency,
+        'mix': mix,
+        'runs': runs,
+        'saturation_rps': saturation_point(runs)
+    }
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Open-loop load test with synthetic dealership conversations")
+    parser.add_argument('--rate', default='200',
+                        help="Target requests per second; a comma-separated list runs each rate in turn "
+                             "and reports the highest one sustained")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds per rate")
+    parser.add_argument('--requests', type=int, default=None, help="Requests per rate, instead of --duration")
+    parser.add_argument('--concurrency', type=int, default=16,
+                        help="Threads calling main.get_response, or connections to the server")
+    parser.add_argument('--mix', default=None, help="Traffic mix as class=weight pairs, classes: "
+                                                    + ', '.join(TRAFFIC_CLASSES))
+    parser.add_argument('--conversations', type=int, default=100, help="Conversations active at the same time")
+    parser.add_argument('--arrivals', choices=('poisson', 'uniform'), default='poisson')
+    parser.add_argument('--interval', type=float, default=1.0, help="Seconds per latency-over-time window")
+    parser.add_argument('--timeline', action='store_true', help="Include latency over time in the report")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the traffic and arrival times")
+    parser.add_argument('--server', action='store_true', help="Drive a running chat_server.py instead of main")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--no-warmup', action='store_true', help="Measure in-process runs from a cold start")
+    parser.add_argument('--admission', action='store_true',
+                        help="Send in-process requests through admission.AdmissionController, which degrades or "
+                             "rejects them under overload")
+    parser.add_argument('--max-queue', type=int, default=admission.DEFAULT_MAX_QUEUE,
+                        help="Requests that may wait for a worker under --admission")
+    parser.add_argument('--deadline-ms', type=float, default=admission.DEFAULT_DEADLINE * 1000,
+                        help="Deadline per request under --admission")
+    parser.add_argument('--session-rate', type=float, default=admission.DEFAULT_SESSION_RATE,
+                        help="Requests per second per conversation under --admission, 0 for no limit")
+    parser.add_argument('--session-burst', type=int, default=admission.DEFAULT_SESSION_BURST)
+    args = parser.parse_args(argv)
+    if args.admission and args.server:
+        parser.error("--admission applies to in-process runs only, start the server with --admission instead")
+
+    rates = sorted(float(rate) for rate in args.rate.split(','))
+    if any(rate <= 0 for rate in rates):
+        parser.error("--rate must be positive")
+    try:
+        mix = parse_mix(args.mix) if args.mix else DEFAULT_MIX
+    except ValueError as error:
+        parser.error(str(error))
+    print(json.dumps(asyncio.run(_run_cli(args, rates, mix)), indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
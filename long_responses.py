@@ -1,10 +1,17 @@
-import random
-import text_complexity
-import communication_coach
-import auto_dealership_knowledge
+import request_rng
+import template_engine
+import tenant_context
+from lazy_imports import lazy_import
+from tracing import TRACER
 
-# Expanded response templates
-RESPONSE_TEMPLATES = {
+# Only the fallback path needs these, so they load on first use
+text_complexity = lazy_import('text_complexity')
+communication_coach = lazy_import('communication_coach')
+auto_dealership_knowledge = lazy_import('auto_dealership_knowledge')
+faq_index = lazy_import('faq_index')
+
+# Expanded response templates, parsed and interned once at import
+RESPONSE_TEMPLATES = template_engine.precompile({
     'auto_greetings': [
         "Welcome to our Auto Dealership Assistant! How can I help you find your perfect vehicle today?",
         "Hello! Ready to explore our amazing vehicle lineup? What are you looking for?",
@@ -23,69 +30,106 @@ RESPONSE_TEMPLATES = {
         "Let me help you. Are you looking for vehicle information, buying advice, or financing details?",
         "I'm your automotive guide. Could you be more specific about what you need?"
     ]
-}
+})
 
-def generate_dynamic_response(response_type, **kwargs):
+def generate_dynamic_response(response_type, response_templates=None, **kwargs):
     """
     Generate a dynamic response based on the type and optional parameters.
     
     :param response_type: Type of response
+    :param response_templates: Template table to use instead of RESPONSE_TEMPLATES (or the serving tenant's)
     :param kwargs: Additional context for response generation
     :return: A dynamically selected response
     """
-    templates = RESPONSE_TEMPLATES.get(response_type, RESPONSE_TEMPLATES['auto_unknown'])
+    if response_templates is None:
+        engine = tenant_context.current()
+        response_templates = RESPONSE_TEMPLATES if engine is None else engine.response_templates
+    templates = response_templates.get(response_type, response_templates['auto_unknown'])
     
     # Select a random template
-    response = random.choice(templates)
+    response = request_rng.choice(templates)
     
-    # If context-dependent responses, format with provided kwargs
+    # If context-dependent responses, fill in the provided kwargs
     if kwargs and '{' in response:
         try:
-            response = response.format(**kwargs)
+            response = template_engine.compile_template(response).render(kwargs)
         except KeyError:
-            response = random.choice(RESPONSE_TEMPLATES['auto_unknown'])
+            response = request_rng.choice(response_templates['auto_unknown'])
     
     return response
 
-def unknown(input_length=None, input_text=None):
+def stream_unknown(input_length=None, input_text=None):
     """
-    Generate an unknown response with optional complexity-based variation
+    Produce an unknown response in chunks, the opening line first
+    
+    The opening line is chosen before any analysis runs, so a caller can send
+    it while the complexity analysis and coaching for long inputs are computed.
     
     :param input_length: Length of the original user input
     :param input_text: Full text of user input for complexity analysis
-    :return: A contextually appropriate unknown response
+    :return: Generator of response chunks
     """
     # First, try auto dealership-specific response generation
     if input_text:
-        auto_response = auto_dealership_knowledge.generate_auto_response(input_text)
-        if auto_response != "I can help you with vehicle types, buying process, financing, maintenance, and negotiation. What specific auto-related question do you have?":
-            return auto_response
+        with TRACER.span('auto_response'):
+            auto_chunks = auto_dealership_knowledge.stream_auto_response(input_text)
+            first_chunk = next(auto_chunks, None)
+        if first_chunk is not None:
+            yield first_chunk
+            yield from auto_chunks
+            return
+    
+    # Next, look for a FAQ or manual passage that answers the question
+    if input_text:
+        index = faq_index.active_index()
+        if index is not None:
+            with TRACER.span('faq_retrieval'):
+                passage = index.answer(input_text)
+            if passage is not None:
+                yield passage
+                return
     
     # If no specific auto response, use standard unknown handling
     if input_text:
-        # Use text complexity for more nuanced responses
-        suggestion = text_complexity.TextComplexityAnalyzer.suggest_summarization(input_text)
+        yield generate_dynamic_response('auto_unknown')
         
-        # Add communication coaching for complex inputs
+        # Add summarization and communication coaching for complex inputs
         if len(input_text.split()) > 20:
-            guidance = communication_coach.CommunicationCoach.generate_communication_guidance(input_text)
-            framework = communication_coach.CommunicationCoach.suggest_communication_framework(input_text)
+            # Analyze the text once and share the result with every consumer
+            with TRACER.span('complexity'):
+                analysis = text_complexity.TextComplexityAnalyzer.analyze(input_text)
+                
+                # Use text complexity for more nuanced responses
+                suggestion = text_complexity.TextComplexityAnalyzer.suggest_summarization(analysis)
+            yield f" {suggestion}"
             
-            # Combine summarization and coaching
+            with TRACER.span('communication_coach'):
+                guidance = communication_coach.CommunicationCoach.generate_communication_guidance(analysis)
+                framework = communication_coach.CommunicationCoach.suggest_communication_framework(analysis)
+            yield f" {guidance}"
             if framework:
-                return f"{generate_dynamic_response('auto_unknown')} {suggestion} {guidance} {framework}"
-            else:
-                return f"{generate_dynamic_response('auto_unknown')} {suggestion} {guidance}"
-        
-        return generate_dynamic_response('auto_unknown')
+                yield f" {framework}"
+        return
     
     if input_length is not None:
         if input_length < 3:
-            return "That's quite short. Could you elaborate on your automotive query?"
+            yield "That's quite short. Could you elaborate on your automotive query?"
+            return
         elif input_length > 50:
-            return "Wow, that's a detailed message! Let me help you break down your automotive needs."
+            yield "Wow, that's a detailed message! Let me help you break down your automotive needs."
+            return
     
-    return generate_dynamic_response('auto_unknown')
+    yield generate_dynamic_response('auto_unknown')
+
+def unknown(input_length=None, input_text=None):
+    """
+    Generate an unknown response with optional complexity-based variation
+    
+    :param input_length: Length of the original user input
+    :param input_text: Full text of user input for complexity analysis
+    :return: A contextually appropriate unknown response
+    """
+    return ''.join(stream_unknown(input_length, input_text))
 
 # Predefined responses with auto dealership context
 R_EATING = "As a car expert, I run on automotive knowledge, not food!"
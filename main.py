@@ -1,7 +1,23 @@
-import re
+import contextlib
+import contextvars
 import long_responses as long
 import random
-import difflib
+import time
+from lazy_imports import lazy_import
+from intent_registry import Intent, IntentRegistry
+import batch_scoring
+import request_rng
+import tenant_context
+import tokenizer
+from tracing import TRACER
+from intent_cache import IntentCache
+from session_store import SessionStore
+
+# Only needed for pairwise comparisons without a FuzzyMatcher
+difflib = lazy_import('difflib')
+
+# Only needed to recognise vehicle types for session context
+auto_dealership_knowledge = lazy_import('auto_dealership_knowledge')
 
 def advanced_word_similarity(word1, word2, threshold=0.6):
     """
@@ -18,7 +34,7 @@ def advanced_word_similarity(word1, word2, threshold=0.6):
     similarity = difflib.SequenceMatcher(None, word1.lower(), word2.lower()).ratio()
     return similarity >= threshold
 
-def message_probability(user_message, recognised_words, single_response=False, required_words=[]):
+def message_probability(user_message, recognised_words, single_response=False, required_words=[], matcher=None):
     """
     Enhanced message probability calculation with flexible matching
     
@@ -27,6 +43,7 @@ def message_probability(user_message, recognised_words, single_response=False, r
         recognised_words (list): List of words to match against
         single_response (bool): Whether this is a single response scenario
         required_words (list): Words that must be present
+        matcher (FuzzyMatcher): Indexed word matcher; pairwise difflib comparisons when omitted
     
     Returns:
         int: Probability score (0-100)
@@ -34,10 +51,15 @@ def message_probability(user_message, recognised_words, single_response=False, r
     message_certainty = 0
     has_required_words = True
 
+    if matcher is None:
+        similar, similar_reverse = advanced_word_similarity, advanced_word_similarity
+    else:
+        similar, similar_reverse = matcher.similar, matcher.similar_reverse
+
     # Advanced matching: Check for similar words
     for user_word in user_message:
         for rec_word in recognised_words:
-            if user_word == rec_word or advanced_word_similarity(user_word, rec_word):
+            if user_word == rec_word or similar(user_word, rec_word):
                 message_certainty += 1
                 break
 
@@ -46,7 +68,7 @@ def message_probability(user_message, recognised_words, single_response=False, r
 
     # Checks that the required words are in the string
     for word in required_words:
-        if not any(advanced_word_similarity(word, user_w) for user_w in user_message):
+        if not any(similar_reverse(word, user_w) for user_w in user_message):
             has_required_words = False
             break
 
@@ -64,80 +86,470 @@ def preprocess_input(user_input):
         user_input (str): Raw user input
     
     Returns:
-        list: Processed words
+        list: Processed words, interned in the shared tokenizer vocabulary
+    """
+    return tokenizer.preprocess_input(user_input)
+
+# Auto Dealership Intents -------------------------------------------------------------------------------------------------------
+DEALERSHIP_INTENTS = [
+    Intent('greeting', ['hello', 'hi', 'hey', 'sup', 'heyo', 'dealership', 'car', 'vehicle'],
+           response_type='auto_greetings', single_response=True),
+    Intent('farewell', ['bye', 'goodbye', 'later'], response='See you soon!', single_response=True),
+
+    # Vehicle Type Queries
+    Intent('vehicle_sedan', ['sedan', 'car'],
+           response='Sedans are great for daily commuting and family use.', required_words=['sedan']),
+    Intent('vehicle_suv', ['suv', 'vehicle'],
+           response='SUVs offer versatility and space for families and adventures.', required_words=['suv']),
+    Intent('vehicle_truck', ['truck', 'vehicle'],
+           response='Trucks are powerful and perfect for work and heavy-duty tasks.', required_words=['truck']),
+
+    # Buying Process Queries
+    Intent('buying_process', ['buy', 'purchase', 'process'],
+           response='Let me guide you through our comprehensive buying process.', required_words=['buy']),
+
+    # Financing Queries
+    Intent('financing', ['finance', 'loan', 'payment'],
+           response='We offer multiple financing options to suit your needs.', required_words=['finance']),
+
+    # Maintenance Queries
+    Intent('maintenance', ['maintain', 'service', 'repair'],
+           response='Regular maintenance is key to keeping your vehicle in top condition.', required_words=['maintain']),
+
+    # Negotiation Queries
+    Intent('negotiation', ['negotiate', 'price', 'deal'],
+           response='Our team is ready to help you get the best deal possible.', required_words=['negotiate']),
+]
+
+# Compiled once at import; check_all_messages only scores intents found through its index
+INTENT_REGISTRY = IntentRegistry(DEALERSHIP_INTENTS)
+
+# Minimum score an intent needs before it is used instead of the fallback path
+MATCH_THRESHOLD = 50
+
+# Matching results for INTENT_REGISTRY, keyed on normalized tokens; set to None to disable
+INTENT_CACHE = IntentCache()
+
+# Multi-turn context for requests that carry a session ID
+SESSIONS = SessionStore()
+
+def extract_budget(user_input):
     """
-    # Convert to lowercase
-    user_input = user_input.lower()
+    Find the budget a message mentions
     
-    # Remove punctuation
-    user_input = re.sub(r'[^\w\s]', '', user_input)
+    Args:
+        user_input (str): Raw user input
     
-    # Split into words
-    words = user_input.split()
+    Returns:
+        int: Last dollar amount in the message, or None
+    """
+    return auto_dealership_knowledge.extract_budget(user_input)
+
+def extract_vehicle_type(split_message):
+    """
+    Find the vehicle type a message asks about
     
-    # Remove common stop words that might not contribute to meaning
-    stop_words = {'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by'}
-    words = [word for word in words if word not in stop_words]
+    Args:
+        split_message (list): Preprocessed words of the input
     
-    return words
+    Returns:
+        str: Vehicle type from the active knowledge, or None
+    """
+    vehicle_types = auto_dealership_knowledge.active_knowledge().VEHICLE_TYPES
+    for word in split_message:
+        if word in vehicle_types:
+            return word
+        if word.endswith('s') and word[:-1] in vehicle_types:
+            return word[:-1]
+    return None
 
-def check_all_messages(message):
-    highest_prob_list = {}
+def remember_turn(session_id, user_input, split_message, intent, store=None):
+    """
+    Update a session's context after one turn
+    
+    Args:
+        session_id (str): Session identifier
+        user_input (str): Raw user input
+        split_message (list): Preprocessed words of the input
+        intent (Intent): Matched intent, or None if the fallback path ran
+        store (SessionStore): Store to update, SESSIONS by default
+    
+    Returns:
+        SessionContext: Context after this turn
+    """
+    if store is None:
+        store = SESSIONS
+    return store.update(session_id, intent.intent_id if intent is not None else None,
+                        extract_vehicle_type(split_message), extract_budget(user_input))
 
-    # Simplifies response creation / adds it to the dict
-    def response(bot_response, list_of_words, single_response=False, required_words=[]):
-        nonlocal highest_prob_list
-        highest_prob_list[bot_response] = message_probability(message, list_of_words, single_response, required_words)
+def score_intents(message, registry):
+    """
+    Score the candidate intents for a message and pick the best one
+    
+    Args:
+        message (list): List of words in user input
+        registry (IntentRegistry): Intents to match against
+    
+    Returns:
+        tuple: (Intent, score) of the best candidate, (None, 0) when there are no candidates
+    """
+    matcher = registry.matcher
+    best_intent = None
+    best_score = 0
+    for intent in registry.candidates(message):
+        score = message_probability(
+            message, intent.recognised_words, intent.single_response, intent.required_words, matcher
+        )
+        # Strict comparison keeps the earliest registered intent on ties
+        if best_intent is None or score > best_score:
+            best_intent, best_score = intent, score
+    return best_intent, best_score
 
-    # Auto Dealership Responses -------------------------------------------------------------------------------------------------------
-    response(long.generate_dynamic_response('auto_greetings'), 
-             ['hello', 'hi', 'hey', 'sup', 'heyo', 'dealership', 'car', 'vehicle'], single_response=True)
+def match_intent(message, registry=None, threshold=None, cache=None):
+    """
+    Find the best scoring intent for a preprocessed message
     
-    response('See you soon!', ['bye', 'goodbye', 'later'], single_response=True)
+    Args:
+        message (list): List of words in user input
+        registry (IntentRegistry): Intents to match against, defaults to the serving tenant's or INTENT_REGISTRY
+        threshold (int): Minimum score for a match, defaults to MATCH_THRESHOLD
+        cache (IntentCache): Result cache, defaults to the registry's when registry is omitted
     
-    # Vehicle Type Queries
-    response('Sedans are great for daily commuting and family use.', 
-             ['sedan', 'car'], required_words=['sedan'])
-    response('SUVs offer versatility and space for families and adventures.', 
-             ['suv', 'vehicle'], required_words=['suv'])
-    response('Trucks are powerful and perfect for work and heavy-duty tasks.', 
-             ['truck', 'vehicle'], required_words=['truck'])
+    Returns:
+        tuple: (Intent, score), with Intent set to None when nothing reaches the threshold
+    """
+    if registry is None:
+        registry, default_cache, _ = active_intents()
+        if cache is None:
+            cache = default_cache
+    if threshold is None:
+        threshold = MATCH_THRESHOLD
+
+    if cache is None:
+        best_intent, best_score = score_intents(message, registry)
+    else:
+        key = cache.normalize(message)
+        cached = cache.get(key, registry)
+        if cached is None:
+            best_intent, best_score = score_intents(message, registry)
+            cache.put(key, registry, best_intent.intent_id if best_intent is not None else None, best_score)
+        else:
+            intent_id, best_score = cached
+            best_intent = registry.get(intent_id) if intent_id is not None else None
+
+    if best_intent is None or best_score < threshold:
+        return None, best_score
+    return best_intent, best_score
+
+def render_intent(intent, registry=None, response_templates=None):
+    """
+    Render the response text for a matched intent
     
-    # Buying Process Queries
-    response('Let me guide you through our comprehensive buying process.', 
-             ['buy', 'purchase', 'process'], required_words=['buy'])
+    Args:
+        intent (Intent): Matched intent
+        registry (IntentRegistry): Registry the intent came from, for its response templates
+        response_templates (dict): Templates to use instead of the registry's, e.g. a tenant's
     
-    # Financing Queries
-    response('We offer multiple financing options to suit your needs.', 
-             ['finance', 'loan', 'payment'], required_words=['finance'])
+    Returns:
+        str: Response text
+    """
+    if intent.response_type is not None:
+        if response_templates is None and registry is not None:
+            response_templates = registry.response_templates
+        return long.generate_dynamic_response(intent.response_type, response_templates)
+    return intent.response
+
+def install_registry(registry):
+    """
+    Swap the intents used by get_response
     
-    # Maintenance Queries
-    response('Regular maintenance is key to keeping your vehicle in top condition.', 
-             ['maintain', 'service', 'repair'], required_words=['maintain'])
+    Requests read INTENT_REGISTRY once, so each one sees either the old or the
+    new intents (with their templates), never a mix.
     
-    # Negotiation Queries
-    response('Our team is ready to help you get the best deal possible.', 
-             ['negotiate', 'price', 'deal'], required_words=['negotiate'])
+    Args:
+        registry (IntentRegistry): Replacement registry
+    """
+    global INTENT_REGISTRY
+    INTENT_REGISTRY = registry
+
+def check_all_messages(message):
+    registry, cache, templates = active_intents()
+    intent, _ = match_intent(message, registry, cache=cache)
 
     # If no high probability match is found
-    if not highest_prob_list or max(highest_prob_list.values()) < 50:
+    if intent is None:
         return long.unknown(input_length=len(' '.join(message)))
 
-    best_match = max(highest_prob_list, key=highest_prob_list.get)
-    return best_match
+    return render_intent(intent, registry, templates)
+
+def _isolated(chunks, *managers):
+    # Advances chunks in a context of its own in which the managers stay entered, so the values they set never
+    # reach the caller between chunks
+    context = contextvars.copy_context()
+    resources = contextlib.ExitStack()
+    try:
+        for manager in managers:
+            context.run(resources.enter_context, manager)
+        while True:
+            try:
+                chunk = context.run(next, chunks)
+            except StopIteration:
+                return
+            yield chunk
+    finally:
+        context.run(chunks.close)
+        context.run(resources.close)
+
+def stream_fallback_response(user_input, seed=None, session_id=None):
+    """
+    Produce the response for a message that matched no intent in chunks
+    
+    Knowledge answers come first, then a FAQ or manual passage, then the
+    canned reply with complexity coaching, see long_responses.stream_unknown.
+    
+    Args:
+        user_input (str): Raw user input
+        seed (int): Replay seed, see stream_response; the surrounding generator is used if None
+        session_id (str): Session the message belongs to, part of the seeded choices
+    
+    Returns:
+        iterator: Consecutive pieces of the fallback response
+    """
+    chunks = long.stream_unknown(input_text=user_input)
+    if seed is None:
+        return chunks
+    return _isolated(chunks, request_rng.seeded(seed, session_id, user_input))
+
+def fallback_response(user_input, seed=None, session_id=None):
+    """
+    Build the response for a message that matched no intent
+    
+    Args:
+        user_input (str): Raw user input
+        seed (int): Replay seed, see stream_response; the surrounding generator is used if None
+        session_id (str): Session the message belongs to, part of the seeded choices
+    
+    Returns:
+        str: Fallback response
+    """
+    return ''.join(stream_fallback_response(user_input, seed, session_id))
+
+def active_intents():
+    """
+    Intents answering the current request
+    
+    Returns:
+        tuple: (IntentRegistry, IntentCache, response templates), the serving tenant's if any;
+            the templates are None for the installed knowledge, see render_intent
+    """
+    engine = tenant_context.current()
+    if engine is None:
+        return INTENT_REGISTRY, INTENT_CACHE, None
+    return engine.registry, engine.intent_cache, engine.response_templates
 
-def get_response(user_input):
-    # Preprocess and split user input
-    split_message = preprocess_input(user_input)
+class ResponseStream:
+    """
+    Iterator over the chunks of one bot response, see stream_response
+    
+    Every step runs in a context of its own, copied from the caller's when the
+    stream is created, which holds the request's pinned engine, seeded
+    generator and tracing span. Values set for the request are never visible
+    to the code consuming the chunks, nor to other streams advanced in
+    between, and each stream may be closed in any order.
+    """
+    
+    def __init__(self, user_input, session_id=None, seed=None, engine=None):
+        """
+        Args:
+            user_input (str): Raw user input
+            session_id (str): Optional session whose context in SESSIONS is updated
+            seed (int): Optional replay seed
+            engine (TenantEngine): Engine answering the request, the current one if None
+        """
+        self.user_input = user_input
+        self.session_id = session_id
+        self.seed = seed
+        self.split_message = None
+        self.intent = None
+        self.score = 0
+        # Whether the fallback analysis is replaced by the canned reply, see shed_fallback
+        self.shed = False
+        self._registry = None
+        self._templates = None
+        self._matched = False
+        self._chunks = None
+        self._closed = False
+        self._first_chunk = True
+        self._context = contextvars.copy_context()
+        self._resources = contextlib.ExitStack()
+        self._start = time.perf_counter()
+        # The engine is pinned for the whole request, so a knowledge reload in between can't mix old and new parts
+        self._context.run(self._enter, engine if engine is not None else tenant_context.current())
+    
+    def _enter(self, engine):
+        self._resources.enter_context(TRACER.request())
+        self._resources.enter_context(request_rng.seeded(self.seed, self.session_id, self.user_input))
+        self._resources.enter_context(tenant_context.serving(engine))
     
-    # Get bot response
-    response = check_all_messages(split_message)
+    @property
+    def fallback(self):
+        """Whether no intent matched, so the fallback analysis answers; False until match() has run"""
+        return self._matched and self.intent is None
     
-    # If no good match, use text complexity for more nuanced response
-    if response == long.generate_dynamic_response('unknown'):
-        response = long.unknown(input_text=user_input)
+    def shed_fallback(self):
+        """
+        Answer with the canned auto_unknown reply if no intent matches
+        
+        Sheds load: knowledge answers, FAQ retrieval, complexity analysis and
+        coaching are skipped, while intent replies are still rendered. Call it
+        before the first chunk.
+        """
+        self.shed = True
+    
+    def match(self):
+        """
+        Preprocess the message, score the intents and remember the turn, once
+        
+        Returns:
+            tuple: (Intent, score), with Intent None when the fallback answers
+        """
+        if not self._matched:
+            try:
+                self._context.run(self._match)
+            except BaseException:
+                self.close()
+                raise
+        return self.intent, self.score
+    
+    def _match(self):
+        with TRACER.span('preprocess'):
+            self.split_message = preprocess_input(self.user_input)
+        
+        # Get bot response, from the tenant's engine when one is serving the request
+        self._registry, cache, self._templates = active_intents()
+        with TRACER.span('intent_scoring'):
+            self.intent, self.score = match_intent(self.split_message, self._registry, cache=cache)
+        if self.session_id is not None:
+            remember_turn(self.session_id, self.user_input, self.split_message, self.intent)
+        self._matched = True
+    
+    def _steps(self):
+        if self.intent is not None:
+            with TRACER.span('render'):
+                response = render_intent(self.intent, self._registry, self._templates)
+            yield response
+            return
+        
+        if self.shed:
+            yield long.generate_dynamic_response('auto_unknown')
+            return
+        
+        TRACER.count('fallback')
+        with TRACER.span('fallback'):
+            yield from long.stream_unknown(input_text=self.user_input)
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        if self._closed:
+            raise StopIteration
+        self.match()
+        if self._chunks is None:
+            self._chunks = self._steps()
+        try:
+            chunk = self._context.run(next, self._chunks)
+        except BaseException:
+            self.close()
+            raise
+        if self._first_chunk:
+            self._first_chunk = False
+            if TRACER.enabled:
+                self._context.run(TRACER.record, 'first_chunk', time.perf_counter() - self._start)
+        return chunk
+    
+    def close(self):
+        """End the request: stop producing chunks and record its span"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._chunks is not None:
+            self._context.run(self._chunks.close)
+        self._context.run(self._resources.close)
+
+def stream_response(user_input, session_id=None, seed=None, engine=None):
+    """
+    Produce the bot response as it is computed
+    
+    Intent replies arrive as one chunk. Fallback replies start with a short
+    opening line or the first line of a knowledge guide, and the rest follows
+    while the analysis runs, so callers can show the first chunk early. With
+    tracing enabled the time to the first chunk is recorded as 'first_chunk'.
+    
+    With a seed, every random choice (response templates, coaching advice)
+    comes from a generator of this request alone, derived from the seed, the
+    session ID and the message, so replaying the same input with the same
+    seed gives the same response on any thread. Without one, choices come
+    from the global random module as before.
+    
+    Args:
+        user_input (str): Raw user input
+        session_id (str): Optional session whose context in SESSIONS is updated
+        seed (int): Optional replay seed
+        engine (TenantEngine): Engine answering the request, the serving tenant's or the installed one if None
+    
+    Returns:
+        ResponseStream: Iterator over consecutive pieces of the response
+    """
+    return ResponseStream(user_input, session_id, seed, engine)
+
+def get_response(user_input, session_id=None, seed=None):
+    return ''.join(stream_response(user_input, session_id, seed))
+
+def match_intents(user_inputs, registry=None, threshold=None, backend=None):
+    """
+    Find the best scoring intent for each message in a batch
+    
+    Args:
+        user_inputs (list): Raw user inputs
+        registry (IntentRegistry): Intents to match against, defaults to the serving tenant's or INTENT_REGISTRY
+        threshold (int): Minimum score for a match, defaults to MATCH_THRESHOLD
+        backend (str): 'numpy' or 'python', NumPy when installed by default
+    
+    Returns:
+        list: (Intent, score) per input, identical to match_intent on each one
+    """
+    if registry is None:
+        registry, _, _ = active_intents()
+    if threshold is None:
+        threshold = MATCH_THRESHOLD
+    messages = [preprocess_input(user_input) for user_input in user_inputs]
+    return batch_scoring.match_batch(messages, registry, threshold, backend=backend)
+
+def get_responses(user_inputs, backend=None, seed=None):
+    """
+    Batch version of get_response
+    
+    Args:
+        user_inputs (list): Raw user inputs
+        backend (str): 'numpy' or 'python', NumPy when installed by default
+        seed (int): Optional replay seed; each input gets the response get_response gives it with that seed
+    
+    Returns:
+        list: Response text per input
+    """
+    registry, _, templates = active_intents()
+    messages = [preprocess_input(user_input) for user_input in user_inputs]
+    matches = batch_scoring.match_batch(messages, registry, MATCH_THRESHOLD, backend=backend)
     
-    return response
+    responses = []
+    for user_input, (intent, _) in zip(user_inputs, matches):
+        if intent is not None:
+            with request_rng.seeded(seed, None, user_input):
+                responses.append(render_intent(intent, registry, templates))
+        else:
+            responses.append(fallback_response(user_input, seed))
+    return responses
 
 # Testing the response system
 if __name__ == "__main__":
@@ -0,0 +1,395 @@
+import argparse
+import asyncio
+import concurrent.futures
+import gc
+import json
+import os
+import select
+import signal
+import socket
+import sys
+import time
+
+# One message per intent plus inputs that take every fallback branch, so the
+# fuzzy matcher, intent cache and lazily imported subsystems are all loaded
+WARMUP_MESSAGES = [
+    'hello there',
+    'goodbye and thanks',
+    'tell me about your sedan models',
+    'do you have an suv for a family',
+    'i need a pickup truck for towing',
+    'how does the buying process work',
+    'what financing options and loan rates do you offer',
+    'how often should i schedule maintenance and service',
+    'can we negotiate the price of this deal',
+    'zzz',
+    'what about the warranty on used cars',
+]
+
+# Long enough (> 20 words) to reach the communication coach
+WARMUP_LONG_MESSAGE = ("I have been thinking about what I actually want from my next car for a long time now and "
+                       "I would really appreciate it if somebody could walk me through everything I should "
+                       "consider before I make a final decision about it")
+
+# Seconds between checks for exited workers
+REAP_INTERVAL = 0.5
+
+
+def memory_usage():
+    """
+    Resident memory of the current process
+
+    Uses /proc/self/smaps_rollup where available, which splits resident pages
+    into those still shared copy-on-write with other processes and those
+    private to this one. PSS charges each shared page proportionally, so the
+    sum of PSS over all workers is their real combined footprint.
+
+    :return: Dict of sizes in KiB, empty if the platform doesn't expose them
+    """
+    try:
+        with open('/proc/self/smaps_rollup') as rollup:
+            fields = {}
+            for line in rollup:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1])
+        return {
+            'rss_kb': fields.get('Rss', 0),
+            'pss_kb': fields.get('Pss', 0),
+            'shared_kb': fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0),
+            'private_kb': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+        }
+    except OSError:
+        pass
+
+    try:
+        with open('/proc/self/statm') as statm:
+            _, resident, shared = statm.read().split()[:3]
+        page_kb = os.sysconf('SC_PAGE_SIZE') // 1024
+        return {'rss_kb': int(resident) * page_kb, 'shared_kb': int(shared) * page_kb}
+    except (OSError, ValueError):
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return {}
+    # ru_maxrss is the peak, in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {'rss_kb': peak // 1024 if sys.platform == 'darwin' else peak}
+
+
+def cold_start(knowledge_path=None, warmup=True):
+    """
+    Import the chat bot and warm every index and cache in the current process
+
+    :param knowledge_path: Optional JSON/TOML knowledge file to install
+    :param warmup: Whether to run the warm-up messages
+    :return: (chat_server module, KnowledgeStore or None, dict of timings in milliseconds)
+    """
+    start = time.perf_counter()
+    import chat_server
+    import long_responses
+    imported = time.perf_counter()
+
+    knowledge_store = None
+    if knowledge_path:
+        from knowledge_snapshot import KnowledgeStore
+        knowledge_store = KnowledgeStore(knowledge_path)
+        knowledge_store.reload()
+    loaded = time.perf_counter()
+
+    if warmup:
+        chatbot = chat_server.chatbot
+        for message in WARMUP_MESSAGES:
+            chatbot.get_response(message)
+        long_responses.unknown(input_text=WARMUP_LONG_MESSAGE)
+        # Warm-up traffic shouldn't show up in the workers' cache statistics
+        if chatbot.INTENT_CACHE is not None:
+            chatbot.INTENT_CACHE.hits = chatbot.INTENT_CACHE.misses = 0
+    warmed = time.perf_counter()
+
+    timings = {
+        'import_ms': (imported - start) * 1000,
+        'knowledge_ms': (loaded - imported) * 1000,
+        'warmup_ms': (warmed - loaded) * 1000,
+        'cold_start_ms': (warmed - start) * 1000
+    }
+    return chat_server, knowledge_store, timings
+
+
+def _report(pipe_fd, report):
+    # Reports stay well under PIPE_BUF, so writes from different workers don't interleave
+    os.write(pipe_fd, json.dumps(report).encode('utf-8') + b'\n')
+
+
+def _run_worker(index, chat_server, knowledge_store, sock, pipe_fd, forked_at, threads):
+    class WorkerServer(chat_server.ChatServer):
+        first_response = True
+
+        async def handle_request(self, request, send=None):
+            start = time.perf_counter()
+            reply = await super().handle_request(request, send)
+            if self.first_response and 'response' in reply:
+                self.first_response = False
+                now = time.perf_counter()
+                _report(pipe_fd, {
+                    'event': 'first_response', 'worker': index, 'pid': os.getpid(),
+                    'since_fork_ms': (now - forked_at) * 1000,
+                    'handled_ms': (now - start) * 1000,
+                    'memory': memory_usage()
+                })
+            return reply
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+    server = WorkerServer(executor=executor, knowledge_store=knowledge_store)
+
+    async def serve():
+        await server.start(sock=sock)
+        _report(pipe_fd, {
+            'event': 'ready', 'worker': index, 'pid': os.getpid(),
+            'since_fork_ms': (time.perf_counter() - forked_at) * 1000,
+            'memory': memory_usage()
+        })
+        async with server._server:
+            await server._server.serve_forever()
+
+    asyncio.run(serve())
+
+
+class PreforkLauncher:
+    """
+    Run N chat server workers forked from one warmed-up parent
+
+    The parent imports the chat bot, installs the knowledge and runs warm-up
+    messages once, freezes the resulting objects out of the garbage collector
+    and binds the listening socket. Workers are forked from that state, so
+    indexes, caches and imported modules are shared copy-on-write and every
+    worker answers its first request warm. The kernel spreads connections over
+    the workers accepting on the shared socket. Workers send readiness,
+    time-to-first-response and memory reports back to the parent over a pipe;
+    crashed workers are replaced.
+    """
+
+    def __init__(self, workers=2, host='127.0.0.1', port=8765, knowledge_path=None, warmup=True, threads=None):
+        """
+        :param workers: Number of worker processes to fork
+        :param host: Interface to bind
+        :param port: TCP port, 0 picks a free one
+        :param knowledge_path: Optional JSON/TOML knowledge file to install before forking
+        :param warmup: Whether to warm up the parent before forking
+        :param threads: Executor threads per worker for fallback analysis
+        """
+        if not hasattr(os, 'fork'):
+            raise RuntimeError("Pre-fork workers need os.fork, which this platform doesn't provide")
+        if workers < 1:
+            raise ValueError("Need at least one worker")
+
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.knowledge_path = knowledge_path
+        self.warmup = warmup
+        self.threads = threads
+        self.timings = None
+        self.reports = []
+        self.respawns = 0
+        self.socket = None
+        self._chat_server = None
+        self._knowledge_store = None
+        self._children = {}
+        self._read_fd = None
+        self._write_fd = None
+        self._buffer = b''
+        self._stopping = False
+
+    def prepare(self):
+        """
+        Cold-start the parent and bind the listening socket
+
+        :return: Dict of cold-start timings and parent memory
+        """
+        self._chat_server, self._knowledge_store, self.timings = cold_start(self.knowledge_path, self.warmup)
+        self.timings['memory'] = memory_usage()
+
+        # Everything allocated so far lives as long as the workers; keeping the
+        # collector away from it stops collections from dirtying shared pages
+        gc.collect()
+        gc.freeze()
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((self.host, self.port))
+        self.socket.listen(socket.SOMAXCONN)
+        self.socket.setblocking(False)
+        self.port = self.socket.getsockname()[1]
+
+        self._read_fd, self._write_fd = os.pipe()
+        return self.timings
+
+    def _spawn(self, index):
+        forked_at = time.perf_counter()
+        pid = os.fork()
+        if pid:
+            self._children[pid] = index
+            return pid
+
+        status = 0
+        try:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            os.close(self._read_fd)
+            _run_worker(index, self._chat_server, self._knowledge_store, self.socket, self._write_fd,
+                        forked_at, self.threads)
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+            status = 1
+        finally:
+            os._exit(status)
+
+    def start(self):
+        """Fork the workers, calling prepare() first if needed"""
+        if self.socket is None:
+            self.prepare()
+        for index in range(self.workers):
+            self._spawn(index)
+
+    def poll(self, timeout=REAP_INTERVAL):
+        """
+        Collect worker reports and replace workers that exited
+
+        :param timeout: Seconds to wait for a report
+        :return: List of reports received
+        """
+        received = []
+        readable, _, _ = select.select([self._read_fd], [], [], timeout)
+        if readable:
+            self._buffer += os.read(self._read_fd, 65536)
+            *lines, self._buffer = self._buffer.split(b'\n')
+            received = [json.loads(line) for line in lines if line]
+            self.reports.extend(received)
+
+        while self._children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if not pid:
+                break
+            index = self._children.pop(pid, None)
+            if index is None or self._stopping:
+                continue
+            self.respawns += 1
+            received.append({'event': 'exited', 'worker': index, 'pid': pid,
+                             'status': os.waitstatus_to_exitcode(status)})
+            self._spawn(index)
+        return received
+
+    def stop(self, timeout=5.0):
+        """
+        Terminate every worker and wait for them to exit
+
+        :param timeout: Seconds to wait before killing workers that are still running
+        """
+        self._stopping = True
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self._children.pop(pid)
+
+        deadline = time.monotonic() + timeout
+        while self._children:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+            if pid:
+                self._children.pop(pid, None)
+                continue
+            if time.monotonic() >= deadline:
+                for pid in self._children:
+                    os.kill(pid, signal.SIGKILL)
+                deadline = float('inf')
+            time.sleep(0.05)
+
+        if self.socket is not None:
+            self.socket.close()
+        for fd in (self._read_fd, self._write_fd):
+            if fd is not None:
+                os.close(fd)
+        self._read_fd = self._write_fd = None
+
+    def run_forever(self, formatter=None):
+        """
+        Start the workers and print their reports until interrupted
+
+        :param formatter: Callable turning a report dict into a line, format_report by default
+        """
+        formatter = formatter or format_report
+        self.start()
+        print(formatter({'event': 'parent', 'pid': os.getpid(), **self.timings}), flush=True)
+        print(formatter({'event': 'listening', 'host': self.host, 'port': self.port, 'workers': self.workers}),
+              flush=True)
+
+        def terminate(signum, frame):
+            raise KeyboardInterrupt
+
+        previous = signal.signal(signal.SIGTERM, terminate)
+        try:
+            while True:
+                for report in self.poll():
+                    print(formatter(report), flush=True)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+            self.stop()
+
+
+def _format_memory(memory):
+    parts = [f"{name[:-3]} {value / 1024:.1f} MiB" for name, value in memory.items()]
+    return ', '.join(parts) if parts else 'memory n/a'
+
+
+def format_report(report):
+    """
+    :param report: Report dict from a worker or the parent
+    :return: One human-readable line
+    """
+    event = report['event']
+    if event == 'parent':
+        return (f"parent (pid {report['pid']}): cold start {report['cold_start_ms']:.1f} ms "
+                f"(import {report['import_ms']:.1f} ms, knowledge {report['knowledge_ms']:.1f} ms, "
+                f"warm-up {report['warmup_ms']:.1f} ms); {_format_memory(report['memory'])}")
+
+    if event == 'listening':
+        return f"listening on {report['host']}:{report['port']} with {report['workers']} workers"
+
+    prefix = f"worker {report['worker']} (pid {report['pid']})"
+    if event == 'ready':
+        return f"{prefix}: ready {report['since_fork_ms']:.1f} ms after fork; {_format_memory(report['memory'])}"
+    if event == 'first_response':
+        return (f"{prefix}: first response {report['since_fork_ms']:.1f} ms after fork, "
+                f"handled in {report['handled_ms']:.2f} ms; {_format_memory(report['memory'])}")
+    if event == 'exited':
+        return f"{prefix}: exited with status {report['status']}, respawning"
+    return json.dumps(report)
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the chat bot from pre-forked, pre-warmed worker processes")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes to fork")
+    parser.add_argument('--threads', type=int, default=None, help="Executor threads per worker for fallback analysis")
+    parser.add_argument('--knowledge', metavar='FILE',
+                        help="Install intents and knowledge from a JSON/TOML file before forking "
+                             "(the 'reload' command only reloads the worker that receives it)")
+    parser.add_argument('--no-warmup', action='store_true',
+                        help="Fork straight after importing, to compare against cold workers")
+    parser.add_argument('--json', action='store_true', help="Print raw JSON reports")
+    args = parser.parse_args(argv)
+
+    launcher = PreforkLauncher(workers=args.workers, host=args.host, port=args.port,
+                               knowledge_path=args.knowledge, warmup=not args.no_warmup, threads=args.threads)
+    launcher.run_forever(json.dumps if args.json else format_report)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,283 @@
+import array
+import collections
+import functools
+import itertools
+
+from backends import available_backends, numpy, select_backend
+
+# Credit tier and the APR offered to it, best tier first
+RATE_TIERS = (('excellent', 5.9), ('good', 7.9), ('fair', 11.9), ('poor', 16.9))
+LOAN_TERMS = (36, 48, 60, 72, 84)
+# Lease term in months and the residual value as a fraction of the price
+LEASE_RESIDUALS = ((24, 0.60), (36, 0.52))
+# Cash down, in dollars
+DOWN_PAYMENTS = (0, 2000, 5000)
+
+Scenario = collections.namedtuple('Scenario', ['kind', 'months', 'tier', 'apr', 'down_payment', 'residual'])
+Scenario.__doc__ = """One financing offer: a 'loan' or 'lease' for some months, at a tier's APR, with cash down"""
+
+Quote = collections.namedtuple('Quote', ['row', 'price', 'scenario', 'monthly_payment', 'total_cost',
+                                         'finance_charge'])
+Quote.__doc__ = """
+Monthly payment of one vehicle under one scenario
+
+total_cost is the down payment plus every monthly payment; finance_charge
+is the part of it that is interest (loans) or rent charge (leases).
+"""
+
+QuoteGrid = collections.namedtuple('QuoteGrid', ['monthly_payment', 'total_cost', 'finance_charge'])
+QuoteGrid.__doc__ = """
+Vehicle x scenario quote matrices
+
+NumPy arrays of shape (vehicles, scenarios), or with the pure-Python backend
+one array.array per scenario.
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def amortization_factor(apr, months):
+    """
+    Monthly payment per dollar financed
+
+    :param apr: Annual percentage rate, e.g. 5.9
+    :param months: Loan term
+    :return: Payment factor
+    """
+    rate = apr / 1200
+    if rate == 0:
+        return 1 / months
+    return rate / (1 - (1 + rate) ** -months)
+
+
+@functools.lru_cache(maxsize=None)
+def lease_factors(apr, months, residual):
+    """
+    Lease payment per dollar of price and per dollar of cash down
+
+    The payment is depreciation, (capitalized cost - residual) / months,
+    plus the rent charge, (capitalized cost + residual) * money factor, with
+    the money factor at APR / 2400.
+
+    :param apr: Annual percentage rate
+    :param months: Lease term
+    :param residual: Residual value as a fraction of the price
+    :return: (payment per dollar of price, payment reduction per dollar down, rent charge per dollar of price,
+        rent charge reduction per dollar down)
+    """
+    money_factor = apr / 2400
+    return ((1 - residual) / months + (1 + residual) * money_factor, 1 / months + money_factor,
+            (1 + residual) * money_factor * months, money_factor * months)
+
+
+def build_scenarios(rate_tiers=RATE_TIERS, loan_terms=LOAN_TERMS, lease_residuals=LEASE_RESIDUALS,
+                    down_payments=DOWN_PAYMENTS):
+    """
+    Every combination of term, rate tier and down payment
+
+    :param rate_tiers: Pairs of credit tier and APR
+    :param loan_terms: Loan terms in months
+    :param lease_residuals: Pairs of lease term and residual fraction
+    :param down_payments: Cash down options in dollars
+    :return: List of Scenarios, loans first
+    """
+    scenarios = [Scenario('loan', months, tier, apr, down, None)
+                 for months, (tier, apr), down in itertools.product(loan_terms, rate_tiers, down_payments)]
+    scenarios.extend(Scenario('lease', months, tier, apr, down, residual)
+                     for (months, residual), (tier, apr), down in
+                     itertools.product(lease_residuals, rate_tiers, down_payments))
+    return scenarios
+
+
+class QuoteEngine:
+    """
+    Monthly payment quotes for many vehicles under many financing scenarios
+
+    Every scenario's payment is a linear function of the vehicle price,
+    ``max(0, price * slope - intercept)``, whose coefficients come from the
+    memoized rate and term factors, so a whole grid is one multiply-subtract
+    per cell: a broadcast with NumPy, one batched pass per scenario
+    without it. The same linearity gives each scenario the highest price a
+    monthly budget covers, which best_quotes() uses to skip the grid
+    entirely when only the top few quotes are wanted.
+    """
+
+    def __init__(self, scenarios):
+        """
+        :param scenarios: Sequence of Scenarios
+        """
+        self.scenarios = list(scenarios)
+        # payment = max(0, price * slope - intercept); finance charge = price * charge_slope - charge_intercept
+        self.slopes = array.array('d')
+        self.intercepts = array.array('d')
+        self.charge_slopes = array.array('d')
+        self.charge_intercepts = array.array('d')
+        for scenario in self.scenarios:
+            if scenario.kind == 'loan':
+                factor = amortization_factor(scenario.apr, scenario.months)
+                # Interest per dollar financed over the whole term
+                interest = factor * scenario.months - 1
+                slope, intercept = factor, scenario.down_payment * factor
+                charge_slope, charge_intercept = interest, interest * scenario.down_payment
+            elif scenario.kind == 'lease':
+                slope, per_down, charge_slope, charge_per_down = lease_factors(
+                    scenario.apr, scenario.months, scenario.residual
+                )
+                intercept = scenario.down_payment * per_down
+                charge_intercept = scenario.down_payment * charge_per_down
+            else:
+                raise ValueError(f"Unknown scenario kind '{scenario.kind}', expected 'loan' or 'lease'")
+            self.slopes.append(slope)
+            self.intercepts.append(intercept)
+            self.charge_slopes.append(charge_slope)
+            self.charge_intercepts.append(charge_intercept)
+
+    def __len__(self):
+        return len(self.scenarios)
+
+    def quote(self, price, number):
+        """
+        :param price: Vehicle price
+        :param number: Scenario position
+        :return: Quote with row None
+        """
+        scenario = self.scenarios[number]
+        payment = max(0.0, price * self.slopes[number] - self.intercepts[number])
+        if payment == 0.0:
+            # The down payment covers the price
+            charge = 0.0
+        else:
+            charge = price * self.charge_slopes[number] - self.charge_intercepts[number]
+        return Quote(None, price, scenario, payment, min(price, scenario.down_payment) + payment * scenario.months,
+                     charge)
+
+    def grid(self, prices, backend=None):
+        """
+        Quote every vehicle under every scenario
+
+        :param prices: Vehicle prices, any sequence or buffer of numbers
+        :param backend: 'numpy' or 'python'; NumPy is used when installed if omitted
+        :return: QuoteGrid
+        """
+        backend = select_backend(backend)
+
+        months = [scenario.months for scenario in self.scenarios]
+        downs = [float(scenario.down_payment) for scenario in self.scenarios]
+        if backend == 'numpy':
+            price = numpy.asarray(prices, dtype=numpy.float64)[:, None]
+            payment = numpy.maximum(price * numpy.asarray(self.slopes) - numpy.asarray(self.intercepts), 0.0)
+            covered = payment == 0.0
+            total = numpy.minimum(price, numpy.asarray(downs)) + payment * numpy.asarray(months, dtype=numpy.float64)
+            charge = price * numpy.asarray(self.charge_slopes) - numpy.asarray(self.charge_intercepts)
+            charge[covered] = 0.0
+            return QuoteGrid(payment, total, charge)
+
+        prices = array.array('d', prices)
+        payments, totals, charges = [], [], []
+        for slope, intercept, charge_slope, charge_intercept, term, down in zip(
+                self.slopes, self.intercepts, self.charge_slopes, self.charge_intercepts, months, downs):
+            payment = array.array('d', [max(0.0, price * slope - intercept) for price in prices])
+            payments.append(payment)
+            totals.append(array.array('d', [
+                (price if price < down else down) + monthly * term for price, monthly in zip(prices, payment)
+            ]))
+            charges.append(array.array('d', [
+                price * charge_slope - charge_intercept if monthly else 0.0 for price, monthly in zip(prices, payment)
+            ]))
+        return QuoteGrid(payments, totals, charges)
+
+    def max_prices(self, monthly_budget):
+        """
+        :param monthly_budget: Highest acceptable monthly payment
+        :return: List with the highest vehicle price each scenario keeps within the budget
+        """
+        return [(monthly_budget + intercept) / slope for slope, intercept in zip(self.slopes, self.intercepts)]
+
+    def best_quotes(self, prices, monthly_budget, limit=3, order=None):
+        """
+        The most expensive vehicles a monthly budget covers, each with its cheapest qualifying scenario
+
+        Vehicles are visited from the most expensive down, starting at the
+        highest price any scenario covers; each one is quoted only under the
+        scenarios that cover it, and the scan stops after ``limit`` vehicles.
+
+        :param prices: Vehicle prices
+        :param monthly_budget: Highest acceptable monthly payment
+        :param limit: Number of vehicles to quote
+        :param order: Row numbers sorted by ascending price, e.g. from VehicleInventory.sorted_rows('price');
+            computed if omitted
+        :return: List of Quotes, most expensive vehicle first, each under the scenario with the lowest
+            finance charge (then the lowest total cost, then the earliest scenario)
+        """
+        if order is None:
+            order = sorted(range(len(prices)), key=prices.__getitem__)
+        if limit <= 0 or not len(order) or monthly_budget < 0:
+            return []
+
+        covers = sorted(zip(self.max_prices(monthly_budget), range(len(self.scenarios))), reverse=True)
+        ceiling = covers[0][0]
+        # Rows sorted by price, so the affordable ones are a prefix
+        low, high = 0, len(order)
+        while low < high:
+            middle = (low + high) // 2
+            if prices[order[middle]] <= ceiling:
+                low = middle + 1
+            else:
+                high = middle
+
+        quotes = []
+        eligible = []
+        for position in range(low - 1, -1, -1):
+            row = order[position]
+            price = prices[row]
+            # Prices only fall from here on, so scenarios once eligible stay eligible
+            while len(eligible) < len(covers) and covers[len(eligible)][0] >= price:
+                eligible.append(covers[len(eligible)][1])
+            best = min(((self.quote(price, number), number) for number in eligible),
+                       key=lambda entry: (entry[0].finance_charge, entry[0].total_cost, entry[1]))
+            quotes.append(best[0]._replace(row=row))
+            if len(quotes) == limit:
+                break
+        return quotes
+
+
+@functools.lru_cache(maxsize=32)
+def engine_for(rate_tiers=RATE_TIERS, loan_terms=LOAN_TERMS, lease_residuals=LEASE_RESIDUALS,
+               down_payments=DOWN_PAYMENTS):
+    """
+    Shared QuoteEngine for one set of financing terms; arguments must be hashable
+
+    :return: QuoteEngine over build_scenarios() of the arguments
+    """
+    return QuoteEngine(build_scenarios(rate_tiers, loan_terms, lease_residuals, down_payments))
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import random
+    import time
+
+    parser = argparse.ArgumentParser(description="Time quote grids over a synthetic vehicle inventory")
+    parser.add_argument('--vehicles', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    prices = array.array('l', (rng.randint(8000, 90000) for _ in range(args.vehicles)))
+    order = sorted(range(len(prices)), key=prices.__getitem__)
+    # 20 scenarios: every loan term at every rate tier, no money down
+    engine = QuoteEngine(build_scenarios(loan_terms=LOAN_TERMS, lease_residuals=(), down_payments=(0,)))
+
+    def best_of(function):
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+        return round(min(timings) * 1000, 3)
+
+    report = {'vehicles': len(prices), 'scenarios': len(engine)}
+    for backend in available_backends():
+        report[f'grid_ms[{backend}]'] = best_of(lambda: engine.grid(prices, backend))
+    report['best_quotes_ms'] = best_of(lambda: engine.best_quotes(prices, 450, limit=10, order=order))
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,243 @@
+import argparse
+import collections
+import concurrent.futures
+import itertools
+import json
+import os
+import sys
+
+import main as chatbot
+from intent_registry import Intent, IntentRegistry
+
+# Settings a replay configuration file may override, with the in-tree values as defaults
+CONFIG_DEFAULTS = {
+    'match_threshold': chatbot.MATCH_THRESHOLD,
+    'similarity_threshold': 0.6,
+    'matching_mode': 'indexed',
+    'intents': None
+}
+
+# Line numbers of invalid JSON lines listed in the summary; all of them are counted
+MAX_REPORTED_BAD_LINES = 20
+
+_worker_configs = None
+
+
+def load_config(path=None):
+    """
+    Load a replay configuration
+
+    A configuration is a JSON object with optional ``match_threshold``,
+    ``similarity_threshold``, ``matching_mode`` and ``intents`` keys. ``intents``
+    is either a list of intent records or the path of a JSON file holding one;
+    when it's missing, main.DEALERSHIP_INTENTS are used.
+
+    :param path: Path to a JSON config file, or None for the in-tree configuration
+    :return: Config dict with every key filled in
+    :raises ValueError: If the file has unknown keys
+    """
+    config = dict(CONFIG_DEFAULTS)
+    if path is None:
+        return config
+
+    with open(path, encoding='utf-8') as config_file:
+        overrides = json.load(config_file)
+    unknown = set(overrides) - set(CONFIG_DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown config keys in {path}: {', '.join(sorted(unknown))}")
+    config.update(overrides)
+
+    if isinstance(config['intents'], str):
+        intents_path = os.path.join(os.path.dirname(path), config['intents'])
+        with open(intents_path, encoding='utf-8') as intents_file:
+            config['intents'] = json.load(intents_file)
+    return config
+
+
+def build_matcher(config):
+    """
+    :param config: Config dict from load_config
+    :return: (IntentRegistry, match threshold)
+    """
+    if config['intents'] is None:
+        intents = chatbot.DEALERSHIP_INTENTS
+    else:
+        intents = [Intent.from_dict(record) for record in config['intents']]
+    registry = IntentRegistry(
+        intents, similarity_threshold=config['similarity_threshold'], matching_mode=config['matching_mode']
+    )
+    return registry, config['match_threshold']
+
+
+def _init_worker(baseline_config, current_config):
+    global _worker_configs
+    _worker_configs = (build_matcher(baseline_config), build_matcher(current_config))
+
+
+def _replay_chunk(chunk):
+    (baseline_registry, baseline_threshold), (current_registry, current_threshold) = _worker_configs
+    messages = [chatbot.preprocess_input(message) for _, message in chunk]
+    baseline = chatbot.batch_scoring.match_batch(messages, baseline_registry, baseline_threshold)
+    current = chatbot.batch_scoring.match_batch(messages, current_registry, current_threshold)
+
+    results = []
+    for (line_number, message), (old_intent, old_score), (new_intent, new_score) in zip(chunk, baseline, current):
+        results.append((
+            line_number, message,
+            old_intent.intent_id if old_intent is not None else None, old_score,
+            new_intent.intent_id if new_intent is not None else None, new_score
+        ))
+    return results
+
+
+def read_messages(lines, field='message', bad_lines=None):
+    """
+    Extract user messages from transcript lines
+
+    Each line is a JSON object holding the message under ``field``, or a bare
+    JSON string. Blank lines, lines that aren't valid JSON and lines without a
+    string message are skipped.
+
+    :param lines: Iterable of JSONL lines
+    :param field: Name of the message field
+    :param bad_lines: Optional list the line numbers of invalid JSON lines are appended to
+    :return: Generator of (line number, message)
+    """
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            if bad_lines is not None:
+                bad_lines.append(line_number)
+            continue
+        message = record.get(field) if isinstance(record, dict) else record
+        if isinstance(message, str):
+            yield line_number, message
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def replay(messages, baseline_config, current_config, workers=None, chunk_size=1000, max_pending=None):
+    """
+    Replay messages through two configurations across a process pool
+
+    Chunks are submitted through a bounded window and yielded in input
+    order, so memory use doesn't grow with the size of the transcript.
+
+    :param messages: Iterable of (line number, message)
+    :param baseline_config: Config dict for the baseline
+    :param current_config: Config dict for the current configuration
+    :param workers: Worker processes, os.cpu_count() by default
+    :param chunk_size: Messages per task
+    :param max_pending: Chunks in flight, 4 per worker by default
+    :return: Generator of (line, message, baseline intent, baseline score, current intent, current score)
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 4
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(baseline_config, current_config)
+    ) as executor:
+        pending = collections.deque()
+        for chunk in _chunks(messages, chunk_size):
+            pending.append(executor.submit(_replay_chunk, chunk))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+class DiffReport:
+    """Running summary of which intents and scores changed between configurations"""
+
+    def __init__(self):
+        self.total = 0
+        self.intent_changes = 0
+        self.score_changes = 0
+        self.transitions = collections.Counter()
+
+    def add(self, old_intent, old_score, new_intent, new_score):
+        """
+        :return: Whether this result differs between the configurations
+        """
+        self.total += 1
+        if old_intent != new_intent:
+            self.intent_changes += 1
+            self.transitions[(old_intent, new_intent)] += 1
+            return True
+        if old_score != new_score:
+            self.score_changes += 1
+            return True
+        return False
+
+    def summary(self, top=20):
+        return {
+            'messages': self.total,
+            'intent_changes': self.intent_changes,
+            'score_only_changes': self.score_changes,
+            'unchanged': self.total - self.intent_changes - self.score_changes,
+            'top_transitions': [
+                {'baseline': old, 'current': new, 'count': count}
+                for (old, new), count in self.transitions.most_common(top)
+            ]
+        }
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Replay a JSONL transcript through a baseline and the current configuration and diff the results"
+    )
+    parser.add_argument('transcript', help="JSONL transcript file, '-' for stdin")
+    parser.add_argument('--baseline', help="Baseline config JSON (in-tree configuration if omitted)")
+    parser.add_argument('--current', help="Current config JSON (in-tree configuration if omitted)")
+    parser.add_argument('--field', default='message', help="Name of the message field in each record")
+    parser.add_argument('--output', help="Write changed results as JSONL here instead of stdout")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--max-message-chars', type=int, default=200,
+                        help="Truncate messages in the diff output")
+    args = parser.parse_args(argv)
+
+    baseline_config = load_config(args.baseline)
+    current_config = load_config(args.current)
+
+    transcript = sys.stdin if args.transcript == '-' else open(args.transcript, encoding='utf-8')
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    report = DiffReport()
+    bad_lines = []
+    try:
+        results = replay(
+            read_messages(transcript, args.field, bad_lines), baseline_config, current_config,
+            workers=args.workers, chunk_size=args.chunk_size
+        )
+        for line_number, message, old_intent, old_score, new_intent, new_score in results:
+            if report.add(old_intent, old_score, new_intent, new_score):
+                output.write(json.dumps({
+                    'line': line_number,
+                    'message': message[:args.max_message_chars],
+                    'baseline': [old_intent, old_score],
+                    'current': [new_intent, new_score]
+                }) + '\n')
+    finally:
+        if transcript is not sys.stdin:
+            transcript.close()
+        if output is not sys.stdout:
+            output.close()
+
+    summary = report.summary()
+    summary['bad_lines'] = len(bad_lines)
+    summary['bad_line_numbers'] = bad_lines[:MAX_REPORTED_BAD_LINES]
+    print(json.dumps(summary, indent=2), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,116 @@
+import contextvars
+import hashlib
+import random
+
+
+class RequestRandom:
+    """
+    Deterministic random choices for one request
+
+    Every draw hashes the request's key with a draw counter, so the same
+    seed, session and message always produce the same choices, whichever
+    thread or process answers the request. Nothing is shared between
+    requests, and unlike random.Random there is no generator state to
+    seed, which would cost more than the request itself.
+    """
+    __slots__ = ('_parts', '_key', 'draws')
+
+    def __init__(self, seed, *parts):
+        """
+        :param seed: Integer or string seed
+        :param parts: Further values the choices depend on, e.g. the session ID and the message
+        """
+        self._parts = (seed,) + parts
+        self._key = None
+        self.draws = 0
+
+    def _next(self):
+        if self._key is None:
+            # Derived on the first draw, so requests that never choose don't pay for hashing the message
+            self._key = hashlib.blake2b(repr(self._parts).encode('utf-8'), digest_size=32).digest()
+        self.draws += 1
+        digest = hashlib.blake2b(self.draws.to_bytes(8, 'little'), key=self._key, digest_size=8).digest()
+        return int.from_bytes(digest, 'little')
+
+    def random(self):
+        """
+        :return: Float in [0, 1)
+        """
+        return (self._next() >> 11) / (1 << 53)
+
+    def choice(self, sequence):
+        """
+        :param sequence: Non-empty sequence
+        :return: One of its items
+        :raises IndexError: If the sequence is empty
+        """
+        if not sequence:
+            raise IndexError("Cannot choose from an empty sequence")
+        return sequence[self._next() % len(sequence)]
+
+
+class _Seeded:
+    __slots__ = ('rng', 'token')
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.token = None
+
+    def __enter__(self):
+        self.token = _current.set(self.rng)
+        return self.rng
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _current.reset(self.token)
+        return False
+
+
+class _Unseeded:
+    """Shared no-op context for requests without a seed, which keep the surrounding source of randomness"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return current()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_UNSEEDED = _Unseeded()
+
+# A context variable keeps the generators of concurrent requests apart across threads and asyncio tasks alike
+_current = contextvars.ContextVar('request_rng', default=None)
+
+
+def current():
+    """
+    :return: RequestRandom of the current request, or the global random module outside seeded requests
+    """
+    rng = _current.get()
+    return random if rng is None else rng
+
+
+def choice(sequence):
+    """
+    Pick an item with the current request's generator
+
+    :param sequence: Non-empty sequence
+    :return: One of its items
+    """
+    rng = _current.get()
+    if rng is None:
+        return random.choice(sequence)
+    return rng.choice(sequence)
+
+
+def seeded(seed, *parts):
+    """
+    Context in which choice() draws from a RequestRandom
+
+    :param seed: Seed, or None to keep drawing from the surrounding generator
+    :param parts: Further values the choices depend on, e.g. the session ID and the message
+    :return: Context manager yielding the generator in use
+    """
+    if seed is None:
+        return _UNSEEDED
+    return _Seeded(RequestRandom(seed, *parts))
@@ -0,0 +1,276 @@
+import collections
+import sys
+import threading
+import time
+
+# Read-only view of a session handed out by SessionStore.get
+SessionContext = collections.namedtuple(
+    'SessionContext', ['session_id', 'last_intent', 'vehicle_type', 'budget', 'turns']
+)
+
+# Dict slot (hash, key and value pointers, index entry) plus one timer wheel set slot (hash and key pointer),
+# each with the headroom the tables keep free
+_ENTRY_OVERHEAD = 96
+
+
+class _SessionRecord:
+    """Fixed-layout session state; intent and vehicle type are symbol numbers"""
+    __slots__ = ('tick', 'turns', 'intent', 'vehicle', 'budget')
+
+    def __init__(self, tick):
+        self.tick = tick
+        self.turns = 0
+        self.intent = -1
+        self.vehicle = -1
+        self.budget = None
+
+
+_RECORD_SIZE = sys.getsizeof(_SessionRecord(0))
+
+
+class SessionStore:
+    """
+    Bounded store of multi-turn conversation state
+
+    Each session keeps its last matched intent, the vehicle type it asked
+    about, its budget and its turn count in a ``__slots__`` record. Intent IDs
+    and vehicle types are interned into a shared symbol table, so records hold
+    small ints instead of strings.
+
+    Sessions are filed in a timer wheel under the tick of their last access.
+    Expiry empties the slots that fell out of the TTL window and LRU eviction
+    takes from the oldest occupied slot, so neither scans the whole store.
+    Slots are sets, so a touched session moves to the slot of the new tick in
+    constant time and each session has exactly one wheel entry, which the
+    memory estimate counts.
+    """
+
+    def __init__(self, ttl=1800.0, max_sessions=1000000, max_bytes=256 * 1024 * 1024, resolution=1.0,
+                 clock=time.monotonic):
+        """
+        :param ttl: Seconds of inactivity after which a session expires
+        :param max_sessions: Maximum number of sessions kept, least recently used ones are evicted
+        :param max_bytes: Approximate memory budget for keys and records
+        :param resolution: Seconds per timer wheel slot; expiry and LRU order are this coarse
+        :param clock: Monotonic time source
+        """
+        if ttl <= 0 or resolution <= 0:
+            raise ValueError("ttl and resolution must be positive")
+
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.resolution = resolution
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._symbols = []
+        self._symbol_ids = {}
+
+        self._ttl_ticks = max(1, int(-(-ttl // resolution)))
+        self._wheel = [set() for _ in range(self._ttl_ticks + 1)]
+        self._now = self._tick()
+        # Every slot for ticks up to this one has been emptied
+        self._swept = self._now - 1
+
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _tick(self):
+        return int(self._clock() / self.resolution)
+
+    def _intern(self, value):
+        number = self._symbol_ids.get(value)
+        if number is None:
+            number = self._symbol_ids[value] = len(self._symbols)
+            self._symbols.append(value)
+        return number
+
+    def _symbol(self, number):
+        return self._symbols[number] if number >= 0 else None
+
+    @staticmethod
+    def _entry_size(session_id):
+        return sys.getsizeof(session_id) + _RECORD_SIZE + _ENTRY_OVERHEAD
+
+    def _remove(self, session_id):
+        record = self._sessions.pop(session_id)
+        self._wheel[record.tick % len(self._wheel)].discard(session_id)
+        self.bytes -= self._entry_size(session_id)
+
+    def _advance(self):
+        self._now = now = max(self._now, self._tick())
+        expire_through = now - self._ttl_ticks
+        if expire_through <= self._swept:
+            return
+
+        # A slot is reused every len(wheel) ticks, so there is never more than one lap to sweep
+        first = max(self._swept + 1, expire_through - len(self._wheel) + 1)
+        wheel = self._wheel
+        for tick in range(first, expire_through + 1):
+            slot = wheel[tick % len(wheel)]
+            if slot:
+                wheel[tick % len(wheel)] = set()
+                for session_id in slot:
+                    self._remove(session_id)
+                self.expirations += len(slot)
+        self._swept = expire_through
+
+    def _evict_oldest(self):
+        for tick in range(self._swept + 1, self._now + 1):
+            slot = self._wheel[tick % len(self._wheel)]
+            if slot:
+                self._remove(next(iter(slot)))
+                self.evictions += 1
+                return True
+            # Empty slots before the current one stay empty, it is the only one still receiving sessions
+            if tick < self._now:
+                self._swept = tick
+        return False
+
+    def _touch(self, session_id, record):
+        if record.tick != self._now:
+            wheel = self._wheel
+            wheel[record.tick % len(wheel)].discard(session_id)
+            record.tick = self._now
+            wheel[self._now % len(wheel)].add(session_id)
+
+    def get(self, session_id):
+        """
+        :param session_id: Session identifier
+        :return: SessionContext, or None if the session is unknown or expired
+        """
+        with self._lock:
+            self._advance()
+            record = self._sessions.get(session_id)
+            if record is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touch(session_id, record)
+            return SessionContext(session_id, self._symbol(record.intent), self._symbol(record.vehicle),
+                                  record.budget, record.turns)
+
+    def update(self, session_id, intent_id=None, vehicle_type=None, budget=None):
+        """
+        Record one conversation turn
+
+        Fields passed as None keep their previous value, so a turn that
+        matched no intent doesn't erase what the session talked about before.
+
+        :param session_id: Session identifier
+        :param intent_id: ID of the intent matched this turn
+        :param vehicle_type: Vehicle type mentioned this turn
+        :param budget: Budget mentioned this turn, in dollars
+        :return: SessionContext after the update
+        """
+        with self._lock:
+            self._advance()
+            record = self._sessions.get(session_id)
+            if record is None:
+                size = self._entry_size(session_id)
+                while self._sessions and (len(self._sessions) >= self.max_sessions
+                                          or self.bytes + size > self.max_bytes):
+                    if not self._evict_oldest():
+                        break
+                record = self._sessions[session_id] = _SessionRecord(self._now)
+                self._wheel[self._now % len(self._wheel)].add(session_id)
+                self.bytes += size
+                self.created += 1
+            else:
+                self._touch(session_id, record)
+
+            record.turns += 1
+            if intent_id is not None:
+                record.intent = self._intern(intent_id)
+            if vehicle_type is not None:
+                record.vehicle = self._intern(vehicle_type)
+            if budget is not None:
+                record.budget = budget
+            return SessionContext(session_id, self._symbol(record.intent), self._symbol(record.vehicle),
+                                  record.budget, record.turns)
+
+    def discard(self, session_id):
+        """
+        Forget a session
+
+        :param session_id: Session identifier
+        """
+        with self._lock:
+            if session_id in self._sessions:
+                self._remove(session_id)
+
+    def expire(self):
+        """Drop sessions whose TTL has passed; also happens on every get and update"""
+        with self._lock:
+            self._advance()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def stats(self):
+        """
+        :return: Dict of session counts, memory estimate and eviction counters
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'sessions': len(self._sessions),
+                'bytes': self.bytes,
+                'bytes_per_session': self.bytes / len(self._sessions) if self._sessions else 0.0,
+                'symbols': len(self._symbols),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'created': self.created,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import tracemalloc
+
+    parser = argparse.ArgumentParser(description="Measure session store memory and lookup cost")
+    parser.add_argument('--sessions', type=int, default=1000000)
+    parser.add_argument('--lookups', type=int, default=200000)
+    args = parser.parse_args()
+
+    intents = ['greeting', 'vehicle_sedan', 'vehicle_suv', 'vehicle_truck', 'financing', 'negotiation']
+    vehicles = ['sedan', 'suv', 'truck', 'electric', 'hybrid']
+    session_ids = [f'session-{number:010d}' for number in range(args.sessions)]
+    rng = random.Random(0)
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    store = SessionStore(max_sessions=args.sessions, max_bytes=1 << 40)
+    start = time.perf_counter()
+    for number, session_id in enumerate(session_ids):
+        store.update(session_id, intents[number % len(intents)], vehicles[number % len(vehicles)],
+                     20000 + number % 50 * 1000)
+    fill = time.perf_counter() - start
+    used = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    key_bytes = sum(sys.getsizeof(session_id) for session_id in session_ids)
+    print(f"{args.sessions:,} sessions: {(used + key_bytes) / args.sessions:.0f} bytes/session measured "
+          f"(incl. {key_bytes / args.sessions:.0f} bytes of key), "
+          f"{store.stats()['bytes_per_session']:.0f} estimated; {fill / args.sessions * 1e6:.2f} us per insert "
+          f"under tracemalloc")
+
+    probes = [rng.choice(session_ids) for _ in range(args.lookups)]
+    for name, operation in (('get', store.get), ('update', lambda session_id: store.update(session_id, 'greeting'))):
+        start = time.perf_counter()
+        for session_id in probes:
+            operation(session_id)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>7}: {elapsed / len(probes) * 1e6:.2f} us per call at {len(store):,} sessions")
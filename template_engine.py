@@ -0,0 +1,186 @@
+import functools
+import operator
+import string
+import sys
+
+# Distinct template strings whose parsed form is kept
+DEFAULT_CACHE_SIZE = 4096
+
+_FORMATTER = string.Formatter()
+
+# Conversions _format_field applies; parse() accepts any character, which str.format rejects when rendering
+_CONVERSIONS = (None, 'r', 's', 'a')
+
+
+class Template:
+    """
+    A str.format template parsed once into literal and field segments
+
+    Templates without fields render to their interned text. Templates whose
+    fields are plain names are compiled to a printf-style string filled from
+    one itemgetter call, which skips str.format's parsing; a plain field of
+    str.format formats with an empty spec, which by convention (followed by
+    every built-in type) means str(), the same as %s. Fields with a
+    conversion or format spec are formatted one by one, and fields that use
+    attribute or index access, positional arguments or nested format specs
+    are left to str.format.
+    """
+    __slots__ = ('source', 'text', '_percent', '_parts', '_fetch', '_fields')
+
+    def __init__(self, source):
+        """
+        :param source: Template text in str.format syntax
+        """
+        self.source = source
+        self.text = None
+        self._percent = None
+        self._parts = None
+        try:
+            parsed = list(_FORMATTER.parse(source))
+        except ValueError:
+            # Malformed; render() raises the same error str.format does
+            return
+
+        # Literals and fields alternate, starting and ending with a (possibly empty) literal
+        parts = ['']
+        fields = []
+        for literal, name, format_spec, conversion in parsed:
+            parts[-1] += literal
+            if name is None:
+                continue
+            if not name.isidentifier() or '{' in format_spec or conversion not in _CONVERSIONS:
+                return
+            fields.append((name, conversion, format_spec))
+            parts.extend((None, ''))
+        if not fields:
+            self.text = sys.intern(parts[0])
+            return
+
+        getter = operator.itemgetter(*(name for name, _, _ in fields))
+        # itemgetter returns a bare value for a single name
+        self._fetch = getter if len(fields) > 1 else lambda values: (getter(values),)
+        if all(conversion is None and not format_spec for _, conversion, format_spec in fields):
+            self._percent = '%s'.join(literal.replace('%', '%%') for literal in parts[::2])
+        else:
+            self._parts = parts
+            self._fields = tuple(fields)
+
+    @property
+    def static(self):
+        """Whether the template has no fields"""
+        return self.text is not None
+
+    def render(self, values):
+        """
+        :param values: Dict of field name to value
+        :return: Rendered text, identical to source.format(**values)
+        :raises KeyError: If a field has no value
+        """
+        if self._percent is not None:
+            return self._percent % self._fetch(values)
+        if self.text is not None:
+            return self.text
+        if self._parts is None:
+            return self.source.format(**values)
+        parts = self._parts.copy()
+        parts[1::2] = map(_format_field, self._fields, self._fetch(values))
+        return ''.join(parts)
+
+
+def _format_field(field, value):
+    _, conversion, format_spec = field
+    if conversion == 'r':
+        value = repr(value)
+    elif conversion == 's':
+        value = str(value)
+    elif conversion == 'a':
+        value = ascii(value)
+    return format(value, format_spec)
+
+
+@functools.lru_cache(maxsize=DEFAULT_CACHE_SIZE)
+def compile_template(source):
+    """
+    Parsed form of a template, shared by every caller rendering the same text
+
+    :param source: Template text in str.format syntax
+    :return: Template
+    """
+    return Template(source)
+
+
+def render(source, **values):
+    """
+    :param source: Template text in str.format syntax
+    :param values: Field values
+    :return: Rendered text, identical to source.format(**values)
+    """
+    return compile_template(source).render(values)
+
+
+def precompile(templates):
+    """
+    Parse every template of a response table ahead of the first request
+
+    Static templates come back interned, so each distinct reply exists once
+    in memory however many tables or requests refer to it.
+
+    :param templates: Dict of response type to list of template strings
+    :return: Dict of response type to list of (interned) template strings
+    """
+    compiled = {}
+    for response_type, sources in templates.items():
+        compiled[response_type] = [
+            sys.intern(compile_template(source).source) if type(source) is str else source for source in sources
+        ]
+    return compiled
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import time
+
+    import auto_bot
+    import auto_dealership_knowledge
+
+    parser = argparse.ArgumentParser(description="Renders per second of compiled templates and pre-rendered replies")
+    parser.add_argument('--renders', type=int, default=200000)
+    args = parser.parse_args()
+
+    knowledge = auto_dealership_knowledge.AutoDealershipKnowledge
+    bot = auto_bot.AutoDealershipBot()
+    field_template = "Looking for a {topic}? They are known for being {attributes}."
+    values = {'topic': 'sedan', 'attributes': 'comfortable, fuel-efficient, family-friendly'}
+
+    def legacy_buying_guide():
+        # Previous behaviour: the numbered steps joined on every call
+        return "Auto Buying Process:\n" + ''.join(
+            f"{i}. {step}\n" for i, step in enumerate(knowledge.BUYING_PROCESS_STEPS, 1)
+        )
+
+    def legacy_maintenance():
+        return f"Key Maintenance Tips:\n{chr(10).join(knowledge.MAINTENANCE_ADVICE['frequency'])}"
+
+    def legacy_bot_steps():
+        return "Buying Process Steps:\n" + "\n".join(
+            f"{i+1}. {step}" for i, step in enumerate(bot.knowledge_base['buying_process'])
+        )
+
+    # Rendering alone; benchmarks.py times the same replies end to end
+    cases = [
+        ('field_template', lambda: field_template.format(**values),
+         lambda: compile_template(field_template).render(values)),
+        ('buying_process_guide', legacy_buying_guide, knowledge.buying_process_guide),
+        ('maintenance_reply', legacy_maintenance, lambda: knowledge.rendered_blocks().maintenance),
+        ('bot_buying_steps', legacy_bot_steps, lambda: bot.static_replies['buying_process']),
+    ]
+    report = {}
+    for name, before, after in cases:
+        assert before() == after(), name
+        for label, function in (('before', before), ('after', after)):
+            start = time.perf_counter()
+            for _ in range(args.renders):
+                function()
+            report[f'renders_per_second[{name},{label}]'] = round(args.renders / (time.perf_counter() - start))
+    print(json.dumps(report, indent=2))
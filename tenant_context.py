@@ -0,0 +1,74 @@
+import contextvars
+
+# A context variable keeps the engines of concurrent requests apart across threads and asyncio tasks alike
+_current = contextvars.ContextVar('tenant_engine', default=None)
+
+# Knowledge loaded from a file for requests without a tenant, published with one assignment by install();
+# None while the built-in knowledge in the module globals answers them
+_installed = None
+
+
+class _Serving:
+    __slots__ = ('engine', 'token')
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.token = None
+
+    def __enter__(self):
+        self.token = _current.set(self.engine)
+        return self.engine
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _current.reset(self.token)
+        return False
+
+
+class _Global:
+    """Shared no-op context for requests without a tenant, which answer from the installed knowledge"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return current()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_GLOBAL = _Global()
+
+
+def current():
+    """
+    :return: Engine answering the current request: the serving tenant's, else the installed bundle, else None
+        for the built-in knowledge
+    """
+    engine = _current.get()
+    return _installed if engine is None else engine
+
+
+def install(bundle):
+    """
+    Publish the knowledge requests without a tenant answer from
+
+    Requests pin the engine they start with (see main.stream_response), so a
+    request never mixes parts of two bundles.
+
+    :param bundle: Object with registry, intent_cache, response_templates and auto_knowledge attributes shaped
+        like tenants.TenantEngine's, e.g. knowledge_snapshot.Knowledge; None to go back to the built-in knowledge
+    """
+    global _installed
+    _installed = bundle
+
+
+def serving(engine):
+    """
+    Context in which main, long_responses and auto_dealership_knowledge answer from a tenant's engine
+
+    :param engine: tenants.TenantEngine, or None to keep the surrounding engine
+    :return: Context manager yielding the engine in use
+    """
+    if engine is None:
+        return _GLOBAL
+    return _Serving(engine)
+
@@ -0,0 +1,474 @@
+import argparse
+import collections
+import gc
+import itertools
+import json
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import types
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11, TOML tenant files are unavailable
+    tomllib = None
+
+import auto_dealership_knowledge
+import long_responses
+import main as chatbot
+import prefork
+import template_engine
+import tenant_context
+from intent_cache import IntentCache
+from intent_registry import Intent, IntentRegistry
+from knowledge_snapshot import KNOWLEDGE_CONSTANTS
+from latency_stats import LatencyRecorder
+
+# Knowledge constants a tenant overlays key by key; the other constants are replaced whole
+MERGED_CONSTANTS = ('VEHICLE_TYPES', 'MAINTENANCE_ADVICE', 'TOPIC_KEYWORDS')
+
+# Sections of a tenant overlay
+OVERLAY_SECTIONS = ('knowledge', 'response_templates', 'intents')
+
+# Memory budget for compiled tenant engines
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Intent cache of a tenant with intents of its own; tenants sharing the base intents share its cache
+TENANT_CACHE_ENTRIES = 1000
+TENANT_CACHE_BYTES = 256 * 1024
+
+# Shared by every tenant that doesn't override the corresponding part
+TenantBase = collections.namedtuple(
+    'TenantBase', ['registry', 'intent_cache', 'response_templates', 'auto_knowledge']
+)
+TenantBase.__doc__ = """Immutable knowledge every tenant overlays"""
+
+TenantEngine = collections.namedtuple(
+    'TenantEngine', ['tenant_id', 'registry', 'intent_cache', 'response_templates', 'auto_knowledge', 'bytes']
+)
+TenantEngine.__doc__ = """
+One tenant's compiled knowledge, in the shapes main, long_responses and
+auto_dealership_knowledge read while tenant_context.serving(engine) is active
+
+auto_knowledge is a (knowledge class, topic automaton, KnowledgeBlocks)
+triple. Parts the tenant doesn't override are the base's own objects; bytes
+estimates what the rest occupies.
+"""
+
+
+def installed_base():
+    """
+    Snapshot the globally installed knowledge as the base tenants overlay
+
+    :return: TenantBase
+    """
+    installed = tenant_context.current()
+    if installed is not None:
+        # Knowledge loaded from a file, see knowledge_snapshot.KnowledgeStore
+        return TenantBase(registry=installed.registry, intent_cache=IntentCache(),
+                          response_templates=installed.response_templates, auto_knowledge=installed.auto_knowledge)
+    knowledge = auto_dealership_knowledge.active_knowledge()
+    return TenantBase(
+        registry=chatbot.INTENT_REGISTRY,
+        intent_cache=IntentCache(),
+        response_templates=long_responses.RESPONSE_TEMPLATES,
+        auto_knowledge=(knowledge, auto_dealership_knowledge.build_topic_automaton(knowledge),
+                        knowledge.rendered_blocks())
+    )
+
+
+def validate_overlay(overlay):
+    """
+    :param overlay: Dict with optional 'knowledge', 'response_templates' and 'intents' sections
+    :raises ValueError: If a section or knowledge constant is unknown, or an intent record is malformed
+    """
+    if not isinstance(overlay, dict):
+        raise ValueError("A tenant overlay must be a dict")
+    unknown = set(overlay) - set(OVERLAY_SECTIONS)
+    if unknown:
+        raise ValueError(f"Unknown overlay sections: {', '.join(sorted(unknown))}")
+    constants = {name.lower() for name in KNOWLEDGE_CONSTANTS}
+    unknown = set(overlay.get('knowledge', {})) - constants
+    if unknown:
+        raise ValueError(f"Unknown knowledge constants: {', '.join(sorted(unknown))}")
+    for record in overlay.get('intents', ()):
+        Intent.from_dict(record)
+
+
+def build_engine(tenant_id, overlay, base):
+    """
+    Compile a tenant's overlay on top of the shared base
+
+    Only what the overlay changes is built: a knowledge class deriving from
+    the base one, a topic automaton if vehicle type names or topic keywords
+    changed, a template table whose untouched response types are the base's
+    lists, and an intent registry (with its fuzzy index and cache) only for
+    tenants with intents of their own.
+
+    :param tenant_id: Tenant ID
+    :param overlay: Validated overlay, see validate_overlay
+    :param base: TenantBase
+    :return: TenantEngine with bytes left at 0
+    """
+    base_knowledge, base_automaton, _ = base.auto_knowledge
+    overrides = {}
+    for name in KNOWLEDGE_CONSTANTS:
+        value = overlay.get('knowledge', {}).get(name.lower())
+        if value is None:
+            continue
+        if name in MERGED_CONSTANTS:
+            value = {**getattr(base_knowledge, name), **value}
+        overrides[name] = value
+    knowledge = auto_dealership_knowledge.derive_knowledge(overrides, base_knowledge) if overrides else base_knowledge
+    # The automaton only depends on the vehicle type names and the topic keywords
+    if (list(knowledge.VEHICLE_TYPES) == list(base_knowledge.VEHICLE_TYPES) and
+            knowledge.TOPIC_KEYWORDS == base_knowledge.TOPIC_KEYWORDS):
+        automaton = base_automaton
+    else:
+        automaton = auto_dealership_knowledge.build_topic_automaton(knowledge)
+
+    response_templates = base.response_templates
+    if overlay.get('response_templates'):
+        response_templates = {**response_templates, **template_engine.precompile(overlay['response_templates'])}
+
+    registry, intent_cache = base.registry, base.intent_cache
+    if overlay.get('intents'):
+        intents = {intent.intent_id: intent for intent in base.registry}
+        intents.update((intent.intent_id, intent) for intent in map(Intent.from_dict, overlay['intents']))
+        registry = IntentRegistry(intents.values(), similarity_threshold=base.registry.similarity_threshold,
+                                  matching_mode=base.registry.matching_mode, cache_size=base.registry.cache_size)
+        # Built now so the first request pays for it once, and its size is known
+        registry.matcher
+        intent_cache = IntentCache(max_entries=TENANT_CACHE_ENTRIES, max_bytes=TENANT_CACHE_BYTES)
+
+    return TenantEngine(tenant_id, registry, intent_cache, response_templates,
+                        (knowledge, automaton, knowledge.rendered_blocks()), 0)
+
+
+def _walk(value, seen):
+    # Approximate deep size of the objects reachable from value that aren't in seen; code is shared, not counted
+    size = 0
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if id(value) in seen or isinstance(value, (types.FunctionType, types.BuiltinFunctionType, types.ModuleType,
+                                                   classmethod, staticmethod, property)):
+            continue
+        seen.add(id(value))
+        size += sys.getsizeof(value)
+        if isinstance(value, dict):
+            stack.extend(value.keys())
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple, set, frozenset, collections.deque)):
+            stack.extend(value)
+        elif isinstance(value, type):
+            # Only a class's own namespace; its bases are either counted already or shared
+            stack.extend(vars(value).values())
+        else:
+            if hasattr(value, '__dict__'):
+                stack.append(vars(value))
+            for name in getattr(type(value), '__slots__', ()):
+                if hasattr(value, name):
+                    stack.append(getattr(value, name))
+    return size
+
+
+class TenantRegistry:
+    """
+    Dealership tenants answered by one process from a shared base
+
+    Each tenant is a thin overlay (a few vehicle types, financing options,
+    greetings, ...) on an immutable TenantBase. A tenant's engine is compiled
+    on its first request and kept in an LRU bounded by a memory budget, so a
+    process can host far more tenants than it keeps compiled at any time;
+    an evicted tenant is recompiled from its overlay when it returns.
+    Engines are immutable once built, so requests in flight keep working on
+    the engine they started with when it is evicted or its overlay replaced.
+    """
+
+    def __init__(self, overlays=None, base=None, max_bytes=DEFAULT_MAX_BYTES, max_engines=None):
+        """
+        :param overlays: Dict of tenant ID to overlay
+        :param base: TenantBase, installed_base() if None
+        :param max_bytes: Memory budget for compiled engines
+        :param max_engines: Most engines kept at once, unbounded if None
+        """
+        self.base = base or installed_base()
+        self.max_bytes = max_bytes
+        self.max_engines = max_engines
+        self._overlays = {}
+        self._engines = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # Everything reachable from the base is shared, so it is never charged to a tenant
+        self._base_ids = set()
+        self.base_bytes = _walk(self.base, self._base_ids)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        for tenant_id, overlay in (overlays or {}).items():
+            self.add(tenant_id, overlay)
+
+    def add(self, tenant_id, overlay):
+        """
+        Register a tenant, or replace its overlay
+
+        :param tenant_id: Tenant ID
+        :param overlay: Dict with optional 'knowledge', 'response_templates' and 'intents' sections
+        :raises ValueError: If the overlay is malformed
+        """
+        validate_overlay(overlay)
+        with self._lock:
+            self._overlays[tenant_id] = overlay
+            self._drop(tenant_id)
+
+    def remove(self, tenant_id):
+        """
+        :param tenant_id: Tenant ID
+        :raises KeyError: If no tenant has that ID
+        """
+        with self._lock:
+            if tenant_id not in self._overlays:
+                raise KeyError(f"Unknown tenant '{tenant_id}'")
+            del self._overlays[tenant_id]
+            self._drop(tenant_id)
+
+    def _drop(self, tenant_id):
+        engine = self._engines.pop(tenant_id, None)
+        if engine is not None:
+            self.bytes -= engine.bytes
+
+    def __len__(self):
+        return len(self._overlays)
+
+    def __contains__(self, tenant_id):
+        return tenant_id in self._overlays
+
+    def engine(self, tenant_id):
+        """
+        Compiled engine of a tenant, built on first use
+
+        :param tenant_id: Tenant ID
+        :return: TenantEngine
+        :raises KeyError: If no tenant has that ID
+        """
+        with self._lock:
+            engine = self._engines.get(tenant_id)
+            if engine is not None:
+                self._engines.move_to_end(tenant_id)
+                self.hits += 1
+                return engine
+            overlay = self._overlays.get(tenant_id)
+            if overlay is None:
+                raise KeyError(f"Unknown tenant '{tenant_id}'")
+            self.misses += 1
+
+        # Compiled outside the lock so other tenants' requests aren't held up; a concurrent build of the
+        # same tenant only wastes work, the first engine stored wins
+        engine = build_engine(tenant_id, overlay, self.base)
+        engine = engine._replace(bytes=_walk(engine, set(self._base_ids)))
+
+        with self._lock:
+            current = self._engines.get(tenant_id)
+            if current is not None:
+                return current
+            if self._overlays.get(tenant_id) is not overlay:
+                # Replaced or removed while compiling; answer this request but don't keep the engine
+                return engine
+            self._engines[tenant_id] = engine
+            self.bytes += engine.bytes
+            while len(self._engines) > 1 and (
+                    self.bytes > self.max_bytes or
+                    (self.max_engines is not None and len(self._engines) > self.max_engines)):
+                _, evicted = self._engines.popitem(last=False)
+                self.bytes -= evicted.bytes
+                self.evictions += 1
+        return engine
+
+    def stream_response(self, tenant_id, user_input, session_id=None, seed=None):
+        """
+        main.stream_response answered from a tenant's knowledge
+
+        Sessions are kept per tenant, so two dealerships may use the same
+        session IDs.
+
+        :param tenant_id: Tenant ID
+        :param user_input: Raw user input
+        :param session_id: Optional session ID within the tenant
+        :param seed: Optional replay seed
+        :return: main.ResponseStream of the response chunks
+        :raises KeyError: If no tenant has that ID
+        """
+        session = (tenant_id, session_id) if session_id is not None else None
+        return chatbot.stream_response(user_input, session, seed, self.engine(tenant_id))
+
+    def get_response(self, tenant_id, user_input, session_id=None, seed=None):
+        """
+        :param tenant_id: Tenant ID
+        :param user_input: Raw user input
+        :param session_id: Optional session ID within the tenant
+        :param seed: Optional replay seed
+        :return: Response text
+        :raises KeyError: If no tenant has that ID
+        """
+        return ''.join(self.stream_response(tenant_id, user_input, session_id, seed))
+
+    def stats(self):
+        """
+        :return: Dict of tenant, engine and memory counters
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'tenants': len(self._overlays),
+                'engines': len(self._engines),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'base_bytes': self.base_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions
+            }
+
+
+def load_overlays(path):
+    """
+    Read tenant overlays from a JSON or TOML file with a top-level 'tenants' table
+
+    :param path: Path ending in .json or .toml
+    :return: Dict of tenant ID to overlay
+    :raises ValueError: If the format is unsupported or an overlay is malformed
+    """
+    with open(path, 'rb') as source_file:
+        data = source_file.read()
+    if path.endswith('.toml'):
+        if tomllib is None:
+            raise ValueError("TOML tenant files need Python 3.11+ (tomllib)")
+        source = tomllib.loads(data.decode('utf-8'))
+    else:
+        source = json.loads(data)
+
+    if not isinstance(source, dict) or not isinstance(source.get('tenants'), dict):
+        raise ValueError(f"{path} needs a top-level 'tenants' table")
+    for overlay in source['tenants'].values():
+        validate_overlay(overlay)
+    return source['tenants']
+
+
+def synthetic_overlays(count, seed=0):
+    """
+    Overlays of dealerships that each change a few vehicle types, financing options and greetings
+
+    :param count: Number of tenants
+    :param seed: Random seed
+    :return: Dict of tenant ID to overlay
+    """
+    rng = random.Random(seed)
+    knowledge = auto_dealership_knowledge.AutoDealershipKnowledge
+    vehicle_types = list(knowledge.VEHICLE_TYPES) + ['van', 'coupe', 'convertible', 'minivan']
+    attributes = ['reliable', 'sporty', 'spacious', 'affordable', 'luxurious', 'rugged', 'quiet', 'well-equipped',
+                  'easy to park', 'great on fuel', 'fun to drive', 'built for towing']
+    overlays = {}
+    for number in range(count):
+        name = f'Dealer {number}'
+        overlays[f'dealer-{number}'] = {
+            'knowledge': {
+                'vehicle_types': {vehicle_type: rng.sample(attributes, 3)
+                                  for vehicle_type in rng.sample(vehicle_types, rng.randint(1, 3))},
+                'financing_options': knowledge.FINANCING_OPTIONS[:rng.randint(2, 5)] + [f"{name} loyalty financing"]
+            },
+            'response_templates': {
+                'auto_greetings': [f"Welcome to {name}! How can we help you find your next vehicle?",
+                                   f"Hello from {name}! What are you shopping for today?"]
+            }
+        }
+    return overlays
+
+
+def tenant_benchmark(tenants=1000, requests=20000, budget_fraction=0.1, seed=0):
+    """
+    Memory per tenant, cold versus warm latency, and LRU behaviour under a tight memory budget
+
+    :param tenants: Number of tenants
+    :param requests: Requests in the LRU run, tenants drawn from a Zipf-like distribution
+    :param budget_fraction: LRU run budget as a fraction of what all engines need
+    :param seed: Random seed
+    :return: Dict of results
+    """
+    overlays = synthetic_overlays(tenants, seed)
+    messages = ["hello", "what financing options do you have", "tell me about a van", "how do i buy a car"]
+    prefork.memory_usage()
+
+    # Cold: the tenant's first request, which compiles its engine; warm: the same request again
+    registry = TenantRegistry(overlays, max_bytes=sys.maxsize)
+    cold, warm = LatencyRecorder(), LatencyRecorder()
+    for number, tenant_id in enumerate(overlays):
+        message = messages[number % len(messages)]
+        for recorder in (cold, warm):
+            start = time.perf_counter()
+            registry.get_response(tenant_id, message, seed=seed)
+            recorder.record(time.perf_counter() - start)
+    estimated = registry.stats()['bytes']
+
+    # Allocations that stay alive while every engine is compiled
+    registry = TenantRegistry(overlays, max_bytes=sys.maxsize)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for tenant_id in overlays:
+        registry.engine(tenant_id)
+    gc.collect()
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    # Skewed traffic with room for a fraction of the engines
+    registry = TenantRegistry(overlays, max_bytes=max(int(estimated * budget_fraction), 1))
+    rng = random.Random(seed)
+    tenant_ids = list(overlays)
+    weights = [1 / rank for rank in range(1, len(tenant_ids) + 1)]
+    latency = LatencyRecorder()
+    for tenant_id, message in zip(rng.choices(tenant_ids, weights, k=requests), itertools.cycle(messages)):
+        start = time.perf_counter()
+        registry.get_response(tenant_id, message, seed=seed)
+        latency.record(time.perf_counter() - start)
+
+    return {
+        'tenants': tenants,
+        'process_memory_kb': prefork.memory_usage(),
+        'base_bytes': registry.base_bytes,
+        'bytes_per_tenant_estimated': round(estimated / tenants),
+        'bytes_per_tenant_allocated': round(allocated / tenants),
+        'cold_latency': cold.summary(),
+        'warm_latency': warm.summary(),
+        'lru': {'requests': requests, 'latency': latency.summary(), **registry.stats()}
+    }
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Check tenant overlay files and benchmark multi-tenant serving")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    check = commands.add_parser('check', help="Validate a tenant file and compile every tenant")
+    check.add_argument('path', help="JSON or TOML file with a top-level 'tenants' table")
+
+    bench = commands.add_parser('bench', help="Memory per tenant and cold versus warm latency")
+    bench.add_argument('--tenants', type=int, default=1000)
+    bench.add_argument('--requests', type=int, default=20000, help="Requests in the memory-budget run")
+    bench.add_argument('--budget-fraction', type=float, default=0.1,
+                       help="Memory budget of that run as a fraction of what all engines need")
+    args = parser.parse_args(argv)
+
+    if args.command == 'check':
+        registry = TenantRegistry(load_overlays(args.path), max_bytes=sys.maxsize)
+        for tenant_id in list(registry._overlays):
+            registry.engine(tenant_id)
+        print(json.dumps(registry.stats(), indent=2))
+    else:
+        print(json.dumps(tenant_benchmark(args.tenants, args.requests, args.budget_fraction), indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
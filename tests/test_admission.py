@@ -0,0 +1,142 @@
+import asyncio
+import itertools
+import threading
+
+import pytest
+
+import admission
+import chat_server
+import long_responses
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def canned_replies():
+    return set(long_responses.RESPONSE_TEMPLATES['auto_unknown'])
+
+
+def assert_accounted(controller, submitted):
+    stats = controller.stats()
+    assert stats['admitted'] + stats['degraded'] + stats['rejected'] == submitted
+    assert sum(stats['shed'].values()) == stats['degraded']
+    assert stats['pending'] == 0
+
+
+def test_token_bucket_refills_at_its_rate():
+    bucket = admission.TokenBucket(rate=2.0, burst=3, now=0.0)
+    assert [bucket.take(0.0) for _ in range(4)] == [True, True, True, False]
+    assert bucket.take(0.5)
+    assert not bucket.take(0.5)
+    assert [bucket.take(100.0) for _ in range(4)] == [True, True, True, False]
+
+
+def test_sessions_over_their_rate_are_rejected():
+    clock = FakeClock()
+    with admission.AdmissionController(workers=2, session_rate=1.0, session_burst=2, clock=clock,
+                                       warmup=False) as controller:
+        controller.get_response('hi', 'admission-rate')
+        controller.get_response('hi', 'admission-rate')
+        with pytest.raises(admission.RequestRejected):
+            controller.get_response('hi', 'admission-rate')
+        # Other sessions and anonymous requests have their own allowance
+        controller.get_response('hi', 'admission-other')
+        controller.get_response('hi')
+        clock.now = 1.0
+        controller.get_response('hi', 'admission-rate')
+
+        stats = controller.stats()
+        assert (stats['admitted'], stats['degraded'], stats['rejected']) == (5, 0, 1)
+        assert_accounted(controller, 6)
+
+
+def test_full_queue_degrades_instead_of_waiting(monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    def slow_fallback(input_text):
+        started.set()
+        release.wait(5)
+        yield 'answered'
+
+    monkeypatch.setattr(admission.chatbot.long, 'stream_unknown', slow_fallback)
+    with admission.AdmissionController(workers=1, max_queue=1, session_rate=None, warmup=False) as controller:
+        running = controller.submit('first')
+        started.wait(5)
+        queued = controller.submit('second')
+        shed = [controller.submit('overflow').result() for _ in range(3)]
+        # Intent replies are cheap, they are answered even with the queue full
+        intent_reply = controller.submit('tell me about a suv', seed=5).result()
+        release.set()
+        assert running.result() == queued.result() == 'answered'
+
+    assert set(shed) <= canned_replies()
+    assert intent_reply == admission.chatbot.get_response('tell me about a suv', seed=5)
+    stats = controller.stats()
+    assert (stats['admitted'], stats['degraded'], stats['shed']) == (3, 3, {'queue_full': 3})
+    assert_accounted(controller, 6)
+
+
+def test_expected_wait_past_the_deadline_degrades():
+    with admission.AdmissionController(workers=1, deadline=1.0, session_rate=None, clock=FakeClock(),
+                                       warmup=False) as controller:
+        controller.service_time = 2.0
+        assert controller.get_response('what financing do you have') in canned_replies()
+        assert controller.get_response('how do I buy a car', deadline=10.0) not in canned_replies()
+        assert controller.get_response('tell me about a suv') not in canned_replies()
+    assert controller.stats()['shed'] == {'deadline': 1}
+    assert_accounted(controller, 3)
+
+
+def test_requests_past_their_deadline_when_picked_up_degrade():
+    # Every reading of the clock is five seconds after the previous one
+    ticks = itertools.count(0.0, 5.0)
+    with admission.AdmissionController(workers=1, deadline=1.0, session_rate=None, clock=lambda: next(ticks),
+                                       warmup=False) as controller:
+        assert controller.get_response('what financing do you have', 'admission-expired') in canned_replies()
+    assert controller.stats()['shed'] == {'expired': 1}
+    assert_accounted(controller, 1)
+
+
+def test_degraded_and_admitted_replies_follow_get_response():
+    with admission.AdmissionController(workers=1, session_rate=None, warmup=False) as controller:
+        assert controller.get_response('hi', seed=3) == admission.chatbot.get_response('hi', seed=3)
+        degraded = ''.join(controller._degrade('test', admission.chatbot.stream_response('hi', seed=3)))
+        assert degraded in canned_replies()
+        assert degraded == ''.join(controller._degrade('test', admission.chatbot.stream_response('hi', seed=3)))
+
+
+def test_server_sheds_fallbacks_and_rejects_fast_sessions():
+    controller = admission.AdmissionController(workers=1, deadline=1.0, session_rate=1.0, session_burst=2,
+                                               clock=FakeClock(), warmup=False)
+    server = chat_server.ChatServer(admission=controller)
+
+    async def requests():
+        controller.service_time = 2.0
+        shed = await server.handle_request({'message': 'what financing do you have', 'session': 'admission-server'})
+        intent = await server.handle_request({'message': 'tell me about a suv', 'session': 'admission-server'})
+        with pytest.raises(admission.RequestRejected):
+            await server.handle_request({'message': 'tell me about a suv', 'session': 'admission-server'})
+        controller.service_time = None
+        answered = await server.handle_request({'message': 'what financing do you have'})
+        return shed, intent, answered
+
+    with controller:
+        shed, intent, answered = asyncio.run(requests())
+    assert shed['degraded'] and shed['fallback'] and shed['response'] in canned_replies()
+    assert intent['intent'] == 'vehicle_suv' and 'degraded' not in intent
+    assert answered['fallback'] and 'degraded' not in answered and answered['response'] not in canned_replies()
+    stats = server.stats()['admission']
+    assert (stats['admitted'], stats['degraded'], stats['rejected']) == (2, 1, 1)
+    assert_accounted(controller, 4)
+
+
+def test_limits_are_validated():
+    with pytest.raises(ValueError):
+        admission.AdmissionController(deadline=0, warmup=False)
+    with pytest.raises(ValueError):
+        admission.AdmissionController(session_rate=0, warmup=False)
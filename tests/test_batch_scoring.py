@@ -0,0 +1,50 @@
+import random
+
+import pytest
+
+import batch_scoring
+import main
+from backends import available_backends
+from intent_registry import Intent, IntentRegistry
+
+
+def synthetic_batch(intent_count, message_count, seed=0):
+    rng = random.Random(seed)
+    vocabulary = [''.join(rng.choice('abcdefghijklmnop') for _ in range(rng.randint(3, 8))) for _ in range(400)]
+    intents = list(main.DEALERSHIP_INTENTS)
+    for number in range(intent_count):
+        words = rng.sample(vocabulary, rng.randint(2, 6))
+        intents.append(Intent(f'synthetic_{number}', words, response='Synthetic',
+                              required_words=rng.sample(words, rng.randint(0, 2)),
+                              single_response=rng.random() < 0.2))
+    messages = [rng.sample(vocabulary, rng.randint(0, 10)) +
+                rng.sample(['hello', 'buy', 'finance', 'sedan', 'car', 'truk'], rng.randint(0, 2))
+                for _ in range(message_count)]
+    return IntentRegistry(intents), messages
+
+
+def ids(results):
+    return [(intent.intent_id if intent is not None else None, score) for intent, score in results]
+
+
+@pytest.mark.parametrize('backend', available_backends())
+@pytest.mark.parametrize('threshold', [0, 50, 101])
+def test_match_batch_matches_match_intent(backend, threshold):
+    registry, messages = synthetic_batch(60, 300)
+    expected = [main.match_intent(message, registry, threshold) for message in messages]
+    assert ids(batch_scoring.match_batch(messages, registry, threshold, backend)) == ids(expected)
+
+
+@pytest.mark.skipif(len(available_backends()) < 2, reason="NumPy is not installed")
+@pytest.mark.parametrize('threshold', [0, 30])
+def test_backends_agree(threshold):
+    registry, messages = synthetic_batch(200, 1000, seed=1)
+    results = [ids(batch_scoring.match_batch(messages, registry, threshold, backend))
+               for backend in available_backends()]
+    assert all(result == results[0] for result in results)
+
+
+def test_empty_batch_and_unknown_backend():
+    assert batch_scoring.match_batch([], main.INTENT_REGISTRY, 0) == []
+    with pytest.raises(ValueError):
+        batch_scoring.match_batch([['hi']], main.INTENT_REGISTRY, 0, backend='gpu')
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import logging
+
+import chat_server
+import main
+
+
+async def serve(server):
+    listener = await server.start('127.0.0.1', 0)
+    reader, writer = await asyncio.open_connection('127.0.0.1', listener.sockets[0].getsockname()[1],
+                                                   limit=chat_server.MAX_LINE_BYTES * 2)
+    return listener, reader, writer
+
+
+async def ask(reader, writer, request):
+    """Send one request line and collect the reply objects up to the final one"""
+    writer.write((request if isinstance(request, bytes) else json.dumps(request).encode('utf-8')) + b'\n')
+    await writer.drain()
+    replies = []
+    while True:
+        line = await reader.readline()
+        if not line:
+            return replies
+        replies.append(json.loads(line))
+        if 'chunk' not in replies[-1]:
+            return replies
+
+
+def run(server, scenario):
+    async def session():
+        listener, reader, writer = await serve(server)
+        try:
+            return await scenario(reader, writer)
+        finally:
+            writer.close()
+            listener.close()
+            await listener.wait_closed()
+    return asyncio.run(session())
+
+
+def test_replies_follow_get_response():
+    async def scenario(reader, writer):
+        return [await ask(reader, writer, request) for request in (
+            {'message': 'tell me about a suv', 'session': 'server-1', 'seed': 4, 'id': 1},
+            {'message': 'what financing do you have', 'seed': 4, 'stream': True},
+            {'command': 'stats'}
+        )]
+
+    intent, streamed, stats = run(chat_server.ChatServer(), scenario)
+    assert intent[0]['response'] == main.get_response('tell me about a suv', seed=4)
+    assert (intent[0]['intent'], intent[0]['fallback'], intent[0]['session'], intent[0]['id']) == \
+        ('vehicle_suv', False, 'server-1', 1)
+    expected = main.get_response('what financing do you have', seed=4)
+    assert streamed[-1]['done'] and streamed[-1]['fallback']
+    assert ''.join(reply['chunk'] for reply in streamed[:-1]) == streamed[-1]['response'] == expected
+    assert stats[0]['stats']['requests'] == 2 and stats[0]['stats']['fallbacks'] == 1
+
+
+def test_failed_requests_get_an_error_and_keep_the_connection(monkeypatch, caplog):
+    stream_response = main.stream_response
+
+    def failing(message, *args):
+        if message == 'boom':
+            raise RuntimeError("broken pipeline")
+        return stream_response(message, *args)
+
+    monkeypatch.setattr(chat_server.chatbot, 'stream_response', failing)
+
+    async def scenario(reader, writer):
+        return [await ask(reader, writer, request) for request in (
+            b'not json', b'[1, 2]', {'message': 7}, {'message': 'hi', 'seed': 'x'}, {'message': 'boom'},
+            {'message': 'tell me about a suv', 'seed': 1}
+        )]
+
+    server = chat_server.ChatServer()
+    with caplog.at_level(logging.ERROR, logger='chat_server'):
+        replies = run(server, scenario)
+    assert all(list(reply[0]) == ['error'] for reply in replies[:5])
+    assert replies[4][0]['error'] == 'internal error'
+    assert 'broken pipeline' in caplog.text
+    assert replies[5][0]['response'] == main.get_response('tell me about a suv', seed=1)
+    assert server.errors == 5
+
+
+def test_overlong_lines_close_the_connection():
+    async def scenario(reader, writer):
+        replies = await ask(reader, writer, b'x' * (chat_server.MAX_LINE_BYTES + 10))
+        return replies, await reader.read()
+
+    server = chat_server.ChatServer()
+    replies, rest = run(server, scenario)
+    assert replies == [{'error': 'request line too long'}] and rest == b''
+    assert server.errors == 1
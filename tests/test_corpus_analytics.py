@@ -0,0 +1,79 @@
+import json
+import random
+
+import pytest
+
+import corpus_analytics
+from backends import available_backends
+from communication_coach import CommunicationCoach
+from text_complexity import COMPLEXITY_CATEGORIES, TextComplexityAnalyzer
+
+WORDS = ['İstanbul', 'ΟΔΟΣ', 'Word', 'sedan', 'truck', 'financing', 'the', 'a', 'straße', '9', "it's"]
+SEPARATORS = [' ', ' ', ' ', ' ', ' ', ', ', '\n', '. ', '.. ', '!? ', '']
+
+
+def random_texts(count, seed=0):
+    # Sentence lengths and vocabularies wide enough to reach every category and feedback band
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        words = rng.sample(WORDS, rng.randint(1, len(WORDS)))
+        separators = [rng.choice(SEPARATORS[:rng.randint(1, len(SEPARATORS))]) for _ in range(50)]
+        texts.append(''.join(rng.choice(words) + separator for separator in separators[:rng.randint(0, 50)]))
+    return texts
+
+
+@pytest.mark.parametrize('backend', available_backends())
+@pytest.mark.parametrize('workers', [None, 2])
+def test_corpus_metrics_match_per_message_analysis(backend, workers):
+    texts = random_texts(300)
+    analysis = corpus_analytics.analyze_corpus(iter(texts), backend=backend, workers=workers, chunk_size=40)
+
+    assert len(analysis.complexity) == len(texts)
+    for index, text in enumerate(texts):
+        expected = TextComplexityAnalyzer.analyze(text)
+        assert (analysis.word_count[index], analysis.unique_word_count[index], analysis.sentence_count[index]) == \
+            (expected.word_count, expected.unique_word_count, len(expected.sentence_lengths))
+        assert analysis.complexity[index] == expected.complexity
+        assert COMPLEXITY_CATEGORIES[analysis.category[index]] == expected.category
+        assert corpus_analytics.message_insights(analysis, index) == \
+            CommunicationCoach.analyze_communication_style(text)
+
+
+def test_summary_counts_every_message():
+    texts = random_texts(200, seed=1)
+    analysis = corpus_analytics.analyze_corpus(texts, backend='python')
+    summary = corpus_analytics.summarize(analysis)
+    insights = [CommunicationCoach.analyze_communication_style(text) for text in texts]
+
+    assert summary['messages'] == len(texts)
+    assert summary['mean_complexity'] == pytest.approx(sum(item['complexity']['score'] for item in insights) / 200)
+    for band, key in (('categories', ('complexity', 'category')),
+                      ('length_feedback', ('sentence_structure', 'length_feedback')),
+                      ('vocabulary_feedback', ('vocabulary', 'vocabulary_feedback'))):
+        assert sum(summary[band].values()) == len(texts)
+        for label, count in summary[band].items():
+            assert count == sum(item[key[0]][key[1]] == label for item in insights)
+
+    for backend in available_backends():
+        empty = corpus_analytics.summarize(corpus_analytics.analyze_corpus([], backend=backend))
+        assert (empty['messages'], empty['mean_complexity'], sum(empty['categories'].values())) == (0, 0.0, 0)
+        other = corpus_analytics.summarize(corpus_analytics.analyze_corpus(texts, backend=backend))
+        assert {key: value for key, value in other.items() if key.startswith('mean_')} == \
+            pytest.approx({key: value for key, value in summary.items() if key.startswith('mean_')})
+        assert [other[band] for band in ('categories', 'length_feedback', 'vocabulary_feedback')] == \
+            [summary[band] for band in ('categories', 'length_feedback', 'vocabulary_feedback')]
+
+
+def test_cli_summarizes_an_archive(tmp_path, capsys):
+    texts = random_texts(20, seed=2)
+    archive = tmp_path / 'archive.jsonl'
+    archive.write_text(''.join(json.dumps({'text': text}) + '\n' for text in texts) + 'oops\n', encoding='utf-8')
+    columns = tmp_path / 'columns.csv'
+
+    corpus_analytics.main_cli([str(archive), '--field', 'text', '--backend', 'python', '--columns', str(columns)])
+
+    assert json.loads(capsys.readouterr().out) == corpus_analytics.summarize(
+        corpus_analytics.analyze_corpus(texts, backend='python'))
+    rows = columns.read_text(encoding='utf-8').splitlines()
+    assert rows[0].split(',') == list(corpus_analytics.CorpusAnalysis._fields) and len(rows) == len(texts) + 1
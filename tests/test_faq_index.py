@@ -0,0 +1,114 @@
+import collections
+import random
+
+import pytest
+
+import auto_dealership_knowledge
+import faq_index
+import main
+from backends import available_backends
+
+
+@pytest.fixture(scope='module')
+def index(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('faq') / 'faq.index')
+    # Small runs force several merge passes
+    faq_index.build_index(faq_index.synthetic_passages(600, vocabulary_size=800), path, block_postings=2000)
+    index = faq_index.FaqIndex(path, min_score=0.0)
+    yield index
+    index.close()
+
+
+def exhaustive_search(index, query, k):
+    scores = collections.defaultdict(float)
+    for term, count in collections.Counter(faq_index.tokenize(query)).items():
+        documents, weights = index.postings(term)
+        for document, weight in zip(documents, weights):
+            scores[document] += weight * count
+    return sorted(((score, document) for document, score in scores.items()),
+                  key=lambda entry: (-entry[0], entry[1]))[:k]
+
+
+def queries(index, count, seed=0):
+    rng = random.Random(seed)
+    for _ in range(count):
+        words = index.document(rng.randrange(len(index))).split()
+        start = rng.randrange(len(words))
+        yield ' '.join(words[start:start + rng.randint(1, 8)] + ['unknownword'] * rng.randint(0, 1))
+
+
+@pytest.mark.parametrize('k', [1, 3, 10])
+def test_threshold_search_matches_exhaustive_scoring(index, k):
+    for query in queries(index, 150, seed=k):
+        expected = exhaustive_search(index, query, k)
+        found = index.search(query, k)
+        # Scores are summed in a different order, so compare them with a tolerance
+        assert [score for score, _ in found] == pytest.approx([score for score, _ in expected], rel=1e-9), query
+        exact = dict((document, score) for score, document in exhaustive_search(index, query, len(index)))
+        for score, document in found:
+            assert exact[document] == pytest.approx(score, rel=1e-9)
+
+
+def test_unlimited_budget_is_exact(index):
+    for query in queries(index, 50, seed=7):
+        assert index.search(query, 3, budget=10 ** 9) == index.search(query, 3)
+
+
+def test_budget_caps_reads_to_passages_scored(index):
+    for query in queries(index, 50, seed=8):
+        for score, document in index.search(query, 3, budget=1):
+            assert score > 0
+            assert 0 <= document < len(index)
+
+
+def test_terms_and_documents_round_trip(index):
+    passages = list(faq_index.synthetic_passages(600, vocabulary_size=800))
+    assert len(index) == len(passages)
+    for number in (0, 1, 299, 599):
+        assert index.document(number) == passages[number]
+    assert index.search('', 3) == []
+    assert index.search('unknownword', 3) == []
+    assert index.term_number('unknownword') is None
+
+
+@pytest.mark.skipif(len(available_backends()) < 2, reason="NumPy is not installed")
+def test_backends_write_the_same_file(tmp_path):
+    contents = []
+    for backend in available_backends():
+        path = tmp_path / f'{backend}.index'
+        faq_index.build_index(faq_index.synthetic_passages(200, vocabulary_size=300), str(path), block_postings=500,
+                              backend=backend)
+        contents.append(path.read_bytes())
+    assert contents[0] == contents[1]
+
+
+@pytest.fixture
+def installed(index):
+    previous = faq_index.install_index(index)
+    yield index
+    faq_index.install_index(previous)
+
+
+def test_unmatched_questions_are_answered_from_the_index(installed):
+    questions = []
+    for number in range(len(installed)):
+        words = installed.document(number).split()
+        pair = [' '.join(words[:4]), ' '.join(words[:30])]
+        # Questions naming a dealership topic get the knowledge answer instead
+        if not any(''.join(auto_dealership_knowledge.stream_auto_response(question)) for question in pair):
+            questions.extend(pair)
+        if len(questions) == 6:
+            break
+    assert max(len(question) for question in questions) > 50
+
+    for question in questions:
+        expected = installed.answer(question)
+        assert expected is not None
+        # Every time, not just when a random gate lets the message through
+        for seed in range(10):
+            assert main.get_response(question, seed=seed) == expected
+
+
+def test_knowledge_answers_come_before_the_index(installed):
+    assert main.get_response('how do I buy a car') == \
+        auto_dealership_knowledge.AutoDealershipKnowledge.buying_process_guide()
@@ -0,0 +1,94 @@
+import difflib
+import random
+
+import pytest
+
+from fuzzy_matcher import FuzzyMatcher, _BKTree, indel_distance
+
+ALPHABET = 'abcdefghij'
+
+
+def random_word(rng, low=2, high=9):
+    return ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(low, high)))
+
+
+def mutate(rng, word):
+    letters = list(word)
+    for _ in range(rng.randint(0, 3)):
+        position = rng.randrange(len(letters) + 1)
+        operation = rng.choice(('insert', 'delete', 'replace'))
+        if operation == 'insert' or not letters:
+            letters.insert(position, rng.choice(ALPHABET))
+        elif operation == 'delete':
+            del letters[min(position, len(letters) - 1)]
+        else:
+            letters[min(position, len(letters) - 1)] = rng.choice(ALPHABET)
+    return ''.join(letters) or 'a'
+
+
+def brute_force(vocabulary, token, threshold):
+    forward = {word for word in vocabulary
+               if token == word or difflib.SequenceMatcher(None, token.lower(), word.lower()).ratio() >= threshold}
+    reverse = {word for word in vocabulary
+               if difflib.SequenceMatcher(None, word.lower(), token.lower()).ratio() >= threshold}
+    return forward, reverse
+
+
+def reference_lcs(word1, word2):
+    table = [[0] * (len(word2) + 1) for _ in range(len(word1) + 1)]
+    for i, letter1 in enumerate(word1):
+        for j, letter2 in enumerate(word2):
+            table[i + 1][j + 1] = table[i][j] + 1 if letter1 == letter2 else max(table[i][j + 1], table[i + 1][j])
+    return table[-1][-1]
+
+
+def test_indel_distance_matches_dynamic_programming():
+    rng = random.Random(0)
+    for _ in range(500):
+        word1, word2 = random_word(rng, 0), random_word(rng, 0)
+        assert indel_distance(word1, word2) == len(word1) + len(word2) - 2 * reference_lcs(word1, word2)
+
+
+def test_bk_tree_search_matches_linear_scan():
+    rng = random.Random(1)
+    words = {random_word(rng, 6, 6) for _ in range(300)}
+    tree = _BKTree()
+    for word in words:
+        tree.add(word)
+    for _ in range(200):
+        query = random_word(rng, 6, 6)
+        radius = rng.randint(0, 6)
+        expected = {word for word in words if indel_distance(query, word) <= radius}
+        found = tree.search(query, radius)
+        assert len(found) == len(set(found))
+        assert set(found) == expected
+
+
+@pytest.mark.parametrize('threshold', [0.5, 0.6, 0.8])
+def test_indexed_lookup_matches_brute_force_and_compat(threshold):
+    rng = random.Random(2)
+    vocabulary = {random_word(rng) for _ in range(150)} | {'Sedan', 'SUV', 'truck'}
+    indexed = FuzzyMatcher(vocabulary, threshold, mode='indexed')
+    compat = FuzzyMatcher(vocabulary, threshold, mode='compat')
+    words = sorted(vocabulary)
+    tokens = [mutate(rng, rng.choice(words)) for _ in range(100)] + ['sedan', 'suv', 'TRUCK', 'x']
+
+    for token in tokens:
+        forward, reverse = brute_force(vocabulary, token, threshold)
+        match = indexed.lookup(token)
+        assert match.forward == forward, token
+        assert match.reverse == reverse, token
+        assert compat.lookup(token) == match
+
+
+def test_similar_falls_back_to_difflib_outside_the_vocabulary():
+    matcher = FuzzyMatcher(['financing'], 0.6)
+    assert matcher.similar('financng', 'financing')
+    assert matcher.similar('sedna', 'sedan')
+    assert not matcher.similar('hello', 'sedan')
+    assert matcher.similar_reverse('sedan', 'sedna')
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        FuzzyMatcher(['sedan'], mode='fast')
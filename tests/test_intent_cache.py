@@ -0,0 +1,73 @@
+import random
+
+import main
+from intent_cache import IntentCache
+from intent_registry import Intent, IntentRegistry
+
+WORDS = ['sedan', 'suv', 'truck', 'buy', 'buying', 'finance', 'financing', 'loan', 'negotiate', 'price', 'hello',
+         'hi', 'bye', 'maintain', 'oil', 'change', 'sedna', 'trucks', 'qwerty', 'car', 'dealership', 'want']
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_cached_matches_equal_uncached_ones_in_any_word_order():
+    rng = random.Random(0)
+    registry = IntentRegistry(main.DEALERSHIP_INTENTS)
+    cache = IntentCache()
+    for _ in range(500):
+        message = [rng.choice(WORDS) for _ in range(rng.randint(0, 6))]
+        expected = main.match_intent(message, registry)
+        shuffled = rng.sample(message, len(message))
+        assert main.match_intent(message, registry, cache=cache) == expected
+        assert main.match_intent(shuffled, registry, cache=cache) == expected
+    stats = cache.stats()
+    assert stats['hits'] >= 500 and stats['hits'] + stats['misses'] == 1000
+
+
+def test_entries_are_evicted_least_recently_used_first():
+    registry = IntentRegistry(main.DEALERSHIP_INTENTS)
+    cache = IntentCache(max_entries=2)
+    for key in (('a',), ('b',)):
+        cache.put(key, registry, None, 0)
+    cache.get(('a',), registry)
+    cache.put(('c',), registry, 'greeting', 50)
+    assert cache.get(('b',), registry) is None
+    assert cache.get(('a',), registry) == (None, 0) and cache.get(('c',), registry) == ('greeting', 50)
+    assert cache.stats()['evictions'] == 1
+
+    sized = IntentCache(max_bytes=2 * IntentCache._entry_size(('x',)))
+    for key in (('x',), ('y',), ('z',)):
+        sized.put(key, registry, None, 0)
+    assert len(sized) == 2 and sized.bytes == 2 * IntentCache._entry_size(('x',))
+
+
+def test_entries_expire_after_their_ttl():
+    registry = IntentRegistry(main.DEALERSHIP_INTENTS)
+    clock = FakeClock()
+    cache = IntentCache(ttl=10, clock=clock)
+    cache.put(('a',), registry, None, 0)
+    clock.now = 9.9
+    assert cache.get(('a',), registry) == (None, 0)
+    clock.now = 10
+    assert cache.get(('a',), registry) is None
+    assert cache.stats()['expirations'] == 1 and cache.bytes == 0
+
+
+def test_changed_registries_drop_cached_results():
+    registry = IntentRegistry(main.DEALERSHIP_INTENTS)
+    cache = IntentCache()
+    message = main.preprocess_input('where is the showroom')
+    assert main.match_intent(message, registry, cache=cache)[0] is None
+
+    registry.add(Intent('showroom', ['showroom', 'where'], response='Right by the entrance.'))
+    intent, _ = main.match_intent(message, registry, cache=cache)
+    assert intent.intent_id == 'showroom'
+    # Another registry never sees this one's entries
+    assert main.match_intent(message, IntentRegistry(main.DEALERSHIP_INTENTS), cache=cache)[0] is None
+    assert cache.stats()['invalidations'] == 2
@@ -0,0 +1,72 @@
+import random
+import re
+
+import pytest
+
+import auto_dealership_knowledge
+from auto_dealership_knowledge import AutoDealershipKnowledge
+from keyword_automaton import KeywordAutomaton, inflections
+
+TOPICS = [('sedan', ['sedan']), ('process', ['buy', 'purchase']), ('financing', ['finance', 'plan']),
+          ('greeting', ['hi'])]
+# A multi-word keyword takes the character scan instead of the word table
+PHRASE_TOPICS = TOPICS + [('trade', ['trade in', 'trade-in'])]
+PIECES = ['sedan', 'sedans', 'sedanx', 'buy', 'buying', 'buyed', 'purchase', 'purchased', 'purchasing', 'finance',
+          'financed', 'financing', 'plan', 'planned', 'planning', 'hi', 'his', 'this', 'trade', 'in', 'trade-in',
+          'x', ' ', ' ', '.', '-', "'", '_']
+
+
+def reference_matches(topics, text):
+    # Every inflection of every keyword, wherever it occurs between word boundaries
+    found = set()
+    for topic, keywords in topics:
+        for keyword in keywords:
+            for form in inflections(keyword):
+                for match in re.finditer(r'(?<!\w)(?=' + re.escape(form) + r'(?!\w))', text):
+                    found.add((match.start(), match.start() + len(form), topic, keyword))
+    return found
+
+
+@pytest.mark.parametrize('keyword, forms', [
+    ('buy', ['buy', 'buys', 'buyes', 'buying', 'buyed']),
+    ('purchase', ['purchase', 'purchases', 'purchasing', 'purchased']),
+    ('plan', ['plan', 'plans', 'planes', 'planing', 'planning', 'planed', 'planned']),
+    ('finance', ['finance', 'finances', 'financing', 'financed']),
+    ('hi', ['hi']),
+])
+def test_inflections(keyword, forms):
+    assert inflections(keyword) == forms
+
+
+@pytest.mark.parametrize('topics', [TOPICS, PHRASE_TOPICS])
+def test_matches_agree_with_a_regex_search(topics):
+    automaton = KeywordAutomaton(topics)
+    rng = random.Random(0)
+    for _ in range(500):
+        text = ''.join(rng.choice(PIECES) for _ in range(rng.randint(0, 12)))
+        expected = reference_matches(topics, text)
+        assert set(automaton.matches(text)) == expected
+        assert automaton.find_topics(text) == {topic for _, _, topic, _ in expected}
+        priorities = [priority for priority, (topic, _) in enumerate(topics)
+                      if any(found[2] == topic for found in expected)]
+        assert automaton.best_topic(text) == (topics[min(priorities)][0] if priorities else None)
+
+
+@pytest.mark.parametrize('query, topic', [
+    ('I am buying soon', 'process'),
+    ('we purchased before', 'process'),
+    ('financed cars', 'financing'),
+    ('can you service it', 'maintenance'),
+    ('negotiating a better price', 'negotiation'),
+    ('a dealership near me', None),
+    ('two sedans and a truck', 'sedan'),
+])
+def test_auto_topics_match_inflected_keywords(query, topic):
+    assert auto_dealership_knowledge.TOPIC_AUTOMATON.best_topic(query.lower()) == topic
+    response = auto_dealership_knowledge.generate_auto_response(query)
+    if topic is None:
+        assert response == auto_dealership_knowledge.DEFAULT_AUTO_RESPONSE
+    elif topic in AutoDealershipKnowledge.VEHICLE_TYPES:
+        assert response == AutoDealershipKnowledge.rendered_blocks().vehicle_replies[topic]
+    else:
+        assert response != auto_dealership_knowledge.DEFAULT_AUTO_RESPONSE
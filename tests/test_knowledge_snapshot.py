@@ -0,0 +1,93 @@
+import json
+import math
+import os
+
+import pytest
+
+import knowledge_snapshot
+import main
+import tenant_context
+from intent_registry import IntentRegistry
+
+
+@pytest.fixture
+def source_path(tmp_path):
+    source = knowledge_snapshot.export_source()
+    source['extras'] = {'inf': math.inf, 'big': 2 ** 70, 'small': -2 ** 63, 'flags': [True, False, None], 'ratio': 0.1}
+    path = tmp_path / 'knowledge.json'
+    # json writes inf as Infinity, which it also reads back
+    path.write_text(json.dumps(source), encoding='utf-8')
+    return str(path)
+
+
+def test_snapshot_round_trips_the_source(source_path):
+    snapshot = knowledge_snapshot.load_snapshot(source_path)
+    try:
+        source = knowledge_snapshot.load_source(source_path)
+        assert [intent.to_dict() for intent in snapshot.intents()] == source['intents']
+        assert snapshot.document() == {key: value for key, value in source.items() if key != 'intents'}
+
+        compiled = snapshot.registry()
+        indexed = IntentRegistry(snapshot.intents())
+        for message in ('tell me about a suv', 'i want to buy a sedan', 'finance options', 'qwerty'):
+            words = main.preprocess_input(message)
+            assert compiled.candidates(words) == indexed.candidates(words)
+    finally:
+        snapshot.close()
+
+
+def test_snapshots_are_reused_until_the_source_changes(source_path):
+    snapshot = knowledge_snapshot.load_snapshot(source_path)
+    snapshot.close()
+    # Compiling writes a new file and renames it into place
+    written = os.stat(source_path + '.snapshot').st_ino
+
+    reused = knowledge_snapshot.load_snapshot(source_path)
+    reused.close()
+    assert os.stat(source_path + '.snapshot').st_ino == written
+
+    source = json.loads(open(source_path, encoding='utf-8').read())
+    source['intents'] = source['intents'][:2]
+    with open(source_path, 'w', encoding='utf-8') as source_file:
+        json.dump(source, source_file)
+    recompiled = knowledge_snapshot.load_snapshot(source_path)
+    try:
+        assert os.stat(source_path + '.snapshot').st_ino != written
+        assert [intent.intent_id for intent in recompiled.intents()] == ['greeting', 'farewell']
+    finally:
+        recompiled.close()
+
+
+def test_damaged_snapshots_are_recompiled(source_path):
+    snapshot = knowledge_snapshot.load_snapshot(source_path)
+    intents = [intent.to_dict() for intent in snapshot.intents()]
+    snapshot.close()
+    with open(source_path + '.snapshot', 'r+b') as snapshot_file:
+        snapshot_file.truncate(200)
+    with pytest.raises(ValueError):
+        knowledge_snapshot.KnowledgeSnapshot(source_path + '.snapshot')
+
+    snapshot = knowledge_snapshot.load_snapshot(source_path)
+    try:
+        assert [intent.to_dict() for intent in snapshot.intents()] == intents
+    finally:
+        snapshot.close()
+
+
+def test_reload_installs_the_file_for_requests(tmp_path):
+    source = knowledge_snapshot.export_source()
+    for record in source['intents']:
+        if record['intent_id'] == 'vehicle_suv':
+            record['response'] = 'Our SUVs are in the north lot.'
+            record['response_type'] = None
+    path = tmp_path / 'knowledge.json'
+    path.write_text(json.dumps(source), encoding='utf-8')
+
+    store = knowledge_snapshot.KnowledgeStore(str(path))
+    try:
+        store.reload()
+        assert main.get_response('tell me about a suv') == 'Our SUVs are in the north lot.'
+    finally:
+        tenant_context.install(None)
+        store.current.snapshot.close()
+    assert main.get_response('tell me about a suv', seed=1) != 'Our SUVs are in the north lot.'
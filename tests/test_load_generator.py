@@ -0,0 +1,86 @@
+import asyncio
+import collections
+import json
+
+import pytest
+
+import load_generator
+import main
+
+
+def test_parse_mix():
+    assert load_generator.parse_mix('greeting=20, long=0.5') == {'greeting': 20.0, 'long': 0.5}
+    for text in ('greeting=1,spam=2', 'greeting=-1', 'greeting=0,long=0', 'greeting=lots'):
+        with pytest.raises(ValueError):
+            load_generator.parse_mix(text)
+
+
+def test_traffic_follows_the_mix_over_interleaved_conversations():
+    mix = {'greeting': 10, 'vehicle': 50, 'financing': 0, 'gibberish': 15, 'long': 25}
+    traffic = list(load_generator.synthetic_traffic(20000, mix, seed=5, conversations=40, max_turns=6))
+    assert traffic == list(load_generator.synthetic_traffic(20000, mix, seed=5, conversations=40, max_turns=6))
+
+    shares = collections.Counter(kind for _, kind, _ in traffic)
+    assert set(shares) == {'greeting', 'vehicle', 'gibberish', 'long'}
+    for kind, weight in mix.items():
+        assert shares[kind] / len(traffic) == pytest.approx(weight / 100, abs=0.015)
+
+    turns = collections.Counter(session_id for session_id, _, _ in traffic)
+    assert max(turns.values()) <= 6
+    first_seen = {}
+    last_seen = {}
+    for position, (session_id, _, _) in enumerate(traffic):
+        first_seen.setdefault(session_id, position)
+        last_seen[session_id] = position
+    # Never more conversations open at once than asked for
+    for position in range(0, len(traffic), 500):
+        assert sum(first_seen[session] <= position <= last_seen[session] for session in turns) <= 40
+    assert all(message and '{' not in message for _, _, message in traffic)
+
+
+def test_arrival_offsets():
+    assert load_generator.arrival_offsets(4, 2, 'uniform') == [0, 0.5, 1, 1.5]
+    offsets = load_generator.arrival_offsets(20000, 100, seed=3)
+    assert offsets == sorted(offsets) and offsets[0] == 0
+    assert offsets[-1] / (len(offsets) - 1) == pytest.approx(0.01, rel=0.05)
+    with pytest.raises(ValueError):
+        load_generator.arrival_offsets(3, 1, 'bursty')
+
+
+def test_in_process_run_reports_every_request():
+    traffic = list(load_generator.synthetic_traffic(120, seed=2, conversations=10))
+
+    async def run():
+        target = load_generator.InProcessTarget(4)
+        try:
+            return await load_generator.run_load(target, traffic, rate=2000, interval=0.05)
+        finally:
+            await target.close()
+
+    report = asyncio.run(run())
+    fallbacks = sum(intent is None for intent, _ in main.match_intents([message for _, _, message in traffic]))
+    assert (report['requests'], report['completed'], report['errors']) == (120, 120, 0)
+    assert report['fallback_share'] == fallbacks / 120
+    assert sum(report['class_shares'].values()) == pytest.approx(1)
+    assert sum(summary['count'] for summary in report['classes'].values()) == 120
+    assert sum(window['throughput_rps'] * 0.05 for window in report['timeline']) == pytest.approx(120)
+    assert report['latency']['count'] == 120
+
+
+def test_saturation_point_is_the_last_rate_kept_up_with():
+    runs = [{'target_rps': rate, 'throughput_rps': done, 'errors': errors}
+            for rate, done, errors in ((100, 99, 0), (200, 195, 0), (400, 300, 0), (800, 790, 0))]
+    assert load_generator.saturation_point(runs) == 200
+    assert load_generator.saturation_point([dict(runs[0], errors=1)] + runs[1:]) is None
+
+
+def test_cli_runs_each_rate(capsys):
+    load_generator.main_cli(['--rate', '1000,500', '--requests', '30', '--concurrency', '2', '--mix',
+                             'greeting=1,gibberish=1', '--admission', '--timeline'])
+    report = json.loads(capsys.readouterr().out)
+    assert [run['target_rps'] for run in report['runs']] == [500, 1000]
+    assert report['mix'] == {'greeting': 1, 'gibberish': 1}
+    for run in report['runs']:
+        assert set(run['class_shares']) <= {'greeting', 'gibberish'} and 'timeline' in run
+        admission = run['admission']
+        assert admission['admitted'] + admission['rejected'] == 30 and run['errors'] == admission['rejected']
@@ -0,0 +1,92 @@
+import gc
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import main
+import prefork
+from lazy_imports import lazy_import
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAZY_MODULES = ('difflib', 'auto_dealership_knowledge', 'text_complexity', 'communication_coach', 'faq_index')
+
+
+def loaded_after(code):
+    script = f"import sys\n{code}\nprint([name for name in {LAZY_MODULES!r} if name in sys.modules])"
+    output = subprocess.run([sys.executable, '-c', script], cwd=REPO, capture_output=True, text=True, check=True)
+    return output.stdout.strip()
+
+
+def test_subsystems_load_when_first_used():
+    assert loaded_after('import main') == '[]'
+    assert loaded_after("import main\nmain.get_response('tell me about a suv')") == "['difflib']"
+    assert loaded_after("import main\nmain.get_response('qwerty')") == "['auto_dealership_knowledge', 'faq_index']"
+    assert loaded_after('import prefork\nprefork.cold_start()') == str(list(LAZY_MODULES))
+
+
+def test_lazy_import_loads_once_across_threads(tmp_path, monkeypatch):
+    (tmp_path / 'lazy_probe.py').write_text(
+        "import sys, time\nsys.lazy_probe_runs = getattr(sys, 'lazy_probe_runs', 0) + 1\ntime.sleep(0.05)\n"
+        "VALUE = 42\n", encoding='utf-8')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(sys, 'lazy_probe_runs', 0, raising=False)
+    monkeypatch.delitem(sys.modules, 'lazy_probe', raising=False)
+
+    proxy = lazy_import('lazy_probe')
+    assert 'lazy_probe' not in sys.modules and 'not loaded' in repr(proxy)
+    values = []
+    threads = [threading.Thread(target=lambda: values.append(proxy.VALUE)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert values == [42] * 8 and sys.lazy_probe_runs == 1
+    proxy.VALUE = 7
+    assert sys.modules['lazy_probe'].VALUE == 7 and lazy_import('lazy_probe') is sys.modules['lazy_probe']
+
+    with pytest.raises(ImportError):
+        lazy_import('no_such_module_here')
+
+
+def wait_for(launcher, count, event, timeout=30):
+    reports = []
+    deadline = time.monotonic() + timeout
+    while sum(report['event'] == event for report in reports) < count:
+        assert time.monotonic() < deadline, reports
+        reports.extend(launcher.poll(0.1))
+    return reports
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason="needs os.fork")
+def test_forked_workers_answer_and_are_replaced():
+    launcher = prefork.PreforkLauncher(workers=2, port=0, threads=1)
+    try:
+        launcher.start()
+        timings = launcher.timings
+        assert timings['cold_start_ms'] >= timings['warmup_ms'] > 0
+        ready = wait_for(launcher, 2, 'ready')
+        assert sorted(report['worker'] for report in ready if report['event'] == 'ready') == [0, 1]
+
+        with socket.create_connection(('127.0.0.1', launcher.port), timeout=10) as connection:
+            connection.sendall(json.dumps({'message': 'tell me about a suv', 'seed': 2}).encode('utf-8') + b'\n')
+            reply = json.loads(connection.makefile('rb').readline())
+        assert reply['response'] == main.get_response('tell me about a suv', seed=2)
+        first = wait_for(launcher, 1, 'first_response')
+        assert any(report['event'] == 'first_response' and report['handled_ms'] >= 0 for report in first)
+
+        os.kill(ready[0]['pid'], signal.SIGKILL)
+        replaced = wait_for(launcher, 1, 'ready')
+        exited = [report for report in replaced if report['event'] == 'exited']
+        assert [(report['worker'], report['pid']) for report in exited] == [(ready[0]['worker'], ready[0]['pid'])]
+        assert launcher.respawns == 1
+        assert all(prefork.format_report(report) for report in ready + first + replaced)
+    finally:
+        launcher.stop()
+        gc.unfreeze()
@@ -0,0 +1,68 @@
+import random
+
+import pytest
+
+from backends import available_backends
+from quote_engine import QuoteEngine, build_scenarios
+
+
+@pytest.fixture(scope='module')
+def engine():
+    return QuoteEngine(build_scenarios())
+
+
+def brute_force_best_quotes(engine, prices, monthly_budget, limit):
+    quotes = []
+    for row in sorted(range(len(prices)), key=lambda row: (prices[row], row), reverse=True):
+        candidates = [(engine.quote(prices[row], number), number) for number in range(len(engine))]
+        affordable = [(quote, number) for quote, number in candidates
+                      if quote.monthly_payment <= monthly_budget + 1e-9]
+        if affordable:
+            quote, _ = min(affordable, key=lambda entry: (entry[0].finance_charge, entry[0].total_cost, entry[1]))
+            quotes.append(quote._replace(row=row))
+        if len(quotes) == limit:
+            break
+    return quotes
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_best_quotes_matches_brute_force(engine, seed):
+    rng = random.Random(seed)
+    prices = [rng.randrange(5000, 90000) for _ in range(400)]
+    order = sorted(range(len(prices)), key=prices.__getitem__)
+    for monthly_budget in (0, 150, 333.33, 450, 800, 5000):
+        expected = brute_force_best_quotes(engine, prices, monthly_budget, 10)
+        for limit in (1, 3, 10):
+            assert engine.best_quotes(prices, monthly_budget, limit) == expected[:limit]
+            assert engine.best_quotes(prices, monthly_budget, limit, order=order) == expected[:limit]
+
+
+def test_best_quotes_edge_cases(engine):
+    assert engine.best_quotes([], 450) == []
+    assert engine.best_quotes([30000], 450, limit=0) == []
+    assert engine.best_quotes([30000], -1) == []
+    assert engine.best_quotes([10 ** 9], 450) == []
+
+
+def test_max_prices_are_the_break_even_prices(engine):
+    for number, price in enumerate(engine.max_prices(450)):
+        assert engine.quote(price, number).monthly_payment == pytest.approx(450)
+
+
+@pytest.mark.parametrize('backend', available_backends())
+def test_grid_matches_quote(engine, backend):
+    rng = random.Random(0)
+    prices = [rng.randrange(0, 90000) for _ in range(200)] + [0, 1000, 2000, 5000]
+    grid = engine.grid(prices, backend)
+    for row, price in enumerate(prices):
+        for number in range(len(engine)):
+            if backend == 'numpy':
+                payment, total, charge = (grid.monthly_payment[row, number], grid.total_cost[row, number],
+                                          grid.finance_charge[row, number])
+            else:
+                payment, total, charge = (grid.monthly_payment[number][row], grid.total_cost[number][row],
+                                          grid.finance_charge[number][row])
+            quote = engine.quote(price, number)
+            assert payment == pytest.approx(quote.monthly_payment, abs=1e-9)
+            assert total == pytest.approx(quote.total_cost, abs=1e-6)
+            assert charge == pytest.approx(quote.finance_charge, abs=1e-6)
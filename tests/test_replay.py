@@ -0,0 +1,50 @@
+import json
+
+import main
+import replay
+
+MESSAGES = ['tell me about a suv', 'I want to buy a sedan', 'what financing do you have', 'qwerty', 'bye bye',
+            'negotiate the price of a truck', '']
+
+
+def test_read_messages_skips_what_isnt_a_message():
+    lines = ['{"message": "hello"}\n', '\n', 'not json\n', '"bare string"\n', '{"message": 3}\n', '[1]\n',
+             '{"text": "other field"}\n', '{"message": "bye"']
+    bad_lines = []
+    assert list(replay.read_messages(lines, bad_lines=bad_lines)) == [(1, 'hello'), (4, 'bare string')]
+    assert bad_lines == [3, 8]
+    assert list(replay.read_messages(lines, field='text')) == [(4, 'bare string'), (7, 'other field')]
+
+
+def test_replay_keeps_input_order_and_matches_each_configuration():
+    stricter = dict(replay.load_config(), match_threshold=101)
+    messages = list(enumerate(MESSAGES * 5, 1))
+    results = list(replay.replay(messages, replay.load_config(), stricter, workers=2, chunk_size=3,
+                                 max_pending=2))
+
+    assert [(line, message) for line, message, *_ in results] == messages
+    for (_, message, old_intent, old_score, new_intent, new_score) in results:
+        intent, score = main.match_intent(main.preprocess_input(message), main.INTENT_REGISTRY)
+        assert (old_intent, old_score) == (intent.intent_id if intent is not None else None, score)
+        # No score reaches the stricter threshold
+        assert new_intent is None
+
+
+def test_cli_writes_changed_results_and_a_summary(tmp_path, capsys):
+    transcript = tmp_path / 'transcript.jsonl'
+    transcript.write_text(''.join(json.dumps({'message': message}) + '\n' for message in MESSAGES) + 'oops\n',
+                          encoding='utf-8')
+    current = tmp_path / 'current.json'
+    current.write_text(json.dumps({'match_threshold': 101}), encoding='utf-8')
+    output = tmp_path / 'diff.jsonl'
+
+    replay.main_cli([str(transcript), '--current', str(current), '--output', str(output), '--workers', '1'])
+
+    changed = [json.loads(line) for line in output.read_text(encoding='utf-8').splitlines()]
+    summary = json.loads(capsys.readouterr().err)
+    matched = [message for message in MESSAGES
+               if main.match_intent(main.preprocess_input(message), main.INTENT_REGISTRY)[0] is not None]
+    assert matched and [record['message'] for record in changed] == matched
+    assert all(record['current'][0] is None for record in changed)
+    assert (summary['messages'], summary['intent_changes'], summary['bad_lines'], summary['bad_line_numbers']) == \
+        (len(MESSAGES), len(matched), 1, [len(MESSAGES) + 1])
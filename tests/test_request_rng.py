@@ -0,0 +1,67 @@
+import random
+import threading
+
+import main
+import request_rng
+from threaded_responder import ThreadedResponder
+
+LONG_MESSAGE = ("I keep going back and forth between commuting costs, insurance quotes, resale values and whether "
+                "my family will outgrow whatever I pick in a couple of years, so what should I weigh first")
+
+MESSAGES = ['hello', 'bye', LONG_MESSAGE, 'qwerty asdf', 'what financing options do you have for a new sedan?']
+
+
+def test_same_seed_gives_the_same_choices():
+    first, second = request_rng.RequestRandom(7, 'session', 'hi'), request_rng.RequestRandom(7, 'session', 'hi')
+    assert [first.random() for _ in range(20)] == [second.random() for _ in range(20)]
+    other = request_rng.RequestRandom(8, 'session', 'hi')
+    assert [first.choice(range(1000)) for _ in range(20)] != [other.choice(range(1000)) for _ in range(20)]
+
+
+def test_seeded_context_is_restored():
+    assert request_rng.current() is random
+    with request_rng.seeded(3, 'hi') as rng:
+        assert request_rng.current() is rng
+        with request_rng.seeded(None):
+            assert request_rng.current() is rng
+    assert request_rng.current() is random
+
+
+def test_interleaved_streams_match_their_replies_alone():
+    expected = {message: main.get_response(message, 'rng-session', seed=11) for message in MESSAGES}
+
+    streams = [main.stream_response(message, 'rng-session', seed=11) for message in MESSAGES]
+    chunks = [[] for _ in streams]
+    active = list(range(len(streams)))
+    while active:
+        for number in list(active):
+            chunk = next(streams[number], None)
+            if chunk is None:
+                active.remove(number)
+                continue
+            chunks[number].append(chunk)
+            # Nothing the paused streams set is visible here
+            assert request_rng.current() is random
+            assert main.get_response('bye', seed=5) == main.get_response('bye', seed=5)
+
+    assert {message: ''.join(parts) for message, parts in zip(MESSAGES, chunks)} == expected
+
+
+def test_seeded_replies_do_not_depend_on_threads():
+    requests = [(f'session-{number % 7}', MESSAGES[number % len(MESSAGES)]) for number in range(60)]
+    expected = [main.get_response(message, session_id, seed=4) for session_id, message in requests]
+    with ThreadedResponder(workers=4, seed=4, warmup=False) as responder:
+        assert list(responder.responses(requests)) == expected
+
+    results = {}
+
+    def answer(number):
+        session_id, message = requests[number]
+        results[number] = main.get_response(message, session_id, seed=4)
+
+    threads = [threading.Thread(target=answer, args=(number,)) for number in range(len(requests))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [results[number] for number in range(len(requests))] == expected
@@ -0,0 +1,138 @@
+import collections
+import random
+
+import pytest
+
+from session_store import SessionStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ReferenceStore:
+    """LRU dict with a TTL counted in whole ticks, checked against on every operation"""
+
+    def __init__(self, ttl_ticks, max_sessions):
+        self.ttl_ticks = ttl_ticks
+        self.max_sessions = max_sessions
+        self.sessions = collections.OrderedDict()
+        self.evictions = 0
+        self.expirations = 0
+
+    def advance(self, tick):
+        for session_id, record in list(self.sessions.items()):
+            if record['tick'] <= tick - self.ttl_ticks:
+                del self.sessions[session_id]
+                self.expirations += 1
+
+    def get(self, session_id, tick):
+        self.advance(tick)
+        record = self.sessions.get(session_id)
+        if record is None:
+            return None
+        record['tick'] = tick
+        self.sessions.move_to_end(session_id)
+        return (session_id, record['intent'], record['vehicle'], record['budget'], record['turns'])
+
+    def update(self, session_id, tick, intent_id, vehicle_type, budget):
+        self.advance(tick)
+        record = self.sessions.get(session_id)
+        if record is None:
+            while len(self.sessions) >= self.max_sessions:
+                self.sessions.popitem(last=False)
+                self.evictions += 1
+            record = self.sessions[session_id] = {'intent': None, 'vehicle': None, 'budget': None, 'turns': 0}
+        self.sessions.move_to_end(session_id)
+        record['tick'] = tick
+        record['turns'] += 1
+        for field, value in (('intent', intent_id), ('vehicle', vehicle_type), ('budget', budget)):
+            if value is not None:
+                record[field] = value
+        return (session_id, record['intent'], record['vehicle'], record['budget'], record['turns'])
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_timer_wheel_matches_lru_with_ttl(seed):
+    rng = random.Random(seed)
+    clock = FakeClock()
+    store = SessionStore(ttl=30.0, max_sessions=8, resolution=1.0, clock=clock)
+    reference = ReferenceStore(30, 8)
+    session_ids = [f'session-{number}' for number in range(20)]
+
+    tick = 0
+    for _ in range(2000):
+        # One operation per tick keeps the LRU order exact, which the wheel only tracks per tick; now and then
+        # the store sits idle for longer than the TTL
+        tick += rng.choice((1, 1, 1, 1, 2, 3, 7)) if rng.random() < 0.99 else 40
+        clock.now = tick + rng.random() * 0.9
+        session_id = rng.choice(session_ids)
+        operation = rng.random()
+        if operation < 0.5:
+            arguments = (rng.choice((None, 'greeting', 'financing')), rng.choice((None, 'sedan', 'truck')),
+                         rng.choice((None, 20000, 35000)))
+            assert tuple(store.update(session_id, *arguments)) == reference.update(session_id, tick, *arguments)
+        elif operation < 0.9:
+            context = store.get(session_id)
+            expected = reference.get(session_id, tick)
+            assert (tuple(context) if context is not None else None) == expected
+        else:
+            store.expire()
+            reference.advance(tick)
+
+        assert set(reference.sessions) == {session_id for session_id in session_ids if session_id in store}
+        assert len(store) == len(reference.sessions)
+        assert sum(map(len, store._wheel)) == len(store)
+
+    stats = store.stats()
+    assert stats['evictions'] == reference.evictions
+    assert stats['expirations'] == reference.expirations
+
+
+def test_bytes_follow_the_sessions_kept():
+    clock = FakeClock()
+    store = SessionStore(ttl=10.0, max_sessions=100, clock=clock)
+    session_ids = [f'session-{number}' for number in range(50)]
+    for session_id in session_ids:
+        store.update(session_id, 'greeting')
+    assert store.bytes == sum(SessionStore._entry_size(session_id) for session_id in session_ids)
+    store.discard('session-0')
+    assert store.bytes == sum(SessionStore._entry_size(session_id) for session_id in session_ids[1:])
+
+    clock.now = 100.0
+    store.expire()
+    assert len(store) == 0
+    assert store.bytes == 0
+
+
+def test_active_sessions_keep_one_wheel_entry():
+    clock = FakeClock()
+    store = SessionStore(ttl=1000.0, clock=clock)
+    for tick in range(500):
+        clock.now = tick
+        store.update('session-active', 'greeting')
+        store.get('session-reader')
+    store.update('session-reader')
+    clock.now = 500
+    store.get('session-reader')
+    assert sum(map(len, store._wheel)) == len(store) == 2
+    assert store.bytes == SessionStore._entry_size('session-active') + SessionStore._entry_size('session-reader')
+
+
+def test_memory_budget_evicts_least_recently_used():
+    clock = FakeClock()
+    size = SessionStore._entry_size('session-0')
+    store = SessionStore(max_bytes=3 * size, clock=clock)
+    for number in range(3):
+        clock.now = number
+        store.update(f'session-{number}')
+    clock.now = 3
+    store.get('session-0')
+    clock.now = 4
+    store.update('session-3')
+    assert [f'session-{number}' in store for number in range(4)] == [True, False, True, True]
+    assert store.stats()['evictions'] == 1
@@ -0,0 +1,60 @@
+import pytest
+
+import auto_dealership_knowledge
+import main
+import tracing
+from tracing import TRACER, MemorySink
+
+knowledge = auto_dealership_knowledge.AutoDealershipKnowledge
+
+
+@pytest.fixture
+def sink():
+    sink = MemorySink()
+    TRACER.reset()
+    TRACER.enable(sink)
+    yield sink
+    TRACER.disable()
+    TRACER.reset()
+
+
+def test_guides_stream_the_text_they_return():
+    chunks = list(knowledge.stream_buying_process_guide())
+    assert len(chunks) > 1
+    assert ''.join(chunks) == knowledge.buying_process_guide()
+    for budget in (None, 15000, 40000):
+        assert ''.join(knowledge.stream_financing(budget)) == knowledge.explain_financing(budget)
+
+
+@pytest.mark.parametrize('query', ['how do I buy a car', 'tell me about financing', 'I like sedans', 'qwerty'])
+def test_auto_response_streams_the_text_it_returns(query):
+    streamed = ''.join(auto_dealership_knowledge.stream_auto_response(query))
+    assert (streamed or auto_dealership_knowledge.DEFAULT_AUTO_RESPONSE) == \
+        auto_dealership_knowledge.generate_auto_response(query)
+
+
+def test_response_stream_sends_the_first_line_first():
+    stream = main.stream_response('how do I buy a car', seed=1)
+    first = next(stream)
+    assert first == next(knowledge.stream_buying_process_guide())
+    assert first + ''.join(stream) == main.get_response('how do I buy a car', seed=1)
+
+
+def test_request_spans_stay_with_their_stream(sink):
+    streams = [main.stream_response(message, seed=2) for message in ('how do I buy a car', 'hello', 'qwerty')]
+    for stream in streams:
+        next(stream)
+        # No request ID is left set in the caller while streams are paused
+        assert tracing._request_id.get() is None
+    # Closing in any order ends each request once, with its own ID
+    for stream in reversed(streams):
+        stream.close()
+    for stream in streams:
+        stream.close()
+
+    requests = [record for record in sink.records if record['stage'] == 'request']
+    assert len(requests) == 3
+    assert len({record['request_id'] for record in requests}) == 3
+    assert TRACER.counters()['requests'] == 3
+    # Every span of a stream, its time to first chunk included, carries the stream's request ID
+    assert all(record['request_id'] is not None for record in sink.records)
@@ -0,0 +1,93 @@
+import decimal
+import sys
+
+import pytest
+
+import auto_bot
+import template_engine
+from auto_dealership_knowledge import AutoDealershipKnowledge, derive_knowledge
+from template_engine import compile_template
+
+VALUES = {'topic': 'sedan', 'count': 3, 'price': 21999.5, 'rate': decimal.Decimal('4.90'), 'empty': '',
+          'items': ['a', 'b'], 'width': 8, 'none': None, 'flag': True, 'text': 'ünïcode "quoted"'}
+
+TEMPLATES = [
+    "Plain text with no fields",
+    "",
+    "Looking for a {topic}? They are known for being {text}.",
+    "{count}{topic}{count}",
+    "100% sure: {count} at {rate}%, %s stays literal",
+    "{{escaped}} {topic} {{{count}}}",
+    "{price:,.2f} {rate:>8} {count:03d} {topic!r} {text!a} {none!s:>6} {flag}",
+    "{empty}{none}",
+    "{items[0]} and {price.real}",
+    "{topic:{width}}",
+]
+
+
+@pytest.mark.parametrize('source', TEMPLATES)
+def test_render_is_str_format(source):
+    expected = source.format(**VALUES)
+    assert template_engine.render(source, **VALUES) == expected
+    assert compile_template(source).render(VALUES) == expected
+    assert compile_template(source) is compile_template(source)
+
+
+@pytest.mark.parametrize('source', ["{topic", "topic}", "}{topic}", "{topic!x}", "{topic!}"])
+def test_malformed_templates_fail_like_str_format(source):
+    with pytest.raises(ValueError) as expected:
+        source.format(topic='sedan')
+    with pytest.raises(ValueError) as raised:
+        template_engine.render(source, topic='sedan')
+    assert str(raised.value) == str(expected.value)
+
+
+def test_missing_fields_raise_like_str_format():
+    for source in ("{topic} {missing}", "{missing:>4}", "{missing.attribute}"):
+        with pytest.raises(KeyError):
+            template_engine.render(source, topic='sedan')
+    # Keyword rendering has no positional arguments
+    with pytest.raises(IndexError):
+        template_engine.render("{0} {topic}", topic='sedan')
+
+
+def test_static_templates_are_interned():
+    source = ''.join(['Static ', 'reply'])
+    template = compile_template(source)
+    assert template.static and template.text is sys.intern('Static reply')
+    assert not compile_template("Dynamic {reply}").static
+
+    marker = object()
+    compiled = template_engine.precompile({'static': [''.join(['Static ', 'reply'])], 'other': [marker]})
+    assert compiled['static'][0] is sys.intern('Static reply') and compiled['other'] == [marker]
+
+
+def test_pre_rendered_blocks_match_the_constants():
+    knowledge = derive_knowledge({'BUYING_PROCESS_STEPS': ['Pick a car', 'Sign'], 'NEGOTIATION_TIPS': ['Smile']})
+    for cls in (AutoDealershipKnowledge, knowledge):
+        blocks = cls.rendered_blocks()
+        assert blocks is cls.rendered_blocks()
+        assert blocks.buying_process_guide == ''.join(blocks.buying_process_chunks) == "Auto Buying Process:\n" + \
+            ''.join(f"{i}. {step}\n" for i, step in enumerate(cls.BUYING_PROCESS_STEPS, 1))
+        assert blocks.financing_options == ''.join(blocks.financing_chunks) == "Financing Options:\n" + \
+            ''.join(f"- {option}\n" for option in cls.FINANCING_OPTIONS)
+        assert blocks.maintenance == f"Key Maintenance Tips:\n{chr(10).join(cls.MAINTENANCE_ADVICE['frequency'])}"
+        assert blocks.negotiation == f"Negotiation Tips:\n{chr(10).join(cls.NEGOTIATION_TIPS)}"
+        assert blocks.vehicle_replies == {
+            vehicle_type: f"Looking for a {vehicle_type}? They are known for being {', '.join(attributes)}."
+            for vehicle_type, attributes in cls.VEHICLE_TYPES.items()
+        }
+        assert cls.buying_process_guide() is blocks.buying_process_guide
+        assert cls.explain_financing() is blocks.financing_options
+    assert knowledge.rendered_blocks() is not AutoDealershipKnowledge.rendered_blocks()
+
+
+def test_bot_static_replies_match_the_knowledge_base():
+    bot = auto_bot.AutoDealershipBot()
+    knowledge_base = bot.knowledge_base
+    assert bot.static_replies['buying_process'] == "Buying Process Steps:\n" + "\n".join(
+        f"{i+1}. {step}" for i, step in enumerate(knowledge_base['buying_process']))
+    assert bot.static_replies['negotiation'] == "Negotiation Tips:\n" + "\n".join(
+        f"- {tip}" for tip in knowledge_base['negotiation_tips'])
+    for topic, attributes in knowledge_base['vehicle_types'].items():
+        assert bot.static_replies[topic] == f"Looking for a {topic}? They are known for being {', '.join(attributes)}."
@@ -0,0 +1,82 @@
+import pytest
+
+import main
+import tenant_context
+import tenants
+
+
+@pytest.fixture(scope='module')
+def overlays():
+    return tenants.synthetic_overlays(6)
+
+
+def test_lru_evicts_least_recently_used_engine(overlays):
+    registry = tenants.TenantRegistry(overlays, max_engines=2)
+    for tenant_id in ('dealer-0', 'dealer-1', 'dealer-0', 'dealer-2'):
+        registry.engine(tenant_id)
+    assert list(registry._engines) == ['dealer-0', 'dealer-2']
+
+    stats = registry.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions']) == (1, 3, 1)
+    assert stats['engines'] == 2
+    assert stats['bytes'] == sum(engine.bytes for engine in registry._engines.values())
+
+
+def test_memory_budget_keeps_bytes_in_step(overlays):
+    unbounded = tenants.TenantRegistry(overlays)
+    sizes = {tenant_id: unbounded.engine(tenant_id).bytes for tenant_id in overlays}
+    assert all(size > 0 for size in sizes.values())
+    assert unbounded.bytes == sum(sizes.values())
+
+    budget = sizes['dealer-0'] + sizes['dealer-1']
+    registry = tenants.TenantRegistry(overlays, max_bytes=budget)
+    for tenant_id in overlays:
+        registry.engine(tenant_id)
+        assert registry.bytes == sum(engine.bytes for engine in registry._engines.values())
+        assert registry.bytes <= budget or len(registry._engines) == 1
+    assert registry.stats()['evictions'] >= len(overlays) - 2
+
+    registry.remove('dealer-5')
+    assert 'dealer-5' not in registry
+    assert registry.bytes == sum(engine.bytes for engine in registry._engines.values())
+    with pytest.raises(KeyError):
+        registry.engine('dealer-5')
+
+
+def test_recompiled_engine_answers_like_the_first(overlays):
+    registry = tenants.TenantRegistry(overlays, max_engines=1)
+    questions = ['hi', 'tell me about your sedans', 'what financing do you offer', 'qwerty']
+    first = [registry.get_response('dealer-3', question, seed=7) for question in questions]
+    registry.engine('dealer-4')
+    assert 'dealer-3' not in registry._engines
+    assert [registry.get_response('dealer-3', question, seed=7) for question in questions] == first
+    assert registry.stats()['misses'] == 3
+
+
+def test_tenant_sessions_are_kept_apart(overlays):
+    registry = tenants.TenantRegistry(overlays)
+    registry.get_response('dealer-0', 'I want a truck', session_id='shared')
+    registry.get_response('dealer-1', 'I want a sedan', session_id='shared')
+    assert main.SESSIONS.get(('dealer-0', 'shared')).vehicle_type == 'truck'
+    assert main.SESSIONS.get(('dealer-1', 'shared')).vehicle_type == 'sedan'
+
+
+def test_replacing_an_overlay_drops_its_engine(overlays):
+    registry = tenants.TenantRegistry(overlays)
+    engine = registry.engine('dealer-0')
+    registry.add('dealer-0', overlays['dealer-1'])
+    assert registry.bytes == 0
+    assert registry.engine('dealer-0') is not engine
+
+
+def test_paused_tenant_stream_does_not_leak_its_engine(overlays):
+    registry = tenants.TenantRegistry(overlays)
+    message = 'hello hi hey sup car'
+    expected = main.get_response(message, seed=1)
+
+    stream = registry.stream_response('dealer-0', message, seed=1)
+    first = next(stream)
+    assert tenant_context.current() is None
+    assert main.get_response(message, seed=1) == expected
+    assert first + ''.join(stream) == registry.get_response('dealer-0', message, seed=1)
+    assert first != expected
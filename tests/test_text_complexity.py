@@ -0,0 +1,88 @@
+import random
+import re
+
+import pytest
+
+from communication_coach import CommunicationCoach
+from text_complexity import IncrementalComplexityAnalyzer, TextComplexityAnalyzer
+
+# Pieces that trip up per-word lowercasing: 'İ' lowercases to two characters and the lowercase of a capital
+# sigma depends on the letters around it
+PIECES = ['İstanbul', 'ΟΔΟΣ', "ΟΔΟΣ's", 'Α.Σ', "A'Σ", 'ΣΑΣ', 'Word', 'sedan', 'straße', 'ǅ', 'ﬃ', '9', '_',
+          '.', '..', '!?', ',', "'", ' ', '  ', '\n']
+
+
+def reference_complexity(text):
+    # The original regex pipeline: words of the lowercased text, sentences of the text as written
+    words = re.findall(r'\w+', text.lower())
+    word_count = len(words)
+    unique_word_ratio = len(set(words)) / word_count if word_count > 0 else 0
+    sentences = re.split(r'[.!?]+', text)
+    avg_sentence_length = sum(len(re.findall(r'\w+', sentence)) for sentence in sentences) / len(sentences)
+    avg_word_length = sum(len(word) for word in words) / word_count if word_count > 0 else 0
+    complexity = (
+        0.3 * min(word_count / 50, 1) +
+        0.2 * unique_word_ratio +
+        0.3 * (avg_sentence_length / 20) +
+        0.2 * (avg_word_length / 6)
+    ) * 100
+    return min(max(complexity, 0), 100), avg_sentence_length, unique_word_ratio
+
+
+def random_texts(count, seed=0):
+    rng = random.Random(seed)
+    return [''.join(rng.choice(PIECES) for _ in range(rng.randint(0, 30))) for _ in range(count)]
+
+
+@pytest.mark.parametrize('text', ['', '...', 'İstanbul', 'ΟΔΟΣ.Α ΟΔΟΣ', "ΟΔΟΣ's ΟΔΟΣ", 'Hello there. How are you?'])
+def test_analyze_matches_the_regex_pipeline(text):
+    analysis = TextComplexityAnalyzer.analyze(text)
+    assert (analysis.complexity, analysis.avg_sentence_length, analysis.unique_word_ratio) == \
+        reference_complexity(text)
+
+
+def test_analyze_matches_the_regex_pipeline_on_random_text():
+    for text in random_texts(1000):
+        analysis = TextComplexityAnalyzer.analyze(text)
+        assert (analysis.complexity, analysis.avg_sentence_length, analysis.unique_word_ratio) == \
+            reference_complexity(text)
+        assert TextComplexityAnalyzer.analyze(analysis) is analysis
+
+
+def test_coaching_uses_the_same_analysis():
+    for text in random_texts(200, seed=1):
+        complexity, avg_sentence_length, unique_word_ratio = reference_complexity(text)
+        insights = CommunicationCoach.analyze_communication_style(text)
+        assert insights == CommunicationCoach.analyze_communication_style(TextComplexityAnalyzer.analyze(text))
+        assert insights['complexity'] == {
+            'score': complexity, 'category': TextComplexityAnalyzer.get_complexity_category(complexity)
+        }
+        assert insights['sentence_structure']['avg_length'] == avg_sentence_length
+        assert insights['vocabulary']['diversity_ratio'] == unique_word_ratio
+
+
+def random_chunks(text, rng):
+    # Cut anywhere, including inside words, '..' runs and multi-character lowercasings, and sometimes twice
+    # in the same place
+    cuts = sorted(rng.randint(0, len(text)) for _ in range(rng.randint(0, 8)))
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+
+def test_incremental_analysis_matches_analyze_on_every_prefix():
+    rng = random.Random(2)
+    for text in random_texts(500, seed=3):
+        analyzer = IncrementalComplexityAnalyzer()
+        fed = ''
+        for chunk in random_chunks(text, rng):
+            analyzer.feed(chunk)
+            fed += chunk
+            expected = TextComplexityAnalyzer.analyze(fed)
+            assert analyzer.analysis() == expected
+            assert (analyzer.complexity, analyzer.category, analyzer.word_count) == \
+                (expected.complexity, expected.category, expected.word_count)
+        assert TextComplexityAnalyzer.analyze(analyzer) == IncrementalComplexityAnalyzer(text).analysis()
+        assert CommunicationCoach.analyze_communication_style(analyzer) == \
+            CommunicationCoach.analyze_communication_style(text)
+
+        analyzer.reset()
+        assert analyzer.analysis() == TextComplexityAnalyzer.analyze('')
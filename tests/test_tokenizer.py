@@ -0,0 +1,55 @@
+import random
+import re
+
+import faq_index
+import tokenizer
+
+
+def legacy_preprocess(text):
+    text = re.sub(r'[^\w\s]', '', text.lower())
+    return [word for word in text.split() if word not in tokenizer.STOP_WORDS]
+
+
+def random_messages(count, seed=0):
+    rng = random.Random(seed)
+    vocabulary = ['Sedan', 'suv!', 'TRUCK', 'finance,', 'the', 'a', 'of', 'For', '...', '?!', 'do-it', "can't",
+                  'Straße', 'İstanbul', 'ΟΔΟΣ', '$20,000', 'x' * 30, '', '\t']
+    return [' '.join(rng.choice(vocabulary) for _ in range(rng.randint(0, 15))) for _ in range(count)]
+
+
+def test_preprocess_matches_the_whole_text_pipeline():
+    for cache_size in (0, 8):
+        words = tokenizer.Tokenizer(cache_size=cache_size)
+        for message in random_messages(500):
+            assert words.preprocess(message) == legacy_preprocess(message)
+
+
+def test_repeated_words_are_the_same_object():
+    words = tokenizer.Tokenizer()
+    first, second = words.preprocess('Sedan sedan!'), words.preprocess('SEDAN?')
+    assert first[0] is first[1] is second[0]
+    assert len(words) == 1
+
+
+def test_full_vocabulary_is_replaced():
+    previous = tokenizer.install_tokenizer(tokenizer.Tokenizer(max_words=3))
+    try:
+        full = tokenizer.active_tokenizer()
+        assert tokenizer.preprocess_input('one two three') == ['one', 'two', 'three']
+        assert tokenizer.preprocess_input('four') == ['four']
+        assert tokenizer.active_tokenizer() is not full
+        assert len(full) == 3 and len(tokenizer.active_tokenizer()) == 1
+    finally:
+        tokenizer.install_tokenizer(previous)
+
+
+def test_index_builds_leave_the_serving_vocabulary_alone(tmp_path):
+    words = tokenizer.active_tokenizer()
+    before = len(words)
+    faq_index.build_index(['Zyxwvu qwertyuiop passages.', 'More zyxwvu words here.'], str(tmp_path / 'faq.idx'))
+    assert len(words) == before
+    index = faq_index.FaqIndex(str(tmp_path / 'faq.idx'))
+    try:
+        assert len(index.search('zyxwvu', 2)) == 2
+    finally:
+        index.close()
@@ -0,0 +1,75 @@
+import collections
+import json
+
+import pytest
+
+import main
+import tracing
+from tracing import TRACER, JsonLinesSink, MemorySink, PrometheusTextSink
+
+LONG_MESSAGE = ' '.join(['qwerty asdf zxcv uiop'] * 8)
+
+
+@pytest.fixture
+def sink():
+    sink = MemorySink()
+    TRACER.reset()
+    TRACER.enable(sink)
+    yield sink
+    TRACER.disable()
+    TRACER.reset()
+
+
+def stages_by_request(records):
+    stages = collections.defaultdict(list)
+    for record in records:
+        stages[record['request_id']].append(record['stage'])
+    return stages
+
+
+def test_disabled_tracing_records_nothing():
+    TRACER.reset()
+    assert not TRACER.enabled
+    assert TRACER.span('preprocess') is TRACER.request() is tracing.NULL_SPAN
+    main.get_response('tell me about a suv')
+    TRACER.count('fallback')
+    assert TRACER.counters() == {} and TRACER.stage_recorders() == {}
+
+
+def test_each_request_records_its_stages(sink):
+    assert main.get_response('tell me about a suv', seed=1) == main.get_response('tell me about a suv', seed=1)
+    main.get_response(LONG_MESSAGE, seed=1)
+
+    stages = list(stages_by_request(sink.records).values())
+    assert len(stages) == 3
+    assert sorted(stages[0]) == sorted(stages[1]) == \
+        sorted(['preprocess', 'intent_scoring', 'render', 'first_chunk', 'request'])
+    # The request span closes last, after everything it contains
+    assert stages[2][-1] == 'request'
+    assert {'preprocess', 'intent_scoring', 'auto_response', 'first_chunk', 'complexity',
+            'communication_coach', 'fallback'} <= set(stages[2])
+    assert 'render' not in stages[2]
+
+    summary = TRACER.summary()
+    assert summary['counters'] == {'requests': 3, 'fallback': 1}
+    assert summary['fallback_rate'] == 1 / 3
+    assert summary['stages']['request']['count'] == 3
+    assert summary['stages']['complexity']['count'] == 1
+    assert all(record['duration_ms'] >= 0 for record in sink.records)
+
+
+def test_sinks_export_spans_and_summaries(sink, tmp_path):
+    jsonl = JsonLinesSink(str(tmp_path / 'spans.jsonl'))
+    prometheus = PrometheusTextSink(str(tmp_path / 'metrics.prom'))
+    TRACER.enable(sink, jsonl, prometheus)
+    main.get_response('tell me about a suv')
+    main.get_response('qwerty')
+    TRACER.flush()
+    jsonl.close()
+
+    lines = [json.loads(line) for line in (tmp_path / 'spans.jsonl').read_text(encoding='utf-8').splitlines()]
+    assert lines == list(sink.records)
+    exposition = (tmp_path / 'metrics.prom').read_text(encoding='utf-8')
+    assert 'chatbot_stage_latency_seconds_count{stage="request"} 2\n' in exposition
+    assert 'chatbot_stage_latency_seconds{stage="intent_scoring",quantile="0.99"}' in exposition
+    assert 'chatbot_requests_total 2\n' in exposition and 'chatbot_fallback_total 1\n' in exposition
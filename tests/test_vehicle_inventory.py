@@ -0,0 +1,105 @@
+import json
+import random
+
+import pytest
+
+from auto_dealership_knowledge import derive_knowledge
+from vehicle_inventory import NUMERIC_COLUMNS, Vehicle, VehicleInventory, synthetic_inventory
+
+ORDERS = [name for column in NUMERIC_COLUMNS for name in (column, '-' + column)]
+
+
+def brute_force(vehicles, vehicle_types=None, makes=None, min_price=None, max_price=None, min_year=None,
+                max_year=None, max_mileage=None, min_mpg=None, order_by='price', limit=10):
+    def matches(vehicle):
+        return ((vehicle_types is None or vehicle.vehicle_type in {value.lower() for value in vehicle_types}) and
+                (makes is None or vehicle.make in {value.lower() for value in makes}) and
+                (min_price is None or vehicle.price >= min_price) and
+                (max_price is None or vehicle.price <= max_price) and
+                (min_year is None or vehicle.year >= min_year) and
+                (max_year is None or vehicle.year <= max_year) and
+                (max_mileage is None or vehicle.mileage <= max_mileage) and
+                (min_mpg is None or vehicle.mpg >= min_mpg))
+
+    rows = [row for row, vehicle in enumerate(vehicles) if matches(vehicle)]
+    name = order_by.lstrip('-')
+    if order_by.startswith('-'):
+        # Ties rank the later row first
+        rows.sort(key=lambda row: (-getattr(vehicles[row], name), -row))
+    else:
+        rows.sort(key=lambda row: (getattr(vehicles[row], name), row))
+    return [vehicles[row] for row in rows[:max(limit, 0)]]
+
+
+def random_filters(rng):
+    filters = {'order_by': rng.choice(ORDERS), 'limit': rng.choice([0, 1, 3, 10, 1000])}
+    if rng.random() < 0.5:
+        filters['vehicle_types'] = rng.sample(['sedan', 'SUV', 'truck', 'electric', 'hybrid', 'boat'],
+                                              rng.randint(0, 3))
+    if rng.random() < 0.3:
+        filters['makes'] = rng.sample(['toyota', 'Honda', 'ford', 'tesla', 'nobody'], rng.randint(1, 2))
+    for low, high, values in (('min_price', 'max_price', range(0, 60000, 2500)),
+                              ('min_year', 'max_year', range(2006, 2027))):
+        if rng.random() < 0.4:
+            filters[low] = rng.choice(values)
+        if rng.random() < 0.4:
+            filters[high] = rng.choice(values)
+    if rng.random() < 0.3:
+        filters['max_mileage'] = rng.randrange(0, 200000, 10000)
+    if rng.random() < 0.3:
+        filters['min_mpg'] = rng.uniform(15, 100)
+    return filters
+
+
+@pytest.mark.parametrize('size, bin_count', [(1, 64), (37, 3), (500, 1), (2000, 64)])
+def test_queries_match_a_brute_force_scan(size, bin_count):
+    source = synthetic_inventory(size, seed=size)
+    vehicles = [source.vehicle(row) for row in range(len(source))]
+    inventory = VehicleInventory.from_records(vehicles, bin_count=bin_count)
+    rng = random.Random(size)
+    for _ in range(300):
+        filters = random_filters(rng)
+        assert inventory.query(**filters) == brute_force(vehicles, **filters), filters
+        counted = {name: value for name, value in filters.items() if name not in ('order_by', 'limit')}
+        assert inventory.count(**counted) == len(brute_force(vehicles, limit=len(vehicles), **counted))
+
+
+def test_added_vehicles_are_indexed_on_the_next_query():
+    inventory = VehicleInventory()
+    assert inventory.query() == [] and inventory.count() == 0
+    inventory.add('VIN1', 'Toyota', 'Camry', 'Sedan', 2020, 21000, 30000, 32.5)
+    assert inventory.query(vehicle_types=['sedan']) == [
+        Vehicle('VIN1', 'toyota', 'camry', 'sedan', 2020, 21000, 30000, 32.5)]
+    inventory.extend([{'vin': 'VIN2', 'make': 'honda', 'model': 'accord', 'vehicle_type': 'sedan', 'year': '2021',
+                       'price': '19000.0', 'mileage': '12000', 'mpg': '31'}])
+    assert [vehicle.vin for vehicle in inventory.query()] == ['VIN2', 'VIN1']
+
+    with pytest.raises(ValueError):
+        inventory.add('VIN3', 'ford', 'f-150', 'truck', 'new', 30000, 0, 20)
+    with pytest.raises(ValueError):
+        inventory.query(order_by='make')
+
+
+def test_loaded_files_hold_the_same_vehicles(tmp_path):
+    inventory = synthetic_inventory(50)
+    vehicles = [inventory.vehicle(row) for row in range(len(inventory))]
+    csv_path = tmp_path / 'inventory.csv'
+    csv_path.write_text(','.join(Vehicle._fields) + '\n' + ''.join(
+        ','.join(str(value) for value in vehicle) + '\n' for vehicle in vehicles), encoding='utf-8')
+    jsonl_path = tmp_path / 'inventory.jsonl'
+    jsonl_path.write_text(''.join(json.dumps(vehicle._asdict()) + '\n' for vehicle in vehicles), encoding='utf-8')
+
+    for path in (csv_path, jsonl_path):
+        loaded = VehicleInventory.load(str(path))
+        assert [loaded.vehicle(row) for row in range(len(loaded))] == vehicles
+        assert loaded.query(order_by='-year', limit=5) == inventory.query(order_by='-year', limit=5)
+
+
+def test_recommendations_search_the_inventory():
+    inventory = synthetic_inventory(300)
+    vehicles = [inventory.vehicle(row) for row in range(len(inventory))]
+    knowledge = derive_knowledge({'INVENTORY': inventory})
+    assert knowledge.get_vehicle_recommendations({'family_friendly': True, 'budget': 25000, 'limit': 4}) == \
+        brute_force(vehicles, vehicle_types=['sedan', 'suv'], max_price=25000, limit=4)
+    assert knowledge.get_vehicle_recommendations({'eco_conscious': True, 'order_by': '-mpg'}) == \
+        brute_force(vehicles, vehicle_types=['electric', 'hybrid'], order_by='-mpg')
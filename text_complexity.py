@@ -1,30 +1,131 @@
-import re
 import math
+import bisect
+from collections import namedtuple
+
+from tokenizer import SENTENCE_END_PATTERN, TOKEN_PATTERN, WORD_PATTERN
+
+MessageAnalysis = namedtuple('MessageAnalysis', [
+    'word_count',
+    'unique_word_count',
+    'unique_word_ratio',
+    'sentence_lengths',
+    'avg_sentence_length',
+    'avg_word_length',
+    'complexity',
+    'category'
+])
+MessageAnalysis.__doc__ = """Immutable result of a single pass over a message, shared by every analyzer"""
+
+# Complexity categories from simplest up, and the score at which each one after the first begins
+COMPLEXITY_CATEGORIES = ('simple', 'moderate', 'complex', 'very_complex')
+CATEGORY_THRESHOLDS = (20, 50, 75)
+
+
+def _scan(text, unique_words):
+    """
+    Count the words and sentences of a stretch of text in one pass
+
+    Words are found in the lowercased text and sentences are counted in the
+    text as written, like the original regex pipeline. Lowercasing the whole
+    stretch at once matters: 'İ' lowercases to 'i' plus a combining dot,
+    which splits the word, and a capital sigma's lowercase depends on the
+    letters around it. Whitespace ends that context, so a stretch that starts
+    and ends at whitespace (or the ends of the input) lowercases like it
+    would within the whole text.
+
+    :param text: Stretch of text
+    :param unique_words: Set the lowercase words are added to
+    :return: (word count, total word length, words per sentence as written), where the first sentence continues
+        the one before the stretch
+    """
+    lowered = text.lower()
+    sentence_lengths = []
+    word_count = 0
+    total_word_length = 0
+    current_sentence = 0
+    for token in TOKEN_PATTERN.findall(lowered):
+        if token[0] in '.!?':
+            sentence_lengths.append(current_sentence)
+            current_sentence = 0
+            continue
+        unique_words.add(token)
+        word_count += 1
+        total_word_length += len(token)
+        current_sentence += 1
+    sentence_lengths.append(current_sentence)
+    if len(lowered) != len(text):
+        # Only 'İ' lowercases to more than one character; its word counts once as written
+        sentence_lengths = [len(WORD_PATTERN.findall(sentence)) for sentence in SENTENCE_END_PATTERN.split(text)]
+    return word_count, total_word_length, sentence_lengths
+
 
 class TextComplexityAnalyzer:
     @staticmethod
-    def calculate_complexity(text):
+    def analyze(text):
         """
-        Calculate text complexity based on multiple factors
+        Tokenize a message once and compute every statistic the analyzers need
         
-        :param text: Input text to analyze
-        :return: Complexity score (0-100)
+        :param text: Input text, an existing MessageAnalysis which is returned as-is,
+            or an IncrementalComplexityAnalyzer whose current state is used
+        :return: MessageAnalysis
+        """
+        if isinstance(text, MessageAnalysis):
+            return text
+        if isinstance(text, IncrementalComplexityAnalyzer):
+            return text.analysis()
+        
+        unique_words = set()
+        word_count, total_word_length, sentence_lengths = _scan(text, unique_words)
+        return TextComplexityAnalyzer.analysis_from_counts(
+            word_count, len(unique_words), total_word_length, tuple(sentence_lengths)
+        )
+    
+    @staticmethod
+    def analysis_from_counts(word_count, unique_word_count, total_word_length, sentence_lengths):
         """
-        # Word count complexity
-        words = re.findall(r'\w+', text.lower())
-        word_count = len(words)
+        Build a MessageAnalysis from raw running counts
         
+        :param word_count: Number of words in the lowercased text
+        :param unique_word_count: Number of distinct lowercase words
+        :param total_word_length: Sum of lowercase word lengths
+        :param sentence_lengths: Words per sentence as written, split on [.!?]+
+        :return: MessageAnalysis
+        """
         # Unique word ratio
-        unique_words = len(set(words))
-        unique_word_ratio = unique_words / word_count if word_count > 0 else 0
+        unique_word_ratio = unique_word_count / word_count if word_count > 0 else 0
         
         # Sentence complexity (based on average word length and sentence length)
-        sentences = re.split(r'[.!?]+', text)
-        avg_sentence_length = sum(len(re.findall(r'\w+', sentence)) for sentence in sentences) / len(sentences) if sentences else 0
+        avg_sentence_length = sum(sentence_lengths) / len(sentence_lengths) if sentence_lengths else 0
         
         # Vocabulary complexity (using average word length as a proxy)
-        avg_word_length = sum(len(word) for word in words) / word_count if word_count > 0 else 0
+        avg_word_length = total_word_length / word_count if word_count > 0 else 0
+        
+        complexity = TextComplexityAnalyzer.complexity_score(
+            word_count, unique_word_ratio, avg_sentence_length, avg_word_length
+        )
+        
+        return MessageAnalysis(
+            word_count=word_count,
+            unique_word_count=unique_word_count,
+            unique_word_ratio=unique_word_ratio,
+            sentence_lengths=sentence_lengths,
+            avg_sentence_length=avg_sentence_length,
+            avg_word_length=avg_word_length,
+            complexity=complexity,
+            category=TextComplexityAnalyzer.get_complexity_category(complexity)
+        )
+    
+    @staticmethod
+    def complexity_score(word_count, unique_word_ratio, avg_sentence_length, avg_word_length):
+        """
+        Combine the message statistics into a complexity score
         
+        :param word_count: Number of words
+        :param unique_word_ratio: Distinct words per word
+        :param avg_sentence_length: Words per sentence
+        :param avg_word_length: Characters per word
+        :return: Complexity score (0-100)
+        """
         # Combine factors with weighted scoring
         complexity = (
             0.3 * min(word_count / 50, 1) +  # Penalize very long texts
@@ -32,9 +133,18 @@ class TextComplexityAnalyzer:
             0.3 * (avg_sentence_length / 20) +  # Sentence complexity
             0.2 * (avg_word_length / 6)  # Word complexity
         ) * 100
-        
         return min(max(complexity, 0), 100)
     
+    @staticmethod
+    def calculate_complexity(text):
+        """
+        Calculate text complexity based on multiple factors
+        
+        :param text: Input text to analyze, its MessageAnalysis or an IncrementalComplexityAnalyzer
+        :return: Complexity score (0-100)
+        """
+        return TextComplexityAnalyzer.analyze(text).complexity
+    
     @staticmethod
     def get_complexity_category(complexity_score):
         """
@@ -43,25 +153,17 @@ class TextComplexityAnalyzer:
         :param complexity_score: Complexity score (0-100)
         :return: Complexity category
         """
-        if complexity_score < 20:
-            return 'simple'
-        elif complexity_score < 50:
-            return 'moderate'
-        elif complexity_score < 75:
-            return 'complex'
-        else:
-            return 'very_complex'
+        return COMPLEXITY_CATEGORIES[bisect.bisect_right(CATEGORY_THRESHOLDS, complexity_score)]
     
     @staticmethod
     def suggest_summarization(text):
         """
         Generate a summarization suggestion based on text complexity
         
-        :param text: Input text to analyze
+        :param text: Input text to analyze, its MessageAnalysis or an IncrementalComplexityAnalyzer
         :return: Summarization suggestion
         """
-        complexity = TextComplexityAnalyzer.calculate_complexity(text)
-        category = TextComplexityAnalyzer.get_complexity_category(complexity)
+        category = TextComplexityAnalyzer.analyze(text).category
         
         suggestions = {
             'simple': "Your message seems straightforward. Could you highlight the key point?",
@@ -71,3 +173,118 @@ class TextComplexityAnalyzer:
         }
         
         return suggestions.get(category, suggestions['complex'])
+
+
+class IncrementalComplexityAnalyzer:
+    """
+    Running text statistics for input that arrives in pieces
+    
+    Keeps word and length counts, the set of distinct words and the sentence
+    lengths seen so far, so feeding more text only scans the new part. Text
+    after the last whitespace may still grow (a word split across chunks, or
+    '..' followed by '.'), and lowercasing depends on its neighbours, so it is
+    held back until whitespace follows, but it is included whenever a result
+    is read. Results are identical to running TextComplexityAnalyzer.analyze
+    on all the text fed so far.
+    """
+    
+    def __init__(self, text=''):
+        """
+        :param text: Initial text
+        """
+        self.reset()
+        if text:
+            self.feed(text)
+    
+    def reset(self):
+        """Forget all text fed so far"""
+        self._unique_words = set()
+        self._sentence_lengths = []
+        self._word_count = 0
+        self._total_word_length = 0
+        self._current_sentence = 0
+        # Sum of the sentence lengths, including the current sentence
+        self._sentence_words = 0
+        # Pieces of the text after the last whitespace, scanned once whitespace follows
+        self._pending = []
+    
+    def feed(self, text):
+        """
+        Append text, costing time proportional to its length
+        
+        :param text: Next piece of the input
+        :return: This analyzer
+        """
+        if not text:
+            return self
+        
+        end = len(text)
+        while end and not text[end - 1].isspace():
+            end -= 1
+        if not end:
+            self._pending.append(text)
+            return self
+        
+        word_count, total_word_length, sentence_lengths = _scan(''.join(self._pending) + text[:end],
+                                                                self._unique_words)
+        self._word_count += word_count
+        self._total_word_length += total_word_length
+        self._sentence_words += sum(sentence_lengths)
+        self._current_sentence += sentence_lengths[0]
+        for length in sentence_lengths[1:]:
+            self._sentence_lengths.append(self._current_sentence)
+            self._current_sentence = length
+        self._pending = [text[end:]] if end < len(text) else []
+        return self
+    
+    def _pending_counts(self):
+        # (words, distinct new words, word length, words per sentence) of the held-back text
+        if not self._pending:
+            return 0, 0, 0, [0]
+        new_words = set()
+        word_count, total_word_length, sentence_lengths = _scan(''.join(self._pending), new_words)
+        return word_count, len(new_words - self._unique_words), total_word_length, sentence_lengths
+    
+    @property
+    def word_count(self):
+        return self._word_count + self._pending_counts()[0]
+    
+    @property
+    def complexity(self):
+        """
+        Complexity score of the text so far, without building a MessageAnalysis
+        
+        :return: Complexity score (0-100)
+        """
+        word_count, new_words, total_word_length, pending_lengths = self._pending_counts()
+        word_count += self._word_count
+        unique_word_count = len(self._unique_words) + new_words
+        total_word_length += self._total_word_length
+        sentence_count = len(self._sentence_lengths) + len(pending_lengths)
+        return TextComplexityAnalyzer.complexity_score(
+            word_count,
+            unique_word_count / word_count if word_count > 0 else 0,
+            (self._sentence_words + sum(pending_lengths)) / sentence_count,
+            total_word_length / word_count if word_count > 0 else 0
+        )
+    
+    @property
+    def category(self):
+        """
+        :return: Complexity category of the text so far
+        """
+        return TextComplexityAnalyzer.get_complexity_category(self.complexity)
+    
+    def analysis(self):
+        """
+        Snapshot of the statistics for the text so far
+        
+        :return: MessageAnalysis
+        """
+        word_count, new_words, total_word_length, pending_lengths = self._pending_counts()
+        sentence_lengths = self._sentence_lengths + [self._current_sentence + pending_lengths[0]]
+        sentence_lengths.extend(pending_lengths[1:])
+        return TextComplexityAnalyzer.analysis_from_counts(
+            self._word_count + word_count, len(self._unique_words) + new_words,
+            self._total_word_length + total_word_length, tuple(sentence_lengths)
+        )
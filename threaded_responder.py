@@ -0,0 +1,197 @@
+import argparse
+import collections
+import concurrent.futures
+import itertools
+import json
+import os
+import random
+import sys
+import time
+
+import long_responses
+import main as chatbot
+from prefork import WARMUP_LONG_MESSAGE, WARMUP_MESSAGES
+
+
+def warm_up():
+    """
+    Build every lazily built index and import every lazily imported module
+
+    After this the indexes the bot reads are not written again, so threads
+    answering requests only share read-only structures and the caches that
+    lock themselves (intent cache, session store, vocabulary).
+    """
+    for message in WARMUP_MESSAGES:
+        chatbot.get_response(message, seed=0)
+    long_responses.unknown(input_text=WARMUP_LONG_MESSAGE)
+    inventory = chatbot.auto_dealership_knowledge.active_knowledge().INVENTORY
+    if inventory is not None:
+        inventory.sorted_rows('price')
+    # Warm-up traffic shouldn't show up in the cache statistics
+    if chatbot.INTENT_CACHE is not None:
+        chatbot.INTENT_CACHE.hits = chatbot.INTENT_CACHE.misses = 0
+
+
+class ThreadedResponder:
+    """
+    main.get_response served from a thread pool
+
+    Every request is answered with the responder's seed, so its random
+    choices come from a generator of its own (see request_rng) and the reply
+    depends only on the seed, the session and the message, never on which
+    thread ran it or what ran concurrently.
+    """
+
+    def __init__(self, workers=None, seed=None, warmup=True):
+        """
+        :param workers: Threads, os.cpu_count() by default
+        :param seed: Replay seed; a random one is picked if None, see the seed attribute
+        :param warmup: Whether to run warm_up() before the first request
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.seed = seed if seed is not None else random.SystemRandom().getrandbits(63)
+        if warmup:
+            warm_up()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+
+    def submit(self, user_input, session_id=None):
+        """
+        :param user_input: Raw user input
+        :param session_id: Optional session whose context in main.SESSIONS is updated
+        :return: Future of the response text
+        """
+        return self.executor.submit(chatbot.get_response, user_input, session_id, self.seed)
+
+    def get_response(self, user_input, session_id=None):
+        """
+        :param user_input: Raw user input
+        :param session_id: Optional session whose context in main.SESSIONS is updated
+        :return: Response text
+        """
+        return self.submit(user_input, session_id).result()
+
+    def responses(self, requests, max_pending=None):
+        """
+        Answer a stream of requests concurrently, in input order
+
+        Requests are submitted through a bounded window, so memory use doesn't
+        grow with the length of the stream.
+
+        :param requests: Iterable of (session ID or None, message)
+        :param max_pending: Requests in flight, 64 per thread by default
+        :return: Generator of response texts
+        """
+        max_pending = max_pending or self.workers * 64
+        pending = collections.deque()
+        for session_id, message in requests:
+            pending.append(self.submit(message, session_id))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+def _read_requests(lines, field, session_field):
+    # Like replay.read_messages, keeping each record's session ID
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if isinstance(record, dict):
+            message, session_id = record.get(field), record.get(session_field)
+        else:
+            message, session_id = record, None
+        if isinstance(message, str):
+            yield line_number, session_id, message
+
+
+def _sample_messages(count, seed=0):
+    # Intent hits, knowledge answers and long fallback messages in a fixed mix
+    rng = random.Random(seed)
+    pool = WARMUP_MESSAGES + [WARMUP_LONG_MESSAGE, 'what can I get for $450 a month', 'hi', 'sedans please']
+    return [(f'session-{rng.randrange(1000)}', rng.choice(pool)) for _ in range(count)]
+
+
+def scaling_benchmark(max_threads, messages=20000, seed=0):
+    """
+    Throughput of the same workload at 1, 2, 4, ... up to max_threads threads
+
+    :param max_threads: Largest thread count
+    :param messages: Requests per run
+    :param seed: Replay seed, shared by every run so their responses can be compared
+    :return: Dict with one entry per thread count and whether all runs gave identical responses
+    """
+    requests = _sample_messages(messages)
+    thread_counts = sorted({1, max_threads} | {1 << power for power in range(max_threads.bit_length())
+                                               if 1 << power <= max_threads})
+    warm_up()
+    runs = []
+    reference = None
+    identical = True
+    for threads in thread_counts:
+        with ThreadedResponder(workers=threads, seed=seed, warmup=False) as responder:
+            start = time.perf_counter()
+            responses = list(responder.responses(requests))
+            elapsed = time.perf_counter() - start
+        if reference is None:
+            reference = responses
+        identical = identical and responses == reference
+        throughput = len(requests) / elapsed
+        runs.append({'threads': threads, 'throughput_rps': round(throughput),
+                     'speedup': round(throughput / runs[0]['throughput_rps'], 2) if runs else 1.0})
+    gil = getattr(sys, '_is_gil_enabled', lambda: True)()
+    return {'messages': len(requests), 'cpus': os.cpu_count(), 'gil_enabled': gil, 'runs': runs,
+            'identical_responses': identical}
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Answer messages from a thread pool with per-request generators")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    bench = commands.add_parser('bench', help="Measure throughput from 1 to N threads")
+    bench.add_argument('--threads', type=int, default=os.cpu_count() or 1)
+    bench.add_argument('--messages', type=int, default=20000)
+
+    replay = commands.add_parser(
+        'replay', help="Answer every message of a JSONL transcript; the same seed always gives the same output"
+    )
+    replay.add_argument('transcript', help="JSONL transcript file, '-' for stdin")
+    replay.add_argument('--seed', type=int, required=True)
+    replay.add_argument('--threads', type=int, default=None)
+    replay.add_argument('--field', default='message', help="Name of the message field in each record")
+    replay.add_argument('--session-field', default='session', help="Name of the session ID field in each record")
+    replay.add_argument('--output', help="Write responses as JSONL here instead of stdout")
+    args = parser.parse_args(argv)
+
+    if args.command == 'bench':
+        print(json.dumps(scaling_benchmark(args.threads, args.messages), indent=2))
+        return
+
+    transcript = sys.stdin if args.transcript == '-' else open(args.transcript, encoding='utf-8')
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        records, requests = itertools.tee(_read_requests(transcript, args.field, args.session_field))
+        with ThreadedResponder(workers=args.threads, seed=args.seed) as responder:
+            responses = responder.responses((session_id, message) for _, session_id, message in requests)
+            for (line_number, session_id, message), response in zip(records, responses):
+                output.write(json.dumps({'line': line_number, 'session': session_id,
+                                         'message': message, 'response': response}) + '\n')
+    finally:
+        if transcript is not sys.stdin:
+            transcript.close()
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main_cli()
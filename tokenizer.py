@@ -0,0 +1,183 @@
+import functools
+import re
+import threading
+
+# Runs of word characters
+WORD_PATTERN = re.compile(r'\w+')
+# Sentence delimiters
+SENTENCE_END_PATTERN = re.compile(r'[.!?]+')
+# One scan finds both words and sentence delimiters, in the order they occur
+TOKEN_PATTERN = re.compile(r'\w+|[.!?]+')
+# Characters preprocessing strips from user input
+_PUNCTUATION_PATTERN = re.compile(r'[^\w\s]')
+
+# Common words that don't contribute to the meaning of a message
+STOP_WORDS = frozenset({'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by'})
+
+# Distinct words a vocabulary holds before a fresh one replaces it
+DEFAULT_MAX_WORDS = 1 << 20
+
+# Raw chunks whose normalized form is memoized
+DEFAULT_CACHE_SIZE = 1 << 16
+
+# ID of a chunk that normalizes to nothing, e.g. a stop word or bare punctuation
+NO_WORD = -1
+
+
+class Tokenizer:
+    """
+    Normalization pipeline and vocabulary of interned words
+
+    Each distinct word is interned once, at its position in ``words``.
+    Normalizing a raw chunk of text (lowercasing, stripping punctuation,
+    dropping stop words) is memoized per chunk, so repeated words cost one
+    cache hit and hand back the same string object instead of allocating a
+    new one per message. Dicts and sets keyed on those shared words hash them
+    once, since a string caches its hash.
+
+    Work that tokenizes text other than user messages, like building a FAQ
+    index, uses a Tokenizer of its own so it doesn't fill this vocabulary
+    and its cache.
+    """
+
+    def __init__(self, max_words=DEFAULT_MAX_WORDS, cache_size=DEFAULT_CACHE_SIZE):
+        """
+        :param max_words: Vocabulary size at which active_tokenizer() starts a fresh Tokenizer
+        :param cache_size: Raw chunks whose normalized word is memoized (0 disables memoization)
+        """
+        self.max_words = max_words
+        self.words = []
+        self._ids = {}
+        self._lock = threading.Lock()
+        if cache_size:
+            self.message_word_id = functools.lru_cache(maxsize=cache_size)(self._message_word_id)
+        else:
+            self.message_word_id = self._message_word_id
+
+    def __len__(self):
+        return len(self.words)
+
+    @property
+    def full(self):
+        """Whether the vocabulary reached max_words"""
+        return len(self.words) >= self.max_words
+
+    def intern(self, word):
+        """
+        :param word: Normalized word
+        :return: Its position in words, assigned on first sight
+        """
+        number = self._ids.get(word)
+        if number is None:
+            with self._lock:
+                number = self._ids.get(word)
+                if number is None:
+                    number = len(self.words)
+                    self.words.append(word)
+                    self._ids[word] = number
+        return number
+
+    def _message_word_id(self, chunk):
+        word = _PUNCTUATION_PATTERN.sub('', chunk.lower())
+        if not word or word in STOP_WORDS:
+            return NO_WORD
+        return self.intern(word)
+
+    def preprocess(self, text):
+        """
+        Lowercase the text, strip punctuation, split on whitespace and drop stop words
+
+        Punctuation never separates words, so each whitespace-delimited chunk
+        normalizes on its own and the result equals running those steps over
+        the whole text.
+
+        :param text: Raw user input
+        :return: List of interned words
+        """
+        words = self.words
+        return [words[number] for number in map(self.message_word_id, text.split()) if number != NO_WORD]
+
+
+_ACTIVE = [Tokenizer()]
+
+
+def active_tokenizer():
+    """
+    Tokenizer to use for the next message
+
+    Once the vocabulary is full it is replaced by an empty one with a single
+    assignment, so memory stays bounded however many distinct words arrive;
+    a message tokenized by the old one keeps its words.
+
+    :return: Tokenizer
+    """
+    tokenizer = _ACTIVE[0]
+    if tokenizer.full:
+        tokenizer = _ACTIVE[0] = Tokenizer(tokenizer.max_words)
+    return tokenizer
+
+
+def install_tokenizer(tokenizer):
+    """
+    Replace the shared Tokenizer, e.g. with a different size limit
+
+    :param tokenizer: Tokenizer
+    :return: The previous Tokenizer
+    """
+    previous, _ACTIVE[0] = _ACTIVE[0], tokenizer
+    return previous
+
+
+def preprocess_input(text):
+    """
+    Preprocess user input for more flexible matching
+
+    :param text: Raw user input
+    :return: List of processed words
+    """
+    return active_tokenizer().preprocess(text)
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import random
+    import time
+    import tracemalloc
+
+    parser = argparse.ArgumentParser(description="Time preprocessing and measure its allocations per message")
+    parser.add_argument('--messages', type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    vocabulary = ['sedan', 'suv', 'truck', 'finance', 'loan', 'payment', 'price', 'deal', 'the', 'a', 'for',
+                  'what', 'options', 'do', 'you', 'have', 'new', 'used', 'how', 'much', 'is', 'it?', 'hi!', 'please,']
+    messages = [' '.join(rng.choice(vocabulary) for _ in range(rng.randint(3, 20))) for _ in range(args.messages)]
+
+    def legacy_preprocess(text):
+        # The previous pipeline: a fresh regex substitution, split and stop-word filter per message
+        text = re.sub(r'[^\w\s]', '', text.lower())
+        stop_words = {'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by'}
+        return [word for word in text.split() if word not in stop_words]
+
+    report = {'messages': len(messages)}
+    for name, function in (('legacy', legacy_preprocess), ('tokenizer', preprocess_input)):
+        assert all(function(message) == legacy_preprocess(message) for message in messages[:1000])
+        start = time.perf_counter()
+        for message in messages:
+            function(message)
+        report[f'us_per_message[{name}]'] = round((time.perf_counter() - start) / len(messages) * 1e6, 3)
+
+        # Peak bytes allocated while one message is processed, results kept alive as a caller would
+        tracemalloc.start()
+        peaks = []
+        for message in messages[:2000]:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            result = function(message)
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+            del result
+        tracemalloc.stop()
+        report[f'peak_bytes_per_message[{name}]'] = round(sum(peaks) / len(peaks))
+    report['vocabulary'] = len(active_tokenizer())
+    print(json.dumps(report, indent=2))
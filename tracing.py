@@ -0,0 +1,271 @@
+import collections
+import contextvars
+import itertools
+import json
+import threading
+import time
+
+from latency_stats import LatencyRecorder
+
+# Stages recorded by the get_response pipeline, in pipeline order
+STAGES = (
+    'request',
+    'first_chunk',
+    'preprocess',
+    'intent_scoring',
+    'render',
+    'fallback',
+    'auto_response',
+    'faq_retrieval',
+    'complexity',
+    'communication_coach'
+)
+
+
+class _NullSpan:
+    """Shared no-op span handed out while tracing is disabled"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+_request_id = contextvars.ContextVar('request_id', default=None)
+
+
+class _Span:
+    __slots__ = ('tracer', 'stage', 'start')
+
+    def __init__(self, tracer, stage):
+        self.tracer = tracer
+        self.stage = stage
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.tracer.record(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class _RequestSpan(_Span):
+    __slots__ = ('token',)
+
+    def __enter__(self):
+        # A context variable keeps request IDs apart across threads and asyncio tasks alike
+        self.token = _request_id.set(next(self.tracer._request_ids))
+        self.tracer.count('requests')
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super().__exit__(exc_type, exc_value, traceback)
+        _request_id.reset(self.token)
+        return False
+
+
+class MemorySink:
+    """Keeps the most recent span records in memory"""
+
+    def __init__(self, max_records=100000):
+        self.records = collections.deque(maxlen=max_records)
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def flush(self, tracer):
+        pass
+
+
+class JsonLinesSink:
+    """Appends every span record to a JSON lines file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        line = json.dumps(record) + '\n'
+        with self._lock:
+            self._file.write(line)
+
+    def flush(self, tracer):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class PrometheusTextSink:
+    """Writes aggregated stage latencies and counters in the Prometheus text format on flush"""
+
+    QUANTILES = (('0.5', 0.50), ('0.95', 0.95), ('0.99', 0.99))
+
+    def __init__(self, path, prefix='chatbot'):
+        self.path = path
+        self.prefix = prefix
+
+    def emit(self, record):
+        pass
+
+    def render(self, tracer):
+        """
+        :param tracer: Tracer to export
+        :return: Exposition text
+        """
+        metric = f'{self.prefix}_stage_latency_seconds'
+        lines = [
+            f'# HELP {metric} Latency of each get_response pipeline stage.',
+            f'# TYPE {metric} summary'
+        ]
+        for stage, recorder in sorted(tracer.stage_recorders().items()):
+            for label, fraction in self.QUANTILES:
+                lines.append(f'{metric}{{stage="{stage}",quantile="{label}"}} {recorder.percentile(fraction):.9f}')
+            lines.append(f'{metric}_sum{{stage="{stage}"}} {recorder.total:.9f}')
+            lines.append(f'{metric}_count{{stage="{stage}"}} {recorder.count}')
+
+        for name, value in sorted(tracer.counters().items()):
+            counter = f'{self.prefix}_{name}_total'
+            lines.append(f'# TYPE {counter} counter')
+            lines.append(f'{counter} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def flush(self, tracer):
+        with open(self.path, 'w', encoding='utf-8') as export_file:
+            export_file.write(self.render(tracer))
+
+
+class Tracer:
+    """
+    Opt-in per-stage latency tracing for the response pipeline
+
+    While disabled, span() returns a shared no-op object and count() returns
+    immediately, so the instrumentation can stay in place in production.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.sinks = []
+        self._max_samples = 100000
+        self._stages = {}
+        self._counters = collections.Counter()
+        self._lock = threading.Lock()
+        self._request_ids = itertools.count(1)
+
+    def enable(self, *sinks, max_samples=100000):
+        """
+        Start recording spans
+
+        :param sinks: Sinks receiving span records, e.g. MemorySink or JsonLinesSink
+        :param max_samples: Recent samples kept per stage for percentiles
+        """
+        with self._lock:
+            self.sinks = list(sinks)
+            self._max_samples = max_samples
+            self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        """Drop aggregated latencies and counters"""
+        with self._lock:
+            self._stages = {}
+            self._counters = collections.Counter()
+
+    def span(self, stage):
+        """
+        Time a pipeline stage
+
+        :param stage: Stage name, see STAGES
+        :return: Context manager
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, stage)
+
+    def request(self):
+        """
+        Time a whole request and tag the spans inside it with a request ID
+
+        :return: Context manager
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return _RequestSpan(self, 'request')
+
+    def count(self, name, amount=1):
+        """
+        Increment a counter, e.g. 'fallback'
+
+        :param name: Counter name
+        :param amount: Increment
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] += amount
+
+    def record(self, stage, seconds):
+        """
+        Record a finished span
+
+        :param stage: Stage name
+        :param seconds: Duration in seconds
+        """
+        with self._lock:
+            recorder = self._stages.get(stage)
+            if recorder is None:
+                recorder = self._stages[stage] = LatencyRecorder(self._max_samples)
+            sinks = self.sinks
+        recorder.record(seconds)
+
+        if sinks:
+            record = {
+                'stage': stage,
+                'request_id': _request_id.get(),
+                'duration_ms': seconds * 1000,
+                'timestamp': time.time()
+            }
+            for sink in sinks:
+                sink.emit(record)
+
+    def stage_recorders(self):
+        with self._lock:
+            return dict(self._stages)
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def summary(self):
+        """
+        Aggregated latency per stage plus counters and the fallback rate
+
+        :return: Dict with 'stages', 'counters' and 'fallback_rate'
+        """
+        counters = self.counters()
+        requests = counters.get('requests', 0)
+        return {
+            'stages': {stage: recorder.summary() for stage, recorder in self.stage_recorders().items()},
+            'counters': counters,
+            'fallback_rate': counters.get('fallback', 0) / requests if requests else 0.0
+        }
+
+    def flush(self):
+        """Let every sink write out what it has buffered"""
+        for sink in list(self.sinks):
+            sink.flush(self)
+
+
+# Process-wide tracer used by the pipeline
+TRACER = Tracer()
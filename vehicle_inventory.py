@@ -0,0 +1,418 @@
+import array
+import bisect
+import collections
+import csv
+import heapq
+import json
+import math
+import os
+import threading
+
+from backends import numpy
+
+Vehicle = collections.namedtuple('Vehicle', ['vin', 'make', 'model', 'vehicle_type', 'year', 'price', 'mileage', 'mpg'])
+
+# Typed column storage; categorical columns hold codes into a per-column value table
+CATEGORICAL_COLUMNS = ('make', 'model', 'vehicle_type')
+NUMERIC_COLUMNS = {'year': 'H', 'price': 'l', 'mileage': 'l', 'mpg': 'd'}
+_CONVERTERS = {'year': int, 'price': lambda value: int(float(value)), 'mileage': lambda value: int(float(value)),
+               'mpg': float}
+
+# Categorical columns that get one bitmap per value
+BITMAP_COLUMNS = ('make', 'vehicle_type')
+
+# Sorted positions per range bitmap on the numeric columns
+DEFAULT_BIN_COUNT = 64
+
+# Bitmaps are turned into row numbers one machine word at a time
+_WORD_BITS = 64
+
+
+def _bitmap_from_rows(rows, row_count):
+    bits = bytearray((row_count + 7) // 8)
+    for row in rows:
+        bits[row >> 3] |= 1 << (row & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def _bitmap_rows(bitmap, row_count):
+    """Row numbers of the set bits, in increasing order"""
+    if not bitmap:
+        return []
+    word_count = (row_count + _WORD_BITS - 1) // _WORD_BITS
+    data = bitmap.to_bytes(word_count * 8, 'little')
+    if numpy is not None:
+        return numpy.flatnonzero(numpy.unpackbits(numpy.frombuffer(data, dtype=numpy.uint8),
+                                                  bitorder='little')).tolist()
+
+    rows = []
+    for index, word in enumerate(memoryview(data).cast('Q')):
+        base = index * _WORD_BITS
+        while word:
+            low = word & -word
+            rows.append(base + low.bit_length() - 1)
+            word ^= low
+    return rows
+
+
+class _RangeIndex:
+    """Sorted row order of one numeric column plus bitmaps over runs of that order"""
+
+    def __init__(self, column, bin_count):
+        row_count = len(column)
+        self.order = array.array('l', sorted(range(row_count), key=column.__getitem__))
+        self.values = array.array(column.typecode, (column[row] for row in self.order))
+
+        # Bin k covers sorted positions [bounds[k], bounds[k + 1])
+        bin_count = max(1, min(bin_count, row_count))
+        self.bounds = [row_count * number // bin_count for number in range(bin_count + 1)]
+        self.bins = [_bitmap_from_rows(self.order[start:end], row_count)
+                     for start, end in zip(self.bounds, self.bounds[1:])]
+
+    def positions(self, low, high):
+        """Sorted positions [start, end) of the values within [low, high]; None means unbounded"""
+        start = bisect.bisect_left(self.values, low) if low is not None else 0
+        end = bisect.bisect_right(self.values, high) if high is not None else len(self.values)
+        return start, max(start, end)
+
+    def bitmap(self, start, end):
+        """
+        Bitmap of the bins overlapping positions [start, end)
+
+        :return: (bitmap, whether it holds exactly those positions)
+        """
+        if start >= end:
+            return 0, True
+        first = bisect.bisect_right(self.bounds, start) - 1
+        last = bisect.bisect_left(self.bounds, end)
+        bitmap = 0
+        for number in range(first, last):
+            bitmap |= self.bins[number]
+        return bitmap, self.bounds[first] == start and self.bounds[last] == end
+
+
+class VehicleInventory:
+    """
+    Column-wise vehicle inventory with bitmap and sorted indexes
+
+    Every attribute is stored in its own typed array (strings as codes into a
+    value table), so 100k vehicles take a few megabytes. Make and vehicle type
+    have one bitmap per value; numeric attributes have a sorted row order and
+    bitmaps over bins of that order. A query ANDs the bitmaps of its
+    predicates into a candidate set and ranks it, or, when the predicates
+    match many vehicles, walks the sorted order of the ranking attribute and
+    stops after ``limit`` matches. Indexes are built once on the first query
+    after vehicles were added; queries may then run from many threads, as
+    long as no vehicles are added meanwhile.
+    """
+
+    def __init__(self, bin_count=DEFAULT_BIN_COUNT):
+        """
+        :param bin_count: Bins per numeric attribute in the range bitmaps
+        """
+        self.bin_count = bin_count
+        self.vins = []
+        self.codes = {name: array.array('L') for name in CATEGORICAL_COLUMNS}
+        self.tables = {name: [] for name in CATEGORICAL_COLUMNS}
+        self._table_ids = {name: {} for name in CATEGORICAL_COLUMNS}
+        self.columns = {name: array.array(typecode) for name, typecode in NUMERIC_COLUMNS.items()}
+        self._bitmaps = None
+        self._ranges = None
+        self._index_lock = threading.Lock()
+
+    @classmethod
+    def from_records(cls, records, **kwargs):
+        """
+        :param records: Iterable of dicts or Vehicles with the Vehicle fields
+        :return: VehicleInventory
+        """
+        inventory = cls(**kwargs)
+        inventory.extend(records)
+        return inventory
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """
+        Bulk-load a CSV file with a header row, or a JSON lines file
+
+        :param path: .csv, .jsonl or .json file
+        :return: VehicleInventory
+        """
+        with open(path, newline='', encoding='utf-8') as source:
+            if os.path.splitext(path)[1].lower() == '.csv':
+                return cls.from_records(csv.DictReader(source), **kwargs)
+            return cls.from_records((json.loads(line) for line in source if line.strip()), **kwargs)
+
+    def _code(self, name, value):
+        ids = self._table_ids[name]
+        code = ids.get(value)
+        if code is None:
+            code = ids[value] = len(self.tables[name])
+            self.tables[name].append(value)
+        return code
+
+    def add(self, vin, make, model, vehicle_type, year, price, mileage, mpg):
+        """Add one vehicle; indexes are rebuilt on the next query"""
+        self.extend([Vehicle(vin, make, model, vehicle_type, year, price, mileage, mpg)])
+
+    def extend(self, records):
+        """
+        Append vehicles in bulk
+
+        :param records: Iterable of dicts or Vehicles with the Vehicle fields
+        """
+        for number, record in enumerate(records, 1):
+            if isinstance(record, Vehicle):
+                record = record._asdict()
+            try:
+                vin = str(record['vin'])
+                codes = [self._code(name, str(record[name]).strip().lower()) for name in CATEGORICAL_COLUMNS]
+                values = [_CONVERTERS[name](record[name]) for name in NUMERIC_COLUMNS]
+            except (KeyError, TypeError, ValueError) as error:
+                raise ValueError(f"Invalid vehicle record {number}: {error!r}") from error
+
+            self.vins.append(vin)
+            for name, code in zip(CATEGORICAL_COLUMNS, codes):
+                self.codes[name].append(code)
+            for name, value in zip(NUMERIC_COLUMNS, values):
+                self.columns[name].append(value)
+        self._bitmaps = self._ranges = None
+
+    def __len__(self):
+        return len(self.vins)
+
+    def vehicle(self, row):
+        """
+        :param row: Row number
+        :return: Vehicle
+        """
+        return Vehicle(self.vins[row],
+                       *(self.tables[name][self.codes[name][row]] for name in CATEGORICAL_COLUMNS),
+                       *(self.columns[name][row] for name in NUMERIC_COLUMNS))
+
+    def sorted_rows(self, name):
+        """
+        :param name: Numeric attribute, one of NUMERIC_COLUMNS
+        :return: Row numbers ordered by ascending value of the attribute
+        """
+        if self._ranges is None:
+            self._build_indexes()
+        return self._ranges[name].order
+
+    def _build_indexes(self):
+        with self._index_lock:
+            # Another thread may have built them while this one waited
+            if self._bitmaps is None:
+                self._build_indexes_locked()
+
+    def _build_indexes_locked(self):
+        row_count = len(self)
+        bitmaps = {}
+        for name in BITMAP_COLUMNS:
+            rows_by_code = collections.defaultdict(list)
+            for row, code in enumerate(self.codes[name]):
+                rows_by_code[code].append(row)
+            bitmaps[name] = {code: _bitmap_from_rows(rows, row_count) for code, rows in rows_by_code.items()}
+        self._ranges = {name: _RangeIndex(column, self.bin_count) for name, column in self.columns.items()}
+        self._bitmaps = bitmaps
+
+    def _plan(self, vehicle_types, makes, ranges):
+        # Returns the candidate bitmap, the row checks of every predicate, the range checks the bitmap
+        # only approximates and the sorted positions of each range
+        if self._bitmaps is None:
+            self._build_indexes()
+
+        candidates = (1 << len(self)) - 1
+        categorical = []
+        numeric = []
+        inexact = []
+        for name, values in (('vehicle_type', vehicle_types), ('make', makes)):
+            if values is None:
+                continue
+            ids = self._table_ids[name]
+            allowed = {ids[value.lower()] for value in values if value.lower() in ids}
+            bitmap = 0
+            for code in allowed:
+                bitmap |= self._bitmaps[name][code]
+            candidates &= bitmap
+            categorical.append((self.codes[name], allowed))
+
+        positions = {}
+        for name, (low, high) in ranges.items():
+            index = self._ranges[name]
+            start, end = positions[name] = index.positions(low, high)
+            bitmap, aligned = index.bitmap(start, end)
+            candidates &= bitmap
+            check = (self.columns[name], -math.inf if low is None else low, math.inf if high is None else high)
+            numeric.append(check)
+            if not aligned:
+                inexact.append(check)
+        return candidates, (categorical, numeric), ([], inexact), positions
+
+    @staticmethod
+    def _matches(row, checks):
+        categorical, numeric = checks
+        for column, allowed in categorical:
+            if column[row] not in allowed:
+                return False
+        for column, low, high in numeric:
+            if not low <= column[row] <= high:
+                return False
+        return True
+
+    def query(self, vehicle_types=None, makes=None, min_price=None, max_price=None, min_year=None, max_year=None,
+              max_mileage=None, min_mpg=None, order_by='price', limit=10):
+        """
+        Top vehicles matching every given filter
+
+        :param vehicle_types: Iterable of accepted vehicle types, any if None
+        :param makes: Iterable of accepted makes, any if None
+        :param min_price: Lowest price
+        :param max_price: Highest price
+        :param min_year: Oldest model year
+        :param max_year: Newest model year
+        :param max_mileage: Highest mileage
+        :param min_mpg: Lowest fuel economy
+        :param order_by: Numeric attribute to rank by, prefixed with '-' for descending
+        :param limit: Number of vehicles to return
+        :return: List of Vehicles, best first
+        """
+        return [self.vehicle(row) for row in self.query_rows(
+            vehicle_types, makes, min_price, max_price, min_year, max_year, max_mileage, min_mpg, order_by, limit
+        )]
+
+    def query_rows(self, vehicle_types=None, makes=None, min_price=None, max_price=None, min_year=None,
+                   max_year=None, max_mileage=None, min_mpg=None, order_by='price', limit=10):
+        """Like query(), returning row numbers"""
+        descending = order_by.startswith('-')
+        order_name = order_by.lstrip('-')
+        if order_name not in NUMERIC_COLUMNS:
+            raise ValueError(f"Can't order by '{order_by}', expected one of {tuple(NUMERIC_COLUMNS)}")
+        if limit <= 0 or not len(self):
+            return []
+
+        ranges = {name: bounds for name, bounds in (
+            ('price', (min_price, max_price)), ('year', (min_year, max_year)),
+            ('mileage', (None, max_mileage)), ('mpg', (min_mpg, None))
+        ) if bounds != (None, None)}
+        candidates, checks, inexact, positions = self._plan(vehicle_types, makes, ranges)
+        candidate_count = candidates.bit_count()
+        if not candidate_count:
+            return []
+
+        # Walking the ranking order visits about limit * rows / matches rows before it is done. Matches
+        # bunched at the far end of the order (new trucks are rarely cheap) make it longer, so the walk
+        # gives up after as many rows as ranking the candidates would take.
+        if limit * len(self) / candidate_count < candidate_count:
+            index = self._ranges[order_name]
+            start, end = positions.get(order_name, (0, len(self)))
+            walk = range(end - 1, start - 1, -1) if descending else range(start, end)
+            found = []
+            for position in walk[:candidate_count]:
+                row = index.order[position]
+                if self._matches(row, checks):
+                    found.append(row)
+                    if len(found) == limit:
+                        return found
+            if len(walk) <= candidate_count:
+                return found
+
+        rows = _bitmap_rows(candidates, len(self))
+        if inexact[1]:
+            rows = [row for row in rows if self._matches(row, inexact)]
+        column = self.columns[order_name]
+        if descending:
+            # Ties keep the order of the sorted index walk: higher row numbers first
+            return heapq.nlargest(limit, reversed(rows), key=column.__getitem__)
+        return heapq.nsmallest(limit, rows, key=column.__getitem__)
+
+    def count(self, **filters):
+        """
+        :param filters: Same filters as query()
+        :return: Number of matching vehicles
+        """
+        return len(self.query_rows(limit=len(self) or 1, **filters))
+
+    def memory_bytes(self):
+        """
+        :return: Approximate bytes held by columns and indexes, excluding VIN strings
+        """
+        total = sum(column.itemsize * len(column) for column in self.codes.values())
+        total += sum(column.itemsize * len(column) for column in self.columns.values())
+        if self._ranges is not None:
+            for index in self._ranges.values():
+                total += index.order.itemsize * len(index.order) + index.values.itemsize * len(index.values)
+                total += sum(bitmap.bit_length() // 8 for bitmap in index.bins)
+            for bitmaps in self._bitmaps.values():
+                total += sum(bitmap.bit_length() // 8 for bitmap in bitmaps.values())
+        return total
+
+
+def synthetic_inventory(count, seed=0):
+    """
+    Deterministic random inventory for benchmarks and demos
+
+    :param count: Number of vehicles
+    :param seed: Random seed
+    :return: VehicleInventory
+    """
+    import random
+
+    rng = random.Random(seed)
+    models = {
+        'sedan': [('toyota', 'camry'), ('honda', 'accord'), ('hyundai', 'sonata'), ('bmw', '3 series')],
+        'suv': [('toyota', 'rav4'), ('honda', 'cr-v'), ('ford', 'explorer'), ('subaru', 'outback')],
+        'truck': [('ford', 'f-150'), ('chevrolet', 'silverado'), ('ram', '1500'), ('toyota', 'tacoma')],
+        'electric': [('tesla', 'model 3'), ('nissan', 'leaf'), ('chevrolet', 'bolt'), ('ford', 'mach-e')],
+        'hybrid': [('toyota', 'prius'), ('honda', 'insight'), ('hyundai', 'ioniq'), ('ford', 'maverick')]
+    }
+    types = list(models)
+    records = []
+    for number in range(count):
+        vehicle_type = types[number % len(types)]
+        make, model = rng.choice(models[vehicle_type])
+        year = rng.randint(2008, 2025)
+        age = 2025 - year
+        records.append(Vehicle(
+            vin=f'VIN{number:014d}', make=make, model=model, vehicle_type=vehicle_type, year=year,
+            price=max(3000, int(rng.gauss(45000 - age * 2500, 8000))),
+            mileage=max(0, int(age * rng.uniform(6000, 16000))),
+            mpg=round(rng.uniform(15, 35) if vehicle_type not in ('electric', 'hybrid') else rng.uniform(45, 120), 1)
+        ))
+    return VehicleInventory.from_records(records)
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    import time
+
+    parser = argparse.ArgumentParser(description="Measure inventory build and query latency")
+    parser.add_argument('--vehicles', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    inventory = synthetic_inventory(args.vehicles)
+    loaded = time.perf_counter()
+    inventory.query(limit=1)
+    indexed = time.perf_counter()
+    vin_bytes = sum(sys.getsizeof(vin) for vin in inventory.vins)
+    print(f"{len(inventory):,} vehicles: load {loaded - start:.2f} s, index {indexed - loaded:.2f} s, "
+          f"{inventory.memory_bytes() / len(inventory):.0f} bytes/vehicle in columns and indexes "
+          f"(+{vin_bytes / len(inventory):.0f} for VINs)")
+
+    queries = {
+        'cheapest sedans': dict(vehicle_types=['sedan']),
+        'family under $30k, newest first': dict(vehicle_types=['sedan', 'suv'], max_price=30000, order_by='-year'),
+        'trucks 2020+ under 40k miles': dict(vehicle_types=['truck'], min_year=2020, max_mileage=40000),
+        'hondas $20-25k, best mpg': dict(makes=['honda'], min_price=20000, max_price=25000, order_by='-mpg'),
+        'rare: 2025 toyota under $25k': dict(makes=['toyota'], min_year=2025, max_price=25000),
+    }
+    for name, filters in queries.items():
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            found = inventory.query(limit=10, **filters)
+            timings.append(time.perf_counter() - start)
+        print(f"{name:>34}: {min(timings) * 1000:7.3f} ms, {len(found)} results")